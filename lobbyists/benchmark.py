@@ -32,8 +32,8 @@ def _timed_func(func):
     return timer
 
 
-def _parse_all(doc):
-    return list(lobbyists.parse_filings(doc))
+def _parse_all(doc, backend, records):
+    return list(lobbyists.parse_filings(doc, backend, records))
 
 
 def _skip_import_list(record, con):
@@ -44,11 +44,18 @@ def _skip_import(record, con):
     return None
 
 
-def time_parse(doc):
+def time_parse(doc, backend='pulldom', records=False):
     """Parse all filing records in a lobbyist database and time it.
 
-    doc - The database to parse. Can be a filename, a URL or anything
-    else that xml.dom.pulldom.parse takes as an argument.
+    doc - The database to parse. Can be a filename, a URL (http, https
+    or ftp), a file-like object or a ZipMember, which may be
+    compressed. See lobbyists.parse_filings.
+
+    backend - The name of the parser backend to use. See
+    lobbyists.parse_filings.
+
+    records - If True, parse filings into compact records rather than
+    dictionaries. See lobbyists.parse_filings.
 
     Returns a tuple. The first item is the time (in seconds) taken to
     parse the entire document, and the second is the list of all
@@ -56,7 +63,34 @@ def time_parse(doc):
 
     """
     timed_parser = _timed_func(_parse_all)
-    return timed_parser(doc)
+    return timed_parser(doc, backend, records)
+
+
+def compare_backends(doc, backends=('pulldom', 'expat', 'etree')):
+    """Parse a lobbyist database with several backends and time each.
+
+    doc - The database to parse. Must be a filename (or anything else
+    that can be parsed more than once), since each backend parses the
+    whole document.
+
+    backends - A sequence of parser backend names. See
+    lobbyists.parse_filings.
+
+    Returns a list of (backend, time) pairs, one per backend, in the
+    order given. Raises AssertionError if any backend's parsed filings
+    differ from those of the first backend.
+
+    """
+    results = list()
+    expected = None
+    for backend in backends:
+        filings, parse_time = time_parse(doc, backend)
+        if expected is None:
+            expected = filings
+        assert filings == expected, \
+            'backend %s disagrees with %s' % (backend, backends[0])
+        results.append((backend, parse_time))
+    return results
 
 
 _skippers = {'registrant': _skip_import,
@@ -110,7 +144,8 @@ Parse a Senate LD-1/LD-2 document, then import it into an sqlite3
 database. Print the wall-clock time it takes to perform each action.
 
 The document may be identified either by a URL or a file, so long as
-it's a valid Senate LD-1/LD-2 XML document.
+it's a valid Senate LD-1/LD-2 XML document. It may be compressed with
+gzip (doc.xml.gz), or be one of the Senate's ZIP archives (doc.zip).
 
 If db doesn't exist, %prog will create it prior to importing the
 document."""
@@ -124,6 +159,22 @@ document."""
                       dest='commit',
                       help='commit the database after importing the ' \
                           'document (default is not to commit)')
+    parser.add_option('-b', '--backend', action='store',
+                      dest='backend', default='pulldom',
+                      help='parser backend to use, e.g., "expat" ' \
+                          '(default is "pulldom")')
+    parser.add_option('-B', '--compare-backends', action='store_true',
+                      dest='compare',
+                      help='parse the document with each parser backend ' \
+                          'and print the time taken by each')
+    parser.add_option('-r', '--records', action='store_true',
+                      dest='records',
+                      help='parse filings into compact records rather ' \
+                          'than dictionaries')
+    parser.add_option('-i', '--intern-stats', action='store_true',
+                      dest='intern_stats',
+                      help='print the parser\'s value interning statistics ' \
+                          'after parsing the document')
     parser.add_option('-s', '--skip-import', action='append',
                       dest='skip_import',
                       help='skip importing a particular entity, e.g., ' \
@@ -132,12 +183,30 @@ document."""
     if len(args) != 2:
         parser.error('specify one sqlite3 database and one XML document')
     dbname, doc = args
+    if options.compare:
+        for backend, parse_time in compare_backends(doc):
+            print 'Parse time (%s):' % backend, parse_time
     create_db = options.clobber or not os.path.exists(dbname)
     con = sqlite3.connect(dbname)
     if create_db:
         lobbyists.create_db(con)
-    filings, parse_time = time_parse(doc)
+    else:
+        lobbyists.upgrade_db(con)
+    filings, parse_time = time_parse(doc, options.backend, options.records)
     print 'Parse time:', parse_time
+    if options.intern_stats:
+        stats = lobbyists.interning_stats()
+        for field in sorted(stats):
+            pool = stats[field].pop('pool')
+            print 'Interning (%s, %s pool):' % (field, pool), \
+                ', '.join(['%s=%d' % item
+                           for item in sorted(stats[field].items())])
+    stats = lobbyists.decoding_stats()
+    for decoder in sorted(stats):
+        if stats[decoder]['anomalies']:
+            print 'Decoding anomalies (%s):' % decoder, \
+                ', '.join(['%r=%d' % item for item in
+                           sorted(stats[decoder]['values'].items())])
     _, import_time = time_import(con.cursor(), filings, options.skip_import)
     print 'Import time:', import_time
     if options.commit:
@@ -18,6 +18,31 @@
 """Parse and import U.S. Senate LD-1/LD-2 XML documents."""
 
 import xml.dom.pulldom
+import xml.parsers.expat
+import re
+import collections
+import itertools
+import cStringIO
+import os
+import gzip
+import binascii
+import codecs
+import hashlib
+import operator
+import zipfile
+import shutil
+import tempfile
+import urllib2
+import urlparse
+try:
+    import multiprocessing
+except ImportError:
+    # Python 2.5; parse_filings_parallel is unavailable.
+    multiprocessing = None
+try:
+    from xml.etree import cElementTree as etree
+except ImportError:
+    from xml.etree import ElementTree as etree
 
 
 VERSION = '0.12'
@@ -43,37 +68,414 @@ def _amount(x):
         return int(x)
 
 
-def _period(x):
-    if x is None or x == ' ':
-        return None
-    periods = {'1st Quarter (Jan 1 - Mar 31)': 'Q1',
-               '2nd Quarter (Apr 1 - June 30)': 'Q2',
-               '3rd Quarter (July 1 - Sep 30)': 'Q3',
-               '4th Quarter (Oct 1 - Dec 31)': 'Q4',
-               'Mid-Year (Jan 1 - Jun 30)': 'H1',
-               'Year-End (July 1 - Dec 31)': 'H2',
-               'UNDETERMINED': 'undetermined'}
-    return periods[x]
+# Enumeration decoders.
+#
+# Enumerated attributes (periods, statuses, etc.) are decoded through
+# module-level tables. Each decoder is a dictionary which memoizes the
+# decoded value of every raw attribute value it has seen, so decoding
+# is usually a single dictionary lookup; raw values which aren't in
+# the memo yet are decoded by __missing__. Raw values which can't be
+# decoded are anomalies: rather than raising an exception, they're
+# decoded as None and counted, and the counts are reported by
+# decoding_stats. Each field has its own decoder, so anomalies can be
+# traced to the field in which they occur.
+
+_period_table = {None: None,
+                 ' ': None,
+                 '1st Quarter (Jan 1 - Mar 31)': 'Q1',
+                 '2nd Quarter (Apr 1 - June 30)': 'Q2',
+                 '3rd Quarter (July 1 - Sep 30)': 'Q3',
+                 '4th Quarter (Oct 1 - Dec 31)': 'Q4',
+                 'Mid-Year (Jan 1 - Jun 30)': 'H1',
+                 'Year-End (July 1 - Dec 31)': 'H2',
+                 'UNDETERMINED': 'undetermined'}
+
+_is_gov_table = {None: 'unspecified', '0': 'n', '1': 'y'}
+
+_status_table = {0: 'active',
+                 1: 'terminated',
+                 2: 'administratively terminated',
+                 3: 'undetermined'}
+
+_lobbyist_indicator_table = {0: 'not covered',
+                             1: 'covered',
+                             2: 'undetermined'}
+
+# The maximum number of memoized raw values per decoder, and the
+# maximum number of distinct anomalous raw values counted separately
+# per decoder.
+
+_memo_size = 1000
+_anomaly_values_size = 100
+
+_decoders = dict()
+
+
+class _Decoder(dict):
+    """An attribute parser which decodes an enumerated value.
+
+    Calling the decoder (or indexing it) with a raw attribute value
+    returns the decoded value.
+
+    name - The name of the decoder, used by decoding_stats.
+
+    table - A dictionary which maps keys to decoded values.
+
+    key - A function which converts a raw attribute value to a key in
+    table, e.g. int. The default uses the raw value as the key. If it
+    raises TypeError or ValueError, the raw value is an anomaly.
+
+    """
+    def __init__(self, name, table, key=None):
+        dict.__init__(self)
+        self.name = name
+        self.table = table
+        self.key = key
+        _decoders[name] = self
+        self.clear()
+
+    def clear(self):
+        """Reset the memo and the anomaly counts."""
+        dict.clear(self)
+        if self.key is None:
+            self.update(self.table)
+        else:
+            self.update((str(k), v) for k, v in self.table.iteritems())
+        self.anomalies = 0
+        self.anomalous_values = dict()
+
+    def __missing__(self, raw):
+        try:
+            if self.key is None:
+                value = self.table[raw]
+            else:
+                value = self.table[self.key(raw)]
+        except (KeyError, TypeError, ValueError):
+            self.anomalies += 1
+            values = self.anomalous_values
+            if raw in values or len(values) < _anomaly_values_size:
+                values[raw] = values.get(raw, 0) + 1
+            return None
+        if len(self) < _memo_size:
+            self[raw] = value
+        return value
+
+    __call__ = dict.__getitem__
+
+    def stats(self):
+        return {'memoized': len(self),
+                'anomalies': self.anomalies,
+                'values': dict(self.anomalous_values)}
+
+
+_period = _Decoder('period', _period_table)
+_client_status = _Decoder('client_status', _status_table, int)
+_client_is_gov = _Decoder('client_state_or_local_gov', _is_gov_table)
+_lobbyist_status = _Decoder('lobbyist_status', _status_table, int)
+_lobbyist_indicator = _Decoder('lobbyist_indicator',
+                               _lobbyist_indicator_table, int)
+_foreign_entity_status = _Decoder('foreign_entity_status', _status_table,
+                                  int)
+
+
+def decoding_stats():
+    """Return statistics for the parser's enumeration decoders.
+
+    Values of enumerated attributes (a filing's period, a client's
+    status, etc.) which can't be decoded don't raise an exception;
+    they're parsed as None and counted as anomalies.
+
+    Returns a dictionary whose keys are the names of the decoders
+    ('period', 'client_status', 'client_state_or_local_gov',
+    'lobbyist_status', 'lobbyist_indicator' and
+    'foreign_entity_status'). Each value is a dictionary with the
+    following keys: 'memoized', the number of distinct raw values
+    whose decoded value is memoized; 'anomalies', the number of raw
+    values which couldn't be decoded; and 'values', a dictionary
+    which maps anomalous raw values to the number of times each
+    occurred (None means the attribute was missing). At most 100
+    distinct anomalous values are recorded per decoder.
+
+    """
+    return dict((name, decoder.stats())
+                for name, decoder in _decoders.iteritems())
+
+
+def clear_decoding():
+    """Reset the statistics reported by decoding_stats.
+
+    Returns nothing.
+
+    """
+    for decoder in _decoders.itervalues():
+        decoder.clear()
+
+
+# Value interning.
+#
+# Some attribute values (countries, states, government entities, issue
+# codes and filing types) are repeated across hundreds of thousands
+# of filings. Parsing them through an intern pool means that every
+# occurrence of a value shares a single string object, which saves a
+# great deal of memory when many filings are kept around, and makes
+# comparing and hashing those values cheaper. The decoded enumeration
+# values (statuses, periods, etc.) are constants, so they're already
+# shared and don't need to be interned.
+#
+# Pools are shared by all parsers and persist between calls to
+# parse_filings. Each pool holds at most _intern_pool_size values;
+# once it's full, new values are returned as-is, so a field with
+# unexpectedly high cardinality can't use unbounded memory. Fields
+# whose values are drawn from the same set (e.g., the various country
+# attributes) share a pool, but statistics are kept for each field,
+# so that a field which isn't worth interning can be spotted even when
+# its pool is shared.
+
+_intern_pool_size = 10000
+
+_intern_pools = dict()
+
+_interned_fields = list()
+
+
+class _Interned(object):
+    """An attribute parser whose results are interned, with statistics.
+
+    field - The name of the parsed field (a string of the form
+    'element.key', e.g., 'client.country'), used to report its
+    statistics.
+
+    pool - The name of the intern pool (a string).
+
+    parse - The attribute parser whose results are interned.
+
+    """
+    def __init__(self, field, pool, parse):
+        self.field = field
+        self.pool_name = pool
+        self.pool = _intern_pools.setdefault(pool, dict())
+        self.parse = parse
+        self.reset()
+        _interned_fields.append(self)
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.overflows = 0
+
+    def __call__(self, x):
+        return self.intern(self.parse(x))
+
+    def intern(self, value):
+        """Return the pooled copy of value, adding it if necessary.
+
+        None is returned as-is, and isn't counted.
+
+        """
+        if value is None:
+            return None
+        try:
+            result = self.pool[value]
+        except KeyError:
+            if len(self.pool) >= _intern_pool_size:
+                self.overflows += 1
+            else:
+                self.pool[value] = value
+                self.misses += 1
+            return value
+        self.hits += 1
+        return result
+
+    def stats(self):
+        return {'pool': self.pool_name,
+                'size': len(self.pool),
+                'hits': self.hits,
+                'misses': self.misses,
+                'overflows': self.overflows}
+
+
+def interning_stats():
+    """Return statistics for each of the parser's interned fields.
+
+    Returns a dictionary whose keys are the names of the interned
+    fields, in the form 'element.key' (e.g., 'client.country',
+    'issue.code' or 'filing.type'). Each value is a dictionary with
+    the following keys: 'pool', the name of the intern pool shared by
+    the field ('country', 'state', 'govt_entity', 'issue_code' or
+    'filing_type'); 'size', the number of distinct values in that
+    pool; 'hits', the number of values parsed for the field which
+    were already in the pool; 'misses', the number of values parsed
+    for the field which were added to the pool; and 'overflows', the
+    number of values parsed for the field which weren't interned
+    because the pool was full. Empty (None) values aren't counted.
+
+    """
+    return dict((field.field, field.stats()) for field in _interned_fields)
+
+
+def clear_interning():
+    """Empty the parser's value intern pools and reset their statistics.
+
+    Returns nothing.
+
+    """
+    for pool in _intern_pools.itervalues():
+        pool.clear()
+    for field in _interned_fields:
+        field.reset()
+
+
+# Document input.
+
+# The number of bytes read from the document at a time by the
+# event-driven backends.
+
+_bufsize = 2 ** 16
+
+# Documents whose names start with one of these are opened with
+# urllib2.
+
+_url_schemes = ('http://', 'https://', 'ftp://')
+
+
+class ZipMember(object):
+    """A lobbyist database stored in a ZIP archive.
+
+    The Senate distributes its documents as ZIP archives. Each member
+    of an archive is a separate document, which can be passed to
+    parse_filings without extracting it first; it's decompressed as
+    it's parsed.
+
+    path - The archive's filename.
+
+    name - The member's name in the archive.
+
+    An archive which was downloaded rather than read from a file (see
+    split_documents) is kept in a temporary file, and its path is
+    that file object.
+
+    """
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
 
+    def open(self):
+        """Open the member for reading, returning a file-like object."""
+        archive = zipfile.ZipFile(self.path)
+        try:
+            if not hasattr(archive, 'open'):
+                # Python 2.5 can't read a member incrementally, so the
+                # whole member is read into memory.
+                return cStringIO.StringIO(archive.read(self.name))
+            # The member has its own handle on the archive file.
+            return archive.open(self.name)
+        finally:
+            archive.close()
+
+    def __eq__(self, other):
+        return isinstance(other, ZipMember) and \
+            (self.path, self.name) == (other.path, other.name)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'ZipMember(%r, %r)' % (self.path, self.name)
+
+    def __str__(self):
+        return '%s:%s' % (self.path, self.name)
+
+
+def _is_url(doc):
+    return isinstance(doc, basestring) and \
+        doc.lower().startswith(_url_schemes)
+
+
+def _doc_name(doc):
+    # The name of a document's file, without a URL's query string,
+    # for recognizing its extension.
+    if _is_url(doc):
+        return urlparse.urlsplit(doc)[2].lower()
+    return doc.lower()
+
+
+def _is_zip(doc):
+    return isinstance(doc, basestring) and _doc_name(doc).endswith('.zip')
+
+
+def _spool(stream):
+    """Copy a stream into an anonymous temporary file.
+
+    The stream is closed. Returns the temporary file, positioned at
+    its start, for readers which need to seek (gzip and zipfile).
+
+    """
+    try:
+        spool = tempfile.TemporaryFile()
+        shutil.copyfileobj(stream, spool, _bufsize)
+    finally:
+        stream.close()
+    spool.seek(0)
+    return spool
+
+
+def split_documents(doc):
+    """The separate lobbyist databases contained in a document.
+
+    doc - A document, as accepted by parse_filings.
+
+    Returns a list with one ZipMember per file in the archive, in
+    archive order, if doc is the filename or URL of a ZIP archive
+    (ending in '.zip'). Otherwise, returns [doc]. An archive given by
+    URL is downloaded to a temporary file first.
+
+    """
+    if not _is_zip(doc):
+        return [doc]
+    path = doc
+    if _is_url(doc):
+        path = _spool(urllib2.urlopen(doc))
+    archive = zipfile.ZipFile(path)
+    try:
+        return [ZipMember(path, info.filename) for info in archive.infolist()
+                if not info.filename.endswith('/')]
+    finally:
+        archive.close()
 
-def _is_gov(x):
-    values = {None: 'unspecified', '0': 'n', '1': 'y'}
-    return values[x]
 
+def _open_doc(doc):
+    """Open a lobbyist database for reading.
 
-def _status(x):
-    status = {0: 'active',
-              1: 'terminated',
-              2: 'administratively terminated',
-              3: 'undetermined'}
-    return status[int(x)]
+    doc - The XML document. If it's a string, it's treated as a
+    filename and opened, or as a URL and opened with urllib2 if it
+    starts with 'http://', 'https://' or 'ftp://', decompressing it on
+    the fly if the name ends in '.gz'. If it's a ZipMember, the member
+    is opened. Otherwise, it's assumed to be a file-like object and is
+    returned as-is.
 
+    Returns a pair whose first item is the file-like object and whose
+    second item is True if the object was opened by this function
+    (and should therefore be closed by the caller).
 
-def _lobbyist_indicator(x):
-    indicator = {0: 'not covered',
-                 1: 'covered',
-                 2: 'undetermined'}
-    return indicator[int(x)]
+    """
+    if isinstance(doc, basestring):
+        gzipped = _doc_name(doc).endswith('.gz')
+        if _is_url(doc):
+            stream = urllib2.urlopen(doc)
+            if gzipped:
+                # GzipFile seeks in its file. It doesn't close a file
+                # it's given, unless it's also its myfileobj.
+                spool = _spool(stream)
+                stream = gzip.GzipFile(fileobj=spool, mode='rb')
+                stream.myfileobj = spool
+            return (stream, True)
+        if gzipped:
+            return (gzip.GzipFile(doc, 'rb'), True)
+        return (open(doc, 'rb'), True)
+    elif isinstance(doc, ZipMember):
+        return (doc.open(), True)
+    else:
+        return (doc, False)
 
 
 # xml.dom.pulldom-specific code
@@ -81,17 +483,21 @@ def _lobbyist_indicator(x):
 def _filing_elements(doc):
     """The sequence of all Filing elements in a lobbyist database.
 
-    doc - The XML document. Can be a filename, a URL or anything else
-    that xml.dom.pulldom.parse takes as an argument.
+    doc - The XML document. See _open_doc.
 
     Yields a sequence of expanded DOM Filing elements.
 
     """
-    dom = xml.dom.pulldom.parse(doc)
-    for event, node in dom:
-        if event == 'START_ELEMENT' and node.nodeName == 'Filing':
-            dom.expandNode(node)
-            yield node
+    stream, opened = _open_doc(doc)
+    try:
+        dom = xml.dom.pulldom.parse(stream)
+        for event, node in dom:
+            if event == 'START_ELEMENT' and node.nodeName == 'Filing':
+                dom.expandNode(node)
+                yield node
+    finally:
+        if opened:
+            stream.close()
 
 
 def _child_elements(elt):
@@ -101,22 +507,15 @@ def _child_elements(elt):
             yield child
 
 
-def _attr_of(elt, attrname):
-    """Get the value of an attribute of an element.
-
-    Returns the value of an attribute of the specified DOM element, or
-    None if no such attribute exists in the element.
+def _attr_getter(elt):
+    """The attribute lookup function of the given DOM element.
 
-    elt - The DOM element.
-
-    attrname - The name of the attribute to retrieve.
+    The returned function takes an attribute name and returns the
+    attribute's value, or the empty string if no such attribute exists
+    in the element.
 
     """
-    val = elt.getAttribute(attrname)
-    if val == '':
-        return None
-    else:
-        return val
+    return elt.getAttribute
 
 
 def _element_name(elt):
@@ -126,30 +525,86 @@ def _element_name(elt):
 
 # Parsers for DOM elements and their child elements.
 
-def _parse_attrs(elt, attrs):
-    """Parse the attributes of a DOM element into a sequence of pairs.
-
-    elt - The DOM element.
+def _compile_attrs(attrs, name, wrap=None):
+    """Compile a table of attribute specifications into a function.
 
     attrs - A sequence of tuples of 3 items each. The first item is
     the attribute name (a string). The second is the identifier
-    associated with the parsed attribute value in the yielded
-    pair. The third is the parsing function. It's applied to the
-    attribute's DOM value, and its output is stored with the
-    identifier in the yielded pair.
+    associated with the parsed attribute value in the resulting
+    dictionary. The third is the parsing function. It's applied to the
+    attribute's value, and its output is stored with the identifier in
+    the resulting dictionary.
+
+    name - The name of the compiled function (a string).
+
+    wrap - Optional. See below.
+
+    The tables are the single source of truth for attribute parsing,
+    but interpreting them for every element is slow, so each one is
+    compiled once, at import time, into a function with one
+    expression per attribute. The compiled function takes a single
+    argument, an attribute lookup function (e.g., a DOM element's
+    getAttribute method, or an attribute dictionary's get method),
+    and returns the dictionary of parsed attributes.
 
     Note that the value of an attribute which doesn't appear in the
-    element is None.
+    element, or whose value is the empty string, is None by the time
+    it reaches the parsing function. The _identity and _optional
+    parsers are inlined, and so is interning (see _Interned).
 
-    Yields a sequence of (identifier, value) pairs.
+    If wrap is given, the compiled function instead returns a
+    dictionary with a single key, wrap, whose value is the dictionary
+    of parsed attributes. This is the shape of the items in parsed
+    lists, e.g., {'lobbyist': {...}}.
 
     """
-    for name, id, parse in attrs:
-        yield (id, parse(_attr_of(elt, name)))
-
+    namespace = dict()
+    items = ['%r: %s' % (id, expr)
+             for id, expr in _attr_exprs(attrs, namespace)]
+    result = '{%s}' % ', '.join(items)
+    if wrap is not None:
+        result = '{%r: %s}' % (wrap, result)
+    src = 'def %s(get):\n    return %s\n' % (name, result)
+    exec src in namespace
+    return namespace[name]
+
+
+def _attr_exprs(attrs, namespace):
+    """Compile a table of attribute specifications into expressions.
+
+    Returns a list of (identifier, expression) pairs, one per
+    attribute, where the expression is Python source code that
+    evaluates to the parsed attribute value. The parsing functions
+    referred to by the expressions are added to namespace. See
+    _compile_attrs.
 
-def _parse_element(elt, id, attrs):
-    return (id, dict(_parse_attrs(elt, attrs)))
+    """
+    exprs = list()
+    for i, (attrname, id, parse) in enumerate(attrs):
+        interned = isinstance(parse, _Interned)
+        if interned:
+            intern, parse = parse.intern, parse.parse
+        if parse is _identity:
+            expr = 'get(%r) or None' % attrname
+        elif parse is _optional:
+            expr = 'get(%r) or %r' % (attrname, _optional(None))
+        elif isinstance(parse, _Decoder):
+            # Index the decoder directly, rather than calling it, so
+            # that memoized values are found without a function call.
+            namespace['decode%d' % i] = parse
+            expr = 'decode%d[get(%r) or None]' % (i, attrname)
+        else:
+            namespace['parse%d' % i] = parse
+            expr = 'parse%d(get(%r) or None)' % (i, attrname)
+        if interned:
+            namespace['intern%d' % i] = intern
+            expr = 'intern%d(%s)' % (i, expr)
+        exprs.append((id, expr))
+    return exprs
+
+
+def _parse_element(elt, id, extract):
+    return (id, extract(_attr_getter(elt)))
 
 
 def _parse_list(list_elt, id, subelt_parser):
@@ -159,16 +614,23 @@ def _parse_list(list_elt, id, subelt_parser):
     return (id, lst)
 
 
-_client_attrs = [('ClientCountry', 'country', _optional),
+_client_attrs = [('ClientCountry', 'country',
+                  _Interned('client.country', 'country', _optional)),
                  ('ClientID', 'senate_id', int),
                  ('ClientName', 'name', _identity),
-                 ('ClientPPBCountry', 'ppb_country', _identity),
-                 ('ClientPPBState', 'ppb_state', _optional),
-                 ('ClientState', 'state', _optional),
-                 ('ClientStatus', 'status', _status),
+                 ('ClientPPBCountry', 'ppb_country',
+                  _Interned('client.ppb_country', 'country', _identity)),
+                 ('ClientPPBState', 'ppb_state',
+                  _Interned('client.ppb_state', 'state', _optional)),
+                 ('ClientState', 'state',
+                  _Interned('client.state', 'state', _optional)),
+                 ('ClientStatus', 'status', _client_status),
                  ('ContactFullname', 'contact_name', _optional),
                  ('GeneralDescription', 'description', _optional),
-                 ('IsStateOrLocalGov', 'state_or_local_gov', _is_gov)]
+                 ('IsStateOrLocalGov', 'state_or_local_gov',
+                  _client_is_gov)]
+
+_extract_client = _compile_attrs(_client_attrs, '_extract_client')
 
 
 def _parse_client(elt):
@@ -180,15 +642,21 @@ def _parse_client(elt):
     second item is the dictionary of parsed attributes.
 
     """
-    return _parse_element(elt, 'client', _client_attrs)
+    return _parse_element(elt, 'client', _extract_client)
 
 
 _registrant_attrs = [('Address', 'address', _optional),
                      ('GeneralDescription', 'description', _optional),
-                     ('RegistrantCountry', 'country', _identity),
+                     ('RegistrantCountry', 'country',
+                      _Interned('registrant.country', 'country',
+                                _identity)),
                      ('RegistrantID', 'senate_id', int),
                      ('RegistrantName', 'name', _identity),
-                     ('RegistrantPPBCountry', 'ppb_country', _identity)]
+                     ('RegistrantPPBCountry', 'ppb_country',
+                      _Interned('registrant.ppb_country', 'country',
+                                _identity))]
+
+_extract_registrant = _compile_attrs(_registrant_attrs, '_extract_registrant')
 
 
 def _parse_registrant(elt):
@@ -200,7 +668,7 @@ def _parse_registrant(elt):
     whose second item is the dictionary of parsed attributes.
 
     """
-    return _parse_element(elt, 'registrant', _registrant_attrs)
+    return _parse_element(elt, 'registrant', _extract_registrant)
 
 
 # LobbyistName uses the '_optional' parser. This is intentional; there
@@ -208,10 +676,12 @@ def _parse_registrant(elt):
 # where the attribute's value is the empty string "".
 
 _lobbyist_attrs = [('LobbyistName', 'name', _optional),
-                   ('LobbyistStatus', 'status', _status),
+                   ('LobbyistStatus', 'status', _lobbyist_status),
                    ('LobbyisteIndicator', 'indicator', _lobbyist_indicator),
                    ('OfficialPosition', 'official_position', _optional)]
 
+_extract_lobbyist = _compile_attrs(_lobbyist_attrs, '_extract_lobbyist')
+
 
 def _parse_lobbyist(elt):
     """Parse a Lobbyist DOM element.
@@ -222,7 +692,7 @@ def _parse_lobbyist(elt):
     second item is the dictionary of parsed attributes.
 
     """
-    return _parse_element(elt, 'lobbyist', _lobbyist_attrs)
+    return _parse_element(elt, 'lobbyist', _extract_lobbyist)
 
 
 def _parse_lobbyists(elt):
@@ -238,7 +708,12 @@ def _parse_lobbyists(elt):
     return _parse_list(elt, 'lobbyists', _parse_lobbyist)
 
 
-_govt_entity_attrs = [('GovEntityName', 'name', _identity)]
+_govt_entity_attrs = [('GovEntityName', 'name',
+                       _Interned('govt_entity.name', 'govt_entity',
+                                 _identity))]
+
+_extract_govt_entity = _compile_attrs(_govt_entity_attrs,
+                                      '_extract_govt_entity')
 
 
 def _parse_govt_entity(elt):
@@ -250,7 +725,7 @@ def _parse_govt_entity(elt):
     whose second item is the dictionary of parsed attributes.
 
     """
-    return _parse_element(elt, 'govt_entity', _govt_entity_attrs)
+    return _parse_element(elt, 'govt_entity', _extract_govt_entity)
 
 
 def _parse_govt_entities(elt):
@@ -267,9 +742,12 @@ def _parse_govt_entities(elt):
     return _parse_list(elt, 'govt_entities', _parse_govt_entity)
 
 
-_issue_attrs = [('Code', 'code', _identity),
+_issue_attrs = [('Code', 'code',
+                 _Interned('issue.code', 'issue_code', _identity)),
                 ('SpecificIssue', 'specific_issue', _optional)]
 
+_extract_issue = _compile_attrs(_issue_attrs, '_extract_issue')
+
 
 def _parse_issue(elt):
     """Parse an Issue DOM element.
@@ -280,7 +758,7 @@ def _parse_issue(elt):
     second item is the dictionary of parsed attributes.
 
     """
-    return _parse_element(elt, 'issue', _issue_attrs)
+    return _parse_element(elt, 'issue', _extract_issue)
 
 
 def _parse_issues(elt):
@@ -297,12 +775,20 @@ def _parse_issues(elt):
 
 
 _foreign_entity_attrs = [('ForeignEntityContribution', 'contribution', _amount),
-                         ('ForeignEntityCountry', 'country', _optional),
+                         ('ForeignEntityCountry', 'country',
+                              _Interned('foreign_entity.country', 'country',
+                                        _optional)),
                          ('ForeignEntityName', 'name', _identity),
                          ('ForeignEntityOwnershipPercentage',
                               'ownership_percentage', _amount),
-                         ('ForeignEntityPPBcountry', 'ppb_country', _optional),
-                         ('ForeignEntityStatus', 'status', _status)]
+                         ('ForeignEntityPPBcountry', 'ppb_country',
+                              _Interned('foreign_entity.ppb_country',
+                                        'country', _optional)),
+                         ('ForeignEntityStatus', 'status',
+                          _foreign_entity_status)]
+
+_extract_foreign_entity = _compile_attrs(_foreign_entity_attrs,
+                                         '_extract_foreign_entity')
 
 
 def _parse_foreign_entity(elt):
@@ -314,7 +800,7 @@ def _parse_foreign_entity(elt):
     whose second item is the dictionary of parsed attributes.
 
     """
-    return _parse_element(elt, 'foreign_entity', _foreign_entity_attrs)
+    return _parse_element(elt, 'foreign_entity', _extract_foreign_entity)
 
 
 def _parse_foreign_entities(elt):
@@ -334,9 +820,13 @@ def _parse_foreign_entities(elt):
 # The affiliated org PPB country attribute name is spelled,
 # "AffiliatedOrgPPBCcountry" (sic).
 
-_org_attrs = [('AffiliatedOrgCountry', 'country', _optional),
+_org_attrs = [('AffiliatedOrgCountry', 'country',
+               _Interned('org.country', 'country', _optional)),
               ('AffiliatedOrgName', 'name', _identity),
-              ('AffiliatedOrgPPBCcountry', 'ppb_country', _identity)]
+              ('AffiliatedOrgPPBCcountry', 'ppb_country',
+               _Interned('org.ppb_country', 'country', _identity))]
+
+_extract_org = _compile_attrs(_org_attrs, '_extract_org')
 
 
 def _parse_org(elt):
@@ -348,7 +838,7 @@ def _parse_org(elt):
     second item is the dictionary of parsed attributes.
 
     """
-    return _parse_element(elt, 'org', _org_attrs)
+    return _parse_element(elt, 'org', _extract_org)
 
 
 def _parse_affiliated_orgs(elt):
@@ -372,10 +862,13 @@ _filing_attrs = [('ID', 'id', _identity),
                  ('Year', 'year', int),
                  ('Received', 'filing_date', _identity),
                  ('Amount', 'amount', _amount),
-                 ('Type', 'type', _identity),
+                 ('Type', 'type',
+                  _Interned('filing.type', 'filing_type', _identity)),
                  ('Period', 'period', _period),
                  ('AffiliatedOrgsURL', 'affiliated_orgs_url', _optional)]
 
+_extract_filing = _compile_attrs(_filing_attrs, '_extract_filing')
+
 
 def _parse_filing(elt):
     """Parse a Filing DOM element.
@@ -386,7 +879,7 @@ def _parse_filing(elt):
     second item is the dictionary of parsed attributes.
 
     """
-    return _parse_element(elt, 'filing', _filing_attrs)
+    return _parse_element(elt, 'filing', _extract_filing)
 
 
 # These parsers are used by parse_filings to parse sub-elements of
@@ -404,364 +897,1983 @@ _subelt_parsers = {'Registrant': _parse_registrant,
                    'AffiliatedOrgs': _parse_affiliated_orgs}
 
 
-def parse_filings(doc):
-    """Parse all filing records in a lobbyist database.
+# Compact records.
 
-    doc - The database to parse. Can be a filename, a URL or anything
-    else that xml.dom.pulldom.parse takes as an argument.
+class _Record(object):
+    """Base class for compact parsed records.
 
-    Yields a sequence of dictionaries, one per filing record.
+    Records are an alternative to the nested dictionaries normally
+    yielded by parse_filings (see its 'records' argument). Each
+    attribute of a record is stored in a slot, and its name is the
+    same as the corresponding dictionary key. For compatibility with
+    code written for dictionaries, such as the importers, attributes
+    may also be read and written by subscripting, e.g.,
+    client['name']. Like a dictionary, a record raises KeyError when
+    it's subscripted with a name it doesn't have, and isn't hashable.
 
     """
-    for filing_elt in _filing_elements(doc):
-        filing = dict([_parse_filing(filing_elt)])
-        for elt in _child_elements(filing_elt):
-            parser = _subelt_parsers[_element_name(elt)]
-            filing.update([parser(elt)])
-        yield filing
+    __slots__ = ()
 
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
 
-# Code to import parsed records into the database.
+    __setitem__ = object.__setattr__
 
-_where_stmt = {'client':
-                   'client WHERE '
-                   'country=:country AND '
-                   'name=:name AND '
-                   'ppb_country=:ppb_country AND '
-                   'state=:state AND '
-                   'ppb_state=:ppb_state AND '
-                   'state_or_local_gov=:state_or_local_gov',
-               'registrant':
-                   'registrant WHERE '
-                   'country=:country AND '
-                   'senate_id=:senate_id AND '
-                   'name=:name AND '
-                   'ppb_country=:ppb_country',
-               'lobbyist':
-                   'lobbyist WHERE '
-                   'name=:name AND '
-                   'indicator=:indicator AND '
-                   'official_position=:official_position',
-               'affiliated_org':
-                   'affiliated_org WHERE '
-                   'name=:name AND '
-                   'country=:country AND '
-                   'ppb_country=:ppb_country',
-               'foreign_entity':
-                   'foreign_entity WHERE '
-                   'name=:name AND '
-                   'country=:country AND '
-                   'ppb_country=:ppb_country'}
+    # Records are mutable, and compare by value.
+    __hash__ = None
 
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return False
+        for name in self.__slots__:
+            if getattr(self, name) != getattr(other, name):
+                return False
+        return True
 
-def _filing_db_key(filing):
-    """Return a filing's database key."""
-    return filing['id']
+    def __ne__(self, other):
+        return not self == other
 
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__,
+                           ', '.join(['%s=%r' % (name, getattr(self, name))
+                                      for name in self.__slots__]))
 
-def _rowid(table, tomatch, cur):
-    """Find a match in a database table and return its rowid.
 
-    This function only works for tables with a primary key
-    auto-increment column named 'id'.
+def _slots(attrs):
+    """The record slot names for a table of attribute specifications."""
+    return tuple([id for name, id, parse in attrs])
 
-    table - The name of the table to search (a string).
 
-    tomatch - A mapping whose key names are identical to the table's
-    column names, and whose values are the values to match in the
-    table.
+def _compile_record(attrs, name, cls, defaults=()):
+    """Compile a table of attribute specifications into a function.
 
-    cur - The DB API 2.0-compliant database cursor.
+    Like _compile_attrs, but the compiled function returns an instance
+    of the record class cls rather than a dictionary.
 
-    Returns the rowid of the matching row, or None if no match is
-    found.
+    defaults - A sequence of (slot, expression) pairs. Each slot is
+    initialized to the value of the Python expression, which is
+    evaluated anew for every record.
 
     """
-    stmt = 'SELECT id FROM %s' % _where_stmt[table]
-    cur.execute(stmt, tomatch)
-    row = cur.fetchone()
-    if row:
-        return row[0]
-    else:
-        return None
+    namespace = {'cls': cls, 'new': cls.__new__}
+    lines = ['def %s(get):' % name, '    r = new(cls)']
+    for id, expr in _attr_exprs(attrs, namespace) + list(defaults):
+        lines.append('    r.%s = %s' % (id, expr))
+    lines.append('    return r\n')
+    exec '\n'.join(lines) in namespace
+    return namespace[name]
 
 
-def _client_rowid(client, cur):
-    """Find a client the database.
+class Client(_Record):
+    """A parsed Client element."""
+    __slots__ = _slots(_client_attrs)
 
-    Returns the row ID of the matching client, or None if there is no
-    match.
 
-    client - The parsed client dictionary.
-
-    cur - The DB API 2.0-compliant database cursor.
+class Registrant(_Record):
+    """A parsed Registrant element."""
+    __slots__ = _slots(_registrant_attrs)
 
-    """
-    return _rowid('client', client, cur)
 
+class Lobbyist(_Record):
+    """A parsed Lobbyist element."""
+    __slots__ = _slots(_lobbyist_attrs)
 
-def _import_client(client, filing, cur):
-    """Import a client into the database.
 
-    Returns nothing.
+class GovtEntity(_Record):
+    """A parsed GovernmentEntity element."""
+    __slots__ = _slots(_govt_entity_attrs)
 
-    Side-effects: may insert rows into the 'client', 'country',
-    'state', 'org' and 'filing_client' tables.
 
-    client - The parsed client dictionary.
+class Issue(_Record):
+    """A parsed Issue element."""
+    __slots__ = _slots(_issue_attrs)
 
-    filing - The parsed filing dictionary with which the client is
-    associated.
 
-    cur - The DB API 2.0-compliant database cursor.
+class ForeignEntity(_Record):
+    """A parsed (foreign) Entity element."""
+    __slots__ = _slots(_foreign_entity_attrs)
 
-    """
-    db_key = _client_rowid(client, cur)
-    if db_key is None:
-        # Note - client status is pre-inserted into client_status table.
-        for key in ['country', 'ppb_country']:
-            cur.execute('INSERT INTO country VALUES(?)', [client[key]])
-        for key in ['state', 'ppb_state']:
-            cur.execute('INSERT INTO state VALUES(?)', [client[key]])
-        cur.execute('INSERT INTO person VALUES(?)', [client['contact_name']])
-        cur.execute('INSERT INTO org VALUES(?)', [client['name']])
-        cur.execute('INSERT INTO client VALUES(NULL, '
-                    ':country, :name, :ppb_country, :state, :ppb_state, '
-                    ':state_or_local_gov)',
-                    client)
-        db_key = cur.lastrowid
-    cur.execute('INSERT INTO filing_client VALUES(?, ?, ?, ?, ?, ?)',
-                [_filing_db_key(filing),
-                 db_key,
-                 client['senate_id'],
-                 client['status'],
-                 client['contact_name'],
-                 client['description']])
 
+class AffiliatedOrg(_Record):
+    """A parsed (affiliated) Org element."""
+    __slots__ = _slots(_org_attrs)
 
-def _registrant_rowid(reg, cur):
-    """Find a registrant in the database.
 
-    Returns the row ID of the matching registrant, or None if there is
-    no match.
+# A Filing record holds its own attributes, plus one slot per
+# sub-element. Singleton sub-elements which don't appear in the
+# document are None, and list sub-elements which don't appear are
+# empty lists.
 
-    reg - The parsed registrant dictionary.
+_filing_subelt_defaults = [('registrant', 'None'),
+                           ('client', 'None'),
+                           ('lobbyists', '[]'),
+                           ('govt_entities', '[]'),
+                           ('issues', '[]'),
+                           ('foreign_entities', '[]'),
+                           ('affiliated_orgs', '[]')]
 
-    cur - The DB API 2.0-compliant database cursor.
 
-    """
-    return _rowid('registrant', reg, cur)
+class Filing(_Record):
+    """A parsed Filing element, including its sub-elements."""
+    __slots__ = _slots(_filing_attrs) + \
+        tuple(id for id, default in _filing_subelt_defaults)
 
 
-def _import_registrant(reg, filing, cur):
-    """Import a registrant into the database.
+# Compiled attribute extractors for each record class. See
+# _compile_record.
 
-    Returns nothing.
+_record_attrs = [(Client, _client_attrs),
+                 (Registrant, _registrant_attrs),
+                 (Lobbyist, _lobbyist_attrs),
+                 (GovtEntity, _govt_entity_attrs),
+                 (Issue, _issue_attrs),
+                 (ForeignEntity, _foreign_entity_attrs),
+                 (AffiliatedOrg, _org_attrs)]
 
-    Side-effects: may insert rows into the 'registrant', 'country',
-    'org' and 'filing_registrant' tables.
+_record_extractors = dict((cls, _compile_record(attrs,
+                                                '_extract_%s' % cls.__name__,
+                                                cls))
+                          for cls, attrs in _record_attrs)
+_record_extractors[Filing] = _compile_record(_filing_attrs, '_extract_Filing',
+                                             Filing, _filing_subelt_defaults)
 
-    reg - The parsed registrant dictionary.
 
-    filing - The parsed filing dictionary with which the registrant is
-    associated.
+# Parsing tables for each record shape. The backends don't use the
+# parsers in _subelt_parsers for records, or at all in the case of
+# the event-based backends (expat and etree), which see attributes as
+# a mapping from attribute name to value rather than as DOM nodes.
+#
+# For each shape, there's a function which extracts a new, parsed
+# filing from the attributes of a Filing element (see
+# _compile_attrs), and a table which maps each Filing sub-element name
+# to a triple: the key of the parsed sub-element in the filing; True if
+# the sub-element is a list, False if it's a singleton; and the
+# attribute extractor for the sub-element (or for each of its items,
+# if it's a list).
+
+_extract_wrapped_filing = _compile_attrs(_filing_attrs,
+                                         '_extract_wrapped_filing', 'filing')
+
+_subelt_specs = {
+    'Registrant': ('registrant', False, _extract_registrant),
+    'Client': ('client', False, _extract_client),
+    'Lobbyists': ('lobbyists', True,
+                  _compile_attrs(_lobbyist_attrs, '_extract_wrapped_lobbyist',
+                                 'lobbyist')),
+    'GovernmentEntities': ('govt_entities', True,
+                           _compile_attrs(_govt_entity_attrs,
+                                          '_extract_wrapped_govt_entity',
+                                          'govt_entity')),
+    'Issues': ('issues', True,
+               _compile_attrs(_issue_attrs, '_extract_wrapped_issue',
+                              'issue')),
+    'ForeignEntities': ('foreign_entities', True,
+                        _compile_attrs(_foreign_entity_attrs,
+                                       '_extract_wrapped_foreign_entity',
+                                       'foreign_entity')),
+    'AffiliatedOrgs': ('affiliated_orgs', True,
+                       _compile_attrs(_org_attrs, '_extract_wrapped_org',
+                                      'org'))}
+
+_subelt_record_specs = {
+    'Registrant': ('registrant', False, _record_extractors[Registrant]),
+    'Client': ('client', False, _record_extractors[Client]),
+    'Lobbyists': ('lobbyists', True, _record_extractors[Lobbyist]),
+    'GovernmentEntities': ('govt_entities', True,
+                           _record_extractors[GovtEntity]),
+    'Issues': ('issues', True, _record_extractors[Issue]),
+    'ForeignEntities': ('foreign_entities', True,
+                        _record_extractors[ForeignEntity]),
+    'AffiliatedOrgs': ('affiliated_orgs', True,
+                       _record_extractors[AffiliatedOrg])}
+
+_shapes = {False: (_extract_wrapped_filing, _subelt_specs),
+           True: (_record_extractors[Filing], _subelt_record_specs)}
+
+# Filing predicates. parse_filings's where argument is called with
+# each filing's parsed attributes before any of its sub-elements are
+# parsed: the filing dictionary's 'filing' value for dictionaries, or
+# the Filing record itself for records. Both can be indexed by
+# attribute name, e.g. filing['year'].
+
+def _filing_attrs_of(filing, records):
+    if records:
+        return filing
+    return filing['filing']
+
+
+def _value_set(values):
+    """A frozenset of one or more values, or None."""
+    if values is None:
+        return None
+    if isinstance(values, (basestring, int, long)):
+        return frozenset([values])
+    return frozenset(values)
 
-    cur - The DB API 2.0-compliant database cursor.
 
-    """
-    db_key = _registrant_rowid(reg, cur)
-    if db_key is None:
-        cur.execute('INSERT INTO country VALUES(?)',
-                    [reg['country']])
-        cur.execute('INSERT INTO country VALUES(?)',
-                    [reg['ppb_country']])
-        cur.execute('INSERT INTO org VALUES(?)',
-                    [reg['name']])
-        cur.execute('INSERT INTO registrant VALUES(NULL, '
-                    ':country, :senate_id, :name, :ppb_country)',
-                    reg)
-        db_key = cur.lastrowid
-    cur.execute('INSERT INTO filing_registrant VALUES(?, ?, ?, ?)',
-                [_filing_db_key(filing),
-                 db_key,
-                 reg['address'],
-                 reg['description']])
+class FilingFilter(object):
+    """A predicate on a filing's own attributes.
 
+    Pass an instance as parse_filings's where argument to parse only
+    the filings which match all of the given criteria. Unlike a
+    lambda, a FilingFilter can be passed to parse_filings_parallel.
 
-def _lobbyist_rowid(lobbyist, cur):
-    """Find a lobbyist in the database.
+    year - A year (e.g. 2008), or a sequence of years.
 
-    Returns the row ID of the matching lobbyist, or None if there is
-    no match.
+    type - A filing type (e.g. u'REGISTRATION'), or a sequence of
+    types.
 
-    lobbyist - The parsed lobbyist dictionary.
+    period - A parsed period (e.g. 'Q1' or 'H2'), or a sequence of
+    periods.
 
-    cur - The DB API 2.0-compliant database cursor.
+    received - A (start, end) pair of ISO 8601 dates or date-times,
+    e.g. ('2008-01-01', '2008-04-01'). Matches filings received on or
+    after start and before end; either may be None. Filings with no
+    received date don't match.
 
     """
-    return _rowid('lobbyist', lobbyist, cur)
+    def __init__(self, year=None, type=None, period=None, received=None):
+        self.years = _value_set(year)
+        self.types = _value_set(type)
+        self.periods = _value_set(period)
+        self.received = received
 
+    def __call__(self, filing):
+        if self.years is not None and filing['year'] not in self.years:
+            return False
+        if self.types is not None and filing['type'] not in self.types:
+            return False
+        if self.periods is not None and \
+                filing['period'] not in self.periods:
+            return False
+        if self.received is not None:
+            date = filing['filing_date']
+            start, end = self.received
+            if date is None or (start is not None and date < start) or \
+                    (end is not None and date >= end):
+                return False
+        return True
 
-def _import_lobbyist(lobbyist, filing, cur):
-    """Import a lobbyist into the database.
 
-    Returns nothing.
+# The names of the sub-element fields which can be selected with
+# parse_filings's fields argument.
 
-    Side-effects: may insert rows into the 'lobbyist', 'person' and
-    'filing_lobbyists' tables.
+_fields = frozenset(id for id, is_list, extract in _subelt_specs.itervalues())
 
-    lobbyist - The parsed lobbyist dictionary.
 
-    filing - The parsed filing dictionary with which the lobbyist is
-    associated.
+def _check_fields(fields):
+    """Validate a set of sub-element fields. See parse_filings.
 
-    cur - The DB API 2.0-compliant database cursor.
+    Returns the fields as a frozenset, or None if fields is None.
+
+    Raises ValueError if any of the fields is unknown.
 
     """
-    db_key = _lobbyist_rowid(lobbyist, cur)
-    if db_key is None:
-        # Note - lobbyist status and indicator are pre-inserted into the
-        # lobbyist_status and lobbyist_indicator tables.
-        cur.execute('INSERT INTO person VALUES(?)', [lobbyist['name']])
-        cur.execute('INSERT INTO lobbyist VALUES(NULL, '
-                    ':name, :indicator, :official_position)',
-                    lobbyist)
-        db_key = cur.lastrowid
-    cur.execute('INSERT INTO filing_lobbyists VALUES(?, ?, ?)',
-                [_filing_db_key(filing), db_key, lobbyist['status']])
+    if fields is None:
+        return None
+    fields = frozenset(fields)
+    unknown = fields - _fields
+    if unknown:
+        raise ValueError('unknown fields: %s' % ', '.join(sorted(unknown)))
+    return fields
 
 
-def _import_govt_entity(entity, filing, cur):
-    """Import a government entity into the database.
+def _parsing_tables(records, fields):
+    """The parsing tables for a record shape and a set of fields.
 
-    Returns nothing.
+    Returns an (extract_filing, specs) pair, as in _shapes, except
+    that the spec for each sub-element which isn't in fields is
+    None. If fields is None, all sub-elements are parsed.
 
-    Side-effects: may insert rows into the 'govt_entity' and
-    'filing_govt_entities' tables.
+    """
+    extract_filing, specs = _shapes[records]
+    if fields is not None:
+        specs = dict((name, spec if spec[0] in fields else None)
+                     for name, spec in specs.iteritems())
+    return (extract_filing, specs)
 
-    entity - The parsed government entity dictionary.
 
-    filing - The parsed filing dictionary with which the government
-    entity is associated.
+def _selective_pulldom_filings(doc, records, fields, where):
+    """Parse selected filing records and fields with pulldom.
 
-    cur - The DB API 2.0-compliant database cursor.
+    Rather than expanding each Filing element, only the selected
+    sub-elements of the filings which satisfy where are expanded into
+    DOM trees; the others are skipped as their events go by.
+
+    Yields a sequence of parsed filings.
 
     """
-    db_key = entity['name']
-    cur.execute('INSERT INTO govt_entity VALUES(:name)', entity)
-    cur.execute('INSERT INTO filing_govt_entities VALUES(?, ?)',
-                [_filing_db_key(filing), db_key])
+    extract_filing, specs = _parsing_tables(records, fields)
+    stream, opened = _open_doc(doc)
+    try:
+        dom = xml.dom.pulldom.parse(stream)
+        depth = 0
+        filing = None
+        filing_depth = None
+        for event, node in dom:
+            if event == 'START_ELEMENT':
+                depth += 1
+                if filing_depth is None:
+                    if node.nodeName == 'Filing':
+                        filing = extract_filing(_attr_getter(node))
+                        filing_depth = depth
+                        if where is not None and \
+                                not where(_filing_attrs_of(filing, records)):
+                            filing = None
+                elif filing is not None and depth == filing_depth + 1:
+                    spec = specs[node.nodeName]
+                    if spec is None:
+                        continue
+                    # expandNode consumes the element's END_ELEMENT
+                    # event.
+                    dom.expandNode(node)
+                    depth -= 1
+                    id, is_list, extract = spec
+                    if is_list:
+                        filing[id] = [extract(_attr_getter(item))
+                                      for item in _child_elements(node)]
+                    else:
+                        filing[id] = extract(_attr_getter(node))
+            elif event == 'END_ELEMENT':
+                if depth == filing_depth:
+                    if filing is not None:
+                        yield filing
+                    filing = None
+                    filing_depth = None
+                depth -= 1
+    finally:
+        if opened:
+            stream.close()
+
+
+def _pulldom_filings(doc, records, fields=None, where=None):
+    """Parse all filing records in a lobbyist database with pulldom.
+
+    Yields a sequence of parsed filings, one per filing record.
+
+    """
+    if fields is not None or where is not None:
+        for filing in _selective_pulldom_filings(doc, records, fields,
+                                                 where):
+            yield filing
+        return
+    if not records:
+        for filing_elt in _filing_elements(doc):
+            filing = dict([_parse_filing(filing_elt)])
+            for elt in _child_elements(filing_elt):
+                parser = _subelt_parsers[_element_name(elt)]
+                filing.update([parser(elt)])
+            yield filing
+        return
+    extract_filing, specs = _shapes[True]
+    for filing_elt in _filing_elements(doc):
+        filing = extract_filing(_attr_getter(filing_elt))
+        for elt in _child_elements(filing_elt):
+            id, is_list, extract = specs[_element_name(elt)]
+            if is_list:
+                filing[id] = [extract(_attr_getter(item))
+                              for item in _child_elements(elt)]
+            else:
+                filing[id] = extract(_attr_getter(elt))
+        yield filing
 
 
-def _import_issue(issue, filing, cur):
-    """Import an issue into the database.
+# xml.parsers.expat-specific code
 
-    Returns nothing.
+class _ExpatFilingBuilder(object):
+    """Build parsed filings from expat element events.
 
-    Side-effects: may insert rows into the 'issue', 'issue_code' and
-    'filing_issues' tables.
+    Completed filings are appended to the 'filings' list, in document
+    order. The caller is responsible for emptying it.
 
-    issue - The parsed issue dictionary.
+    records - If True, build Filing records rather than dictionaries.
 
-    filing - The parsed filing dictionary with which the issue is
-    associated.
+    fields - The sub-element fields to parse, or None for all of
+    them. Other sub-elements are skipped.
 
-    cur - The DB API 2.0-compliant database cursor.
+    where - A predicate on each filing's attributes, or None. Filings
+    which don't satisfy it are skipped. See parse_filings.
 
     """
-    cur.execute('INSERT INTO issue_code VALUES(?)', [issue['code']])
-    cur.execute('INSERT INTO issue VALUES(NULL, :code, :specific_issue)',
-                issue)
-    db_key = cur.lastrowid
-    cur.execute('INSERT INTO filing_issues VALUES(?, ?)',
-                [_filing_db_key(filing), db_key])
+    def __init__(self, records, fields=None, where=None):
+        self.filings = list()
+        self._extract_filing, self._specs = _parsing_tables(records, fields)
+        self._records = records
+        self._where = where
+        self._depth = 0
+        self._filing = None
+        self._filing_depth = None
+        self._list = None
+
+    def start_element(self, name, attrs):
+        self._depth += 1
+        if self._filing_depth is None:
+            if name == 'Filing':
+                self._filing = self._extract_filing(attrs.get)
+                self._filing_depth = self._depth
+                if self._where is not None and \
+                        not self._where(_filing_attrs_of(self._filing,
+                                                         self._records)):
+                    self._filing = None
+        elif self._filing is None:
+            # Skipping a filing which doesn't satisfy where.
+            return
+        elif self._depth == self._filing_depth + 1:
+            spec = self._specs[name]
+            if spec is None:
+                self._list = None
+                return
+            id, is_list, extract = spec
+            if is_list:
+                self._list = (extract, list())
+                self._filing[id] = self._list[1]
+            else:
+                self._filing[id] = extract(attrs.get)
+                self._list = None
+        elif self._depth == self._filing_depth + 2 and \
+                self._list is not None:
+            extract, lst = self._list
+            lst.append(extract(attrs.get))
+
+    def end_element(self, name):
+        if self._depth == self._filing_depth:
+            if self._filing is not None:
+                self.filings.append(self._filing)
+            self._filing = None
+            self._filing_depth = None
+        elif self._filing is not None and \
+                self._depth == self._filing_depth + 1:
+            self._list = None
+        self._depth -= 1
+
+
+def _expat_filings(doc, records, fields=None, where=None):
+    """Parse all filing records in a lobbyist database with expat.
+
+    Unlike the pulldom backend, no DOM nodes are created; parsed
+    filings are filled directly from expat's start element events.
+
+    Yields a sequence of parsed filings, one per filing record.
 
+    """
+    stream, opened = _open_doc(doc)
+    try:
+        builder = _ExpatFilingBuilder(records, fields, where)
+        parser = xml.parsers.expat.ParserCreate()
+        parser.StartElementHandler = builder.start_element
+        parser.EndElementHandler = builder.end_element
+        filings = builder.filings
+        while True:
+            buf = stream.read(_bufsize)
+            parser.Parse(buf, not buf)
+            for filing in filings:
+                yield filing
+            del filings[:]
+            if not buf:
+                break
+    finally:
+        if opened:
+            stream.close()
 
-def _affiliated_org_rowid(org, cur):
-    """Find an affiliated org the database.
 
-    Returns the row ID of the matching org, or None if there is no
-    match.
+# xml.etree.cElementTree-specific code
 
-    org - The parsed org dictionary.
+def _parse_etree_filing(filing, elt, specs):
+    """Parse the sub-elements of a Filing ElementTree element.
 
-    cur - The DB API 2.0-compliant database cursor.
+    filing - The filing, with its attributes already parsed.
 
-    """
-    return _rowid('affiliated_org', org, cur)
+    specs - The parsing tables for the desired record shape and
+    fields. See _parsing_tables.
 
+    Returns the parsed filing.
 
-def _import_affiliated_org(org, filing, cur):
-    """Import an affiliated org into the database.
+    """
+    for subelt in elt:
+        spec = specs[subelt.tag]
+        if spec is None:
+            continue
+        id, is_list, extract = spec
+        if is_list:
+            filing[id] = [extract(item.get) for item in subelt]
+        else:
+            filing[id] = extract(subelt.get)
+    return filing
 
-    Returns nothing.
-    
-    Side-effects: may insert rows into the 'affiliated_org',
-    'country', 'org', 'filing_affiliated_orgs', and 'url' tables.
 
-    org - The parsed org dictionary.
+def _release_etree_elt(elt, parents):
+    """Release a fully-parsed ElementTree element.
 
-    filing - The parsed filing dictionary with which the org is
-    associated.
+    Clears the element and detaches it from its parent, so that
+    neither it nor its sub-elements are kept alive by the partially
+    built document tree.
 
-    cur - The DB API 2.0-compliant database cursor.
+    elt - The ElementTree element.
+
+    parents - The stack of open ancestors of the element, innermost
+    last.
 
     """
-    db_key = _affiliated_org_rowid(org, cur)
-    if db_key is None:
-        for key in ['country', 'ppb_country']:
-            cur.execute('INSERT INTO country VALUES(?)', [org[key]])
-        cur.execute('INSERT INTO org VALUES(?)', [org['name']])
-        cur.execute('INSERT INTO affiliated_org VALUES(NULL, '
-                    ':name, :country, :ppb_country)',
-                    org)
-        db_key = cur.lastrowid
-    url = filing['affiliated_orgs_url']
-    cur.execute('INSERT INTO url VALUES(?)', [url])
-    cur.execute('INSERT INTO filing_affiliated_orgs VALUES(?, ?, ?)',
-                [_filing_db_key(filing), db_key, url])
+    elt.clear()
+    if parents:
+        parents[-1].remove(elt)
 
 
-def _foreign_entity_rowid(entity, cur):
-    """Find a foreign entity in the database.
+def _etree_filings(doc, records, fields=None, where=None):
+    """Parse all filing records in a lobbyist database with iterparse.
 
-    Returns the row ID of the matching entity, or None if there is no
-    match.
+    Each Filing element is built by cElementTree, parsed, and then
+    cleared and detached from the document tree before its filing
+    dictionary is yielded. Elements outside of Filing elements are
+    released in the same way as soon as they're closed. The amount of
+    memory used by the parser is therefore bounded by the size of the
+    largest Filing element, and doesn't grow with the size of the
+    document.
 
-    entity - The parsed foreign entity dictionary.
+    cElementTree builds the unselected sub-elements of each Filing
+    element too, and the sub-elements of filings which don't satisfy
+    where, but they're not parsed.
 
-    cur - The DB API 2.0-compliant database cursor.
+    Yields a sequence of parsed filings, one per filing record.
 
     """
-    return _rowid('foreign_entity', entity, cur)
+    extract_filing, specs = _parsing_tables(records, fields)
+    stream, opened = _open_doc(doc)
+    try:
+        parents = list()
+        filing_elt = None
+        for event, elt in etree.iterparse(stream, ('start', 'end')):
+            if filing_elt is not None:
+                if event == 'end' and elt is filing_elt:
+                    if filing is not None:
+                        filing = _parse_etree_filing(filing, elt, specs)
+                    _release_etree_elt(elt, parents)
+                    filing_elt = None
+                    if filing is not None:
+                        yield filing
+            elif event == 'start':
+                if elt.tag == 'Filing':
+                    # The start tag's attributes are complete, so the
+                    # filing can be tested before its sub-elements are
+                    # parsed.
+                    filing_elt = elt
+                    filing = extract_filing(elt.get)
+                    if where is not None and \
+                            not where(_filing_attrs_of(filing, records)):
+                        filing = None
+                else:
+                    parents.append(elt)
+            else:
+                parents.pop()
+                _release_etree_elt(elt, parents)
+    finally:
+        if opened:
+            stream.close()
+
+
+# Parser backends, by name. See parse_filings.
+
+_backends = {'pulldom': _pulldom_filings,
+             'expat': _expat_filings,
+             'etree': _etree_filings}
+
+
+def parse_filings(doc, backend='pulldom', records=False, fields=None,
+                  where=None):
+    """Parse all filing records in a lobbyist database.
 
+    doc - The database to parse. Can be a filename, the URL of an XML
+    document (http, https or ftp), a file-like object or a ZipMember.
+    Files whose names end in '.gz' are decompressed as they're
+    parsed. If the filename ends in '.zip', each file in the ZIP
+    archive is decompressed and parsed in turn, as though the
+    documents were concatenated; see split_documents to parse them
+    separately. The same goes for URLs.
+
+    backend - The name of the XML parser backend to use. 'pulldom'
+    (the default) expands each Filing element into a DOM tree before
+    parsing it. 'expat' fills the filing dictionaries directly from
+    expat events without building DOM nodes, and is considerably
+    faster. 'etree' uses xml.etree.cElementTree.iterparse, releasing
+    each Filing element as soon as it's parsed; its memory use is
+    bounded by the size of the largest Filing element and does not
+    grow with the size of the document. All backends produce
+    identical results, except that the 'etree' backend returns
+    ASCII-only attribute values as str rather than unicode objects
+    (they compare equal).
+
+    records - If False (the default), each parsed filing is a
+    dictionary, as described in the how-to. If True, each parsed
+    filing is a compact Filing record, whose attributes are the keys
+    of the filing dictionary's 'filing' value, plus 'registrant',
+    'client', 'lobbyists', 'govt_entities', 'issues',
+    'foreign_entities' and 'affiliated_orgs'. The list attributes are
+    plain lists of Lobbyist, GovtEntity, Issue, ForeignEntity and
+    AffiliatedOrg records. Records use several times less memory than
+    dictionaries, and import_filings accepts either.
+
+    fields - If None (the default), every sub-element of each filing
+    is parsed. Otherwise, an iterable of the sub-element fields to
+    parse, e.g. ['registrant', 'client']: any of 'registrant',
+    'client', 'lobbyists', 'govt_entities', 'issues',
+    'foreign_entities' and 'affiliated_orgs'. The filing's own
+    attributes are always parsed. Other sub-elements are skipped as
+    they're read, without being decoded, so that narrow queries are
+    much faster; in the parsed filings, they look as though they were
+    missing from the document. Raises ValueError if any of the fields
+    is unknown.
+
+    where - If not None, a predicate which selects the filings to
+    parse. It's called with each filing's parsed attributes (the
+    filing dictionary's 'filing' value, or the Filing record) before
+    any of the filing's sub-elements are parsed, and filings for
+    which it returns false are skipped without parsing their
+    sub-elements. A FilingFilter selects filings by year, type,
+    period and received date, e.g. where=FilingFilter(year=2008).
+
+    Yields a sequence of parsed filings, one per filing record (or
+    one per filing which satisfies where).
 
-def _import_foreign_entity(entity, filing, cur):
-    """Import a foreign entity into the database.
+    """
+    parse = _backends[backend]
+    fields = _check_fields(fields)
+    if _is_zip(doc):
+        return _parse_documents(split_documents(doc), parse, bool(records),
+                                fields, where)
+    return parse(doc, bool(records), fields, where)
 
-    Returns nothing.
 
-    Side-effects: may insert rows into the 'foreign_entity',
-    'country', 'org' and 'filing_foreign_entities' tables.
+def _parse_documents(docs, parse, records, fields, where):
+    for doc in docs:
+        for filing in parse(doc, records, fields, where):
+            yield filing
 
-    entity - The parsed foreign entity dictionary.
 
-    filing - The parsed filing dictionary with which the foreign
-    entity is associated.
+def _batches(iterable, size):
+    """Yield the items of iterable in lists of up to size items."""
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
 
-    cur - The DB API 2.0-compliant database cursor.
 
-    """
-    db_key = _foreign_entity_rowid(entity, cur)
+def parse_filings_batched(doc, size, backend='pulldom', records=False,
+                          fields=None, where=None):
+    """Parse all filing records in a lobbyist database, in batches.
+
+    size - The number of filings per batch. Raises ValueError if it's
+    less than 1.
+
+    doc, backend, records, fields, where - See parse_filings.
+
+    Yields a sequence of lists of parsed filings, in document
+    order. Every list but the last contains size filings; the last
+    contains the rest.
+
+    """
+    if size < 1:
+        raise ValueError('batch size must be at least 1')
+    return _batches(parse_filings(doc, backend, records, fields, where), size)
+
+
+# Parallel parsing.
+#
+# parse_filings_parallel splits a document into chunks of whole Filing
+# elements, and parses each chunk in a worker process. Each chunk is
+# parsed as a small, well-formed document of its own: it's preceded by
+# the document's prolog (everything before the first Filing element,
+# including the XML declaration and the root element's start tag) and
+# followed by end tags for the elements which are still open at that
+# point. Chunk boundaries are found by searching the document's bytes
+# for Filing start tags, encoded in the document's own encoding, so
+# this relies on all Filing elements being siblings, and on '<Filing'
+# not appearing in comments or CDATA sections, both of which hold for
+# the Senate's documents.
+
+# The number of bytes per chunk.
+
+_chunk_size = 2 ** 22
+
+# Byte order marks, and the encodings they imply. An XML document
+# without one is in UTF-16 if its first character is a NUL-padded
+# '<', and is otherwise in the encoding named by its XML declaration,
+# or UTF-8 if it doesn't name one.
+
+_boms = [(codecs.BOM_UTF8, 'utf-8'),
+         (codecs.BOM_UTF16_LE, 'utf-16-le'),
+         (codecs.BOM_UTF16_BE, 'utf-16-be')]
+
+_xml_encoding = re.compile(r'<\?xml[^>]*?\sencoding\s*=\s*'
+                           r'["\']([A-Za-z][A-Za-z0-9._-]*)["\']')
+
+
+def _doc_encoding(head):
+    """Determine the encoding of an XML document.
+
+    head - The first few hundred bytes of the document.
+
+    Returns the name of a codec which encodes the document's
+    characters, without a byte order mark.
+
+    Raises ValueError if the document's encoding is unknown, or if
+    its markup can't be found by searching its bytes (see
+    _FilingStarts).
+
+    """
+    for bom, encoding in _boms:
+        if head.startswith(bom):
+            return encoding
+    if head.startswith('<\0'):
+        return 'utf-16-le'
+    if head.startswith('\0<'):
+        return 'utf-16-be'
+    match = _xml_encoding.match(head)
+    if match is None:
+        return 'utf-8'
+    name = match.group(1)
+    try:
+        encoding = codecs.lookup(name).name
+    except LookupError:
+        raise ValueError('unknown document encoding %r' % name)
+    # The declaration itself must be ASCII-compatible for it to have
+    # been read above, so the rest of the document should be too.
+    if u'<Filing>'.encode(encoding) != '<Filing>':
+        raise ValueError('unsupported document encoding %r' % name)
+    return encoding
+
+
+class _FilingStarts(object):
+    """Find the Filing start tags in a document's bytes.
+
+    f - The document, a seekable file object opened in binary mode.
+    Its encoding (see _doc_encoding) is kept in the 'encoding'
+    attribute.
+
+    """
+    def __init__(self, f):
+        f.seek(0)
+        self.encoding = _doc_encoding(f.read(1024))
+        ends = '|'.join([re.escape(c.encode(self.encoding))
+                         for c in u' \t\r\n/>'])
+        self._start = re.compile('%s(?:%s)' %
+                                 (re.escape(self.encode(u'<Filing')), ends))
+        # Start tags only begin on character boundaries. They're at
+        # least this many bytes long.
+        self._unit = len(self.encode(u'<'))
+        self._length = len(self.encode(u'<Filing>'))
+
+    def encode(self, text):
+        """Encode a unicode string in the document's encoding."""
+        return text.encode(self.encoding)
+
+    def offsets(self, f, offset=0):
+        """Yield the byte offset of each start tag in a document.
+
+        f - The document.
+
+        offset - The byte offset at which to start searching.
+
+        """
+        f.seek(offset)
+        # Keep a few bytes from the previous block, in case a start
+        # tag spans two blocks. The overlap is shorter than a start
+        # tag, so no start tag is found twice.
+        overlap = ''
+        while True:
+            block = f.read(_bufsize)
+            if not block:
+                return
+            buf = overlap + block
+            for match in self._start.finditer(buf):
+                start = offset - len(overlap) + match.start()
+                if start % self._unit == 0:
+                    yield start
+            offset += len(block)
+            overlap = buf[-(self._length - 1):]
+
+
+def _find_filing(f, offset, starts):
+    """Find the first Filing start tag at or after a byte offset.
+
+    f - The document, a seekable file object opened in binary mode.
+
+    offset - The byte offset at which to start searching.
+
+    starts - The document's _FilingStarts.
+
+    Returns the byte offset of the start tag, or None if there are no
+    more Filing elements in the document.
+
+    """
+    for start in starts.offsets(f, offset):
+        return start
+    return None
+
+
+def _has_children(f):
+    """Return True if a document's root element has child elements.
+
+    f - The document, a seekable file object opened in binary mode.
+
+    """
+    # Every element after the first (the root) is its descendant.
+    elements = [0]
+    def start_element(name, attrs):
+        elements[0] += 1
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    f.seek(0)
+    while elements[0] < 2:
+        buf = f.read(_bufsize)
+        parser.Parse(buf, not buf)
+        if not buf:
+            break
+    return elements[0] >= 2
+
+
+def _open_elements(prolog):
+    """The names of the elements left open by a document prolog.
+
+    Returns a list of element names, outermost first.
+
+    """
+    stack = list()
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = lambda name, attrs: stack.append(name)
+    parser.EndElementHandler = lambda name: stack.pop()
+    parser.Parse(prolog, False)
+    return stack
+
+
+def _epilogue(prolog, starts):
+    """The end tags which close the elements left open by a prolog.
+
+    prolog - The document's prolog.
+
+    starts - The document's _FilingStarts.
+
+    Returns the end tags, encoded in the document's encoding.
+
+    """
+    return starts.encode(u''.join([u'</%s>' % name for name in
+                                   reversed(_open_elements(prolog))]))
+
+
+def _chunks(path, chunk_size):
+    """Split a lobbyist database into chunks of Filing elements.
+
+    path - The document's filename.
+
+    chunk_size - The approximate number of bytes per chunk.
+
+    Returns a pair. The first item is the document's prolog, and the
+    second is a list of (start, end, epilogue) triples, one per chunk
+    and in document order, giving the chunk's byte range and the
+    epilogue to append to it. The last chunk extends to the end of
+    the document, so its epilogue is empty. If the document contains
+    no Filing elements, the prolog is None and the list is empty.
+
+    Raises ValueError if the document's encoding isn't supported (see
+    _doc_encoding), or if its root element has children but no Filing
+    start tags can be found.
+
+    """
+    f = open(path, 'rb')
+    try:
+        tags = _FilingStarts(f)
+        first = _find_filing(f, 0, tags)
+        if first is None:
+            if _has_children(f):
+                raise ValueError('no Filing start tags found in %s' % path)
+            return (None, [])
+        f.seek(0)
+        prolog = f.read(first)
+        f.seek(0, 2)
+        size = f.tell()
+        starts = [first]
+        while True:
+            start = _find_filing(f, starts[-1] + chunk_size, tags)
+            if start is None:
+                break
+            starts.append(start)
+    finally:
+        f.close()
+    epilogue = _epilogue(prolog, tags)
+    ends = starts[1:]
+    chunks = [(start, end, epilogue) for start, end in zip(starts, ends)]
+    chunks.append((starts[-1], size, ''))
+    return (prolog, chunks)
+
+
+def _parse_chunk(args):
+    """Parse one chunk of a document. Runs in a worker process.
+
+    args - A tuple of (path, prolog, start, end, epilogue, backend,
+    records, fields, where). See _chunks and parse_filings.
+
+    Returns the list of parsed filings in the chunk.
+
+    """
+    path, prolog, start, end, epilogue, backend, records, fields, where = \
+        args
+    f = open(path, 'rb')
+    try:
+        return list(_parse_range(f, prolog, start, end - start, epilogue,
+                                 backend, records, fields, where))
+    finally:
+        f.close()
+
+
+def _parse_range(f, prolog, start, length, epilogue, backend, records,
+                 fields, where=None):
+    """Parse the Filing elements in a byte range of a document.
+
+    f - The document, a seekable file object opened in binary mode.
+
+    prolog, epilogue - The document's prolog, and the end tags which
+    close it. See _chunks.
+
+    start, length - The byte range, which must consist of whole Filing
+    elements.
+
+    backend, records, fields, where - See parse_filings.
+
+    Returns a generator of parsed filings. The byte range is read
+    before returning, so f may be closed before the generator is
+    exhausted.
+
+    """
+    f.seek(start)
+    body = f.read(length)
+    return parse_filings(cStringIO.StringIO(prolog + body + epilogue),
+                         backend, records, fields, where)
+
+
+def parse_filings_parallel(doc, backend='pulldom', records=False,
+                           processes=None, chunk_size=None, fields=None,
+                           where=None):
+    """Parse all filing records in a lobbyist database in parallel.
+
+    The document is split into chunks of roughly chunk_size bytes at
+    Filing element boundaries, and each chunk is parsed in a worker
+    process. The parsed filings are identical to those yielded by
+    parse_filings, and are yielded in document order.
+
+    doc - The filename of the database to parse. Unlike parse_filings,
+    compressed documents and file-like objects aren't accepted,
+    because each worker reads its chunk directly from the file.
+
+    backend, records - See parse_filings.
+
+    processes - The number of worker processes. The default is the
+    number of CPUs in the system.
+
+    chunk_size - The approximate size (in bytes) of each chunk. The
+    default is 4MB. At most twice as many chunks as there are worker
+    processes are parsed or waiting to be yielded at any one time, so
+    this also bounds the parser's memory use.
+
+    fields - See parse_filings.
+
+    where - See parse_filings. It must be picklable, so that it can be
+    sent to the worker processes; a FilingFilter is, but a lambda
+    isn't.
+
+    Note that values are interned separately in each worker process
+    (see interning_stats), so the parent process's intern pool
+    statistics don't reflect parallel parsing.
+
+    Raises ValueError if the document's encoding isn't supported, or
+    if it can't be split into chunks. Documents in UTF-16, or in an
+    ASCII-compatible encoding named by their XML declaration, are
+    supported. Raises ImportError if the multiprocessing module isn't
+    available (as in Python 2.5).
+
+    Yields a sequence of parsed filings, one per filing record.
+
+    """
+    if multiprocessing is None:
+        raise ImportError('parse_filings_parallel requires the '
+                          'multiprocessing module')
+    fields = _check_fields(fields)
+    prolog, chunks = _chunks(doc, chunk_size or _chunk_size)
+    pool = multiprocessing.Pool(processes)
+    try:
+        window = 2 * (processes or multiprocessing.cpu_count())
+        pending = collections.deque()
+        for start, end, epilogue in chunks:
+            args = (doc, prolog, start, end, epilogue, backend, records,
+                    fields, where)
+            pending.append(pool.apply_async(_parse_chunk, (args,)))
+            if len(pending) >= window:
+                for filing in pending.popleft().get():
+                    yield filing
+        while pending:
+            for filing in pending.popleft().get():
+                yield filing
+    finally:
+        pool.terminate()
+
+
+# Random access by filing ID.
+#
+# index_filings scans a document once and writes a sidecar index
+# which maps each filing's ID to the byte range of its Filing
+# element, along with its Year and Type attributes. get_filing and
+# get_filings use the index to parse just the requested filings, the
+# same way parse_filings_parallel parses its chunks.
+#
+# The index is a text file. Its first line is a header:
+#
+# lobbyists-index <version> <document size> <prolog size>
+#
+# followed by one tab-separated line per filing, in document order:
+#
+# <ID> <offset> <length> <Year> <Type>
+#
+# The document size is used to detect an index which is out of date.
+
+_index_version = 1
+
+
+class _FilingScanner(object):
+    """Find the byte range of each Filing element with expat.
+
+    Completed entries are appended to the 'entries' list as (ID,
+    offset, length, Year, Type) tuples, in document order. 'prolog'
+    is the byte offset of the first Filing element, or None if there
+    aren't any.
+
+    parser - The expat parser which feeds this scanner; its
+    CurrentByteIndex gives the offset of each event.
+
+    """
+    def __init__(self, parser):
+        self.entries = list()
+        self.prolog = None
+        self._parser = parser
+        self._depth = 0
+        self._filing = None
+        self._filing_depth = None
+        self._ended = False
+
+    def _end_filing(self):
+        # A filing ends where the event following its end tag begins.
+        id, offset, year, type = self._filing
+        length = self._parser.CurrentByteIndex - offset
+        self.entries.append((id, offset, length, year, type))
+        self._filing = None
+        self._ended = False
+
+    def start_element(self, name, attrs):
+        if self._ended:
+            self._end_filing()
+        self._depth += 1
+        if self._filing is None and name == 'Filing':
+            offset = self._parser.CurrentByteIndex
+            if self.prolog is None:
+                self.prolog = offset
+            self._filing = (attrs.get('ID'), offset,
+                            attrs.get('Year'), attrs.get('Type'))
+            self._filing_depth = self._depth
+
+    def end_element(self, name):
+        if self._ended:
+            self._end_filing()
+        if self._filing is not None and self._depth == self._filing_depth:
+            self._ended = True
+        self._depth -= 1
+
+    def character_data(self, data):
+        if self._ended:
+            self._end_filing()
+
+
+def _index_path(doc, index):
+    if index is None:
+        return doc + '.idx'
+    return index
+
+
+def _encode_field(value):
+    if value is None:
+        return ''
+    return value.encode('utf-8')
+
+
+def index_filings(doc, index=None):
+    """Write a sidecar index of the filings in a lobbyist database.
+
+    The document is scanned once, without building any parsed
+    filings. The index maps each filing's ID to the byte offset and
+    length of its Filing element, and records its Year and Type
+    attributes. See get_filing, get_filings and read_filing_index.
+
+    doc - The filename of the database to index.
+
+    index - The filename of the index to write. The default is the
+    document's filename with '.idx' appended.
+
+    Returns the number of filings in the index.
+
+    """
+    parser = xml.parsers.expat.ParserCreate()
+    scanner = _FilingScanner(parser)
+    parser.StartElementHandler = scanner.start_element
+    parser.EndElementHandler = scanner.end_element
+    parser.CharacterDataHandler = scanner.character_data
+    f = open(doc, 'rb')
+    try:
+        while True:
+            buf = f.read(_bufsize)
+            parser.Parse(buf, not buf)
+            if not buf:
+                break
+        size = f.tell()
+    finally:
+        f.close()
+    out = open(_index_path(doc, index), 'wb')
+    try:
+        out.write('lobbyists-index %d %d %d\n' %
+                  (_index_version, size, scanner.prolog or 0))
+        for id, offset, length, year, type in scanner.entries:
+            out.write('%s\t%d\t%d\t%s\t%s\n' %
+                      (_encode_field(id), offset, length,
+                       _encode_field(year), _encode_field(type)))
+    finally:
+        out.close()
+    return len(scanner.entries)
+
+
+def _read_index(doc, index):
+    """Read a filing index.
+
+    Returns a pair: the size of the document's prolog, and a
+    dictionary mapping each filing ID to an (offset, length, Year,
+    Type) tuple.
+
+    Raises ValueError if the index isn't a filing index or doesn't
+    match the document's size.
+
+    """
+    path = _index_path(doc, index)
+    f = open(path, 'rb')
+    try:
+        header = f.readline().split()
+        if len(header) != 4 or header[0] != 'lobbyists-index' or \
+                int(header[1]) != _index_version:
+            raise ValueError('%s is not a filing index' % path)
+        if int(header[2]) != os.path.getsize(doc):
+            raise ValueError('%s is out of date' % path)
+        entries = dict()
+        for line in f:
+            id, offset, length, year, type = \
+                line.rstrip('\n').decode('utf-8').split('\t')
+            # Like import_filings, the first of several filings with
+            # the same ID wins.
+            entries.setdefault(id, (int(offset), int(length), year or None,
+                                    type or None))
+    finally:
+        f.close()
+    return (int(header[3]), entries)
+
+
+def read_filing_index(doc, index=None):
+    """Read the sidecar index of a lobbyist database.
+
+    doc, index - See index_filings.
+
+    Returns a dictionary mapping each filing ID in the document to an
+    (offset, length, Year, Type) tuple. The Year and Type are the
+    unparsed attribute values. This is handy for choosing filings to
+    pass to get_filings, e.g.:
+
+    [id for id, (offset, length, year, type) in entries.iteritems()
+     if year == u'2008']
+
+    Raises ValueError if the index doesn't match the document, e.g.,
+    because the document has changed since it was indexed.
+
+    """
+    return _read_index(doc, index)[1]
+
+
+def get_filings(doc, ids, backend='pulldom', records=False, index=None,
+                fields=None):
+    """Parse the filing records with the given IDs.
+
+    Only the requested Filing elements are read and parsed, using the
+    document's index (see index_filings).
+
+    doc - The filename of the database.
+
+    ids - An iterable of filing IDs.
+
+    backend, records, fields - See parse_filings.
+
+    index - The filename of the index. The default is the document's
+    filename with '.idx' appended.
+
+    Raises KeyError, before parsing any filings, if any of the IDs
+    isn't in the index, and ValueError if the index doesn't match the
+    document.
+
+    Yields the parsed filings in document order, not in the order of
+    ids. Duplicate IDs are only parsed once.
+
+    """
+    prolog_size, entries = _read_index(doc, index)
+    ranges = sorted(set(entries[id][:2] for id in ids))
+    f = open(doc, 'rb')
+    try:
+        starts = _FilingStarts(f)
+        f.seek(0)
+        prolog = f.read(prolog_size)
+        epilogue = _epilogue(prolog, starts)
+        for start, length in ranges:
+            for filing in _parse_range(f, prolog, start, length, epilogue,
+                                       backend, records, fields):
+                yield filing
+    finally:
+        f.close()
+
+
+def get_filing(doc, id, backend='pulldom', records=False, index=None,
+               fields=None):
+    """Parse the filing record with the given ID.
+
+    See get_filings. To parse more than one filing, call get_filings
+    rather than calling get_filing repeatedly, as each call reads the
+    whole index.
+
+    Raises KeyError if the ID isn't in the index.
+
+    Returns the parsed filing.
+
+    """
+    for filing in get_filings(doc, [id], backend, records, index, fields):
+        return filing
+
+
+# Resuming a partially parsed document.
+#
+# _parse_after parses the filings which follow the first n in a
+# document, so that load_db can resume loading a document from a
+# checkpoint. In an uncompressed document, the first n filings are
+# skipped by counting Filing start tags with _FilingStarts, as _chunks
+# does, and parsing begins at the next one. Compressed documents and
+# ZIP archive members can't be seeked, so they're parsed from the
+# start, but the sub-elements of the skipped filings aren't.
+
+_id_attr = re.compile(r'\sID\s*=\s*["\']([^"\']*)["\']')
+
+
+class _PrefixedFile(object):
+    """A file-like object which reads a string, then the rest of a file.
+
+    prefix - The string to read first.
+
+    f - The file object to read from once the prefix is exhausted.
+
+    """
+    def __init__(self, prefix, f):
+        self._prefix = prefix
+        self._f = f
+
+    def read(self, size=-1):
+        if not self._prefix:
+            return self._f.read(size)
+        if size < 0:
+            data = self._prefix + self._f.read()
+            self._prefix = ''
+        else:
+            data = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+        return data
+
+    def close(self):
+        self._f.close()
+
+
+class _Skipper(object):
+    """A where predicate which rejects the first n filings.
+
+    The ID of the nth filing is kept in the 'last_id' attribute.
+
+    """
+    def __init__(self, n):
+        self.n = n
+        self.count = 0
+        self.last_id = None
+
+    def __call__(self, attrs):
+        self.count += 1
+        if self.count == self.n:
+            self.last_id = attrs['id']
+        return self.count > self.n
+
+
+def _seek_filings(doc, n):
+    # Returns (the nth filing's ID, a _PrefixedFile which reads the
+    # document's prolog followed by the remaining filings, or None if
+    # there aren't any).
+    f = open(doc, 'rb')
+    try:
+        starts = _FilingStarts(f)
+        first = last = start = None
+        for i, offset in enumerate(starts.offsets(f)):
+            if i == 0:
+                first = offset
+            if i == n - 1:
+                last = offset
+            elif i == n:
+                start = offset
+                break
+        last_id = None
+        if last is not None:
+            f.seek(last)
+            # The block may end part way through a character.
+            decoder = codecs.getincrementaldecoder(starts.encoding)('replace')
+            tag = decoder.decode(f.read(_bufsize)).split(u'>', 1)[0]
+            match = _id_attr.search(tag)
+            last_id = match and match.group(1)
+        if start is None:
+            f.close()
+            return last_id, None
+        f.seek(0)
+        prolog = f.read(first)
+        f.seek(start)
+    except:
+        f.close()
+        raise
+    return last_id, _PrefixedFile(prolog, f)
+
+
+def _parse_after(doc, n, last_id, backend='pulldom'):
+    """Parse the filings in a lobbyist database which follow the first n.
+
+    doc - The document, as returned by split_documents.
+
+    n - The number of filings to skip.
+
+    last_id - The ID of the nth filing, which is checked to make sure
+    that the document hasn't changed since the first n filings were
+    parsed.
+
+    backend - See parse_filings.
+
+    Returns a generator of parsed filings, which raises ValueError
+    before yielding any if the nth filing's ID isn't last_id.
+
+    """
+    if isinstance(doc, basestring) and not doc.lower().endswith('.gz'):
+        found, rest = _seek_filings(doc, n)
+        try:
+            if found != last_id:
+                raise ValueError('%s has changed: filing %d is %r, not %r' %
+                                 (doc, n, found, last_id))
+            if rest is not None:
+                for filing in parse_filings(rest, backend):
+                    yield filing
+        finally:
+            if rest is not None:
+                rest.close()
+        return
+    skipper = _Skipper(n)
+    checked = False
+    for filing in parse_filings(doc, backend, where=skipper):
+        if not checked:
+            checked = True
+            if skipper.last_id != last_id:
+                break
+        yield filing
+    if skipper.last_id != last_id:
+        raise ValueError('%s has changed: filing %d is %r, not %r' %
+                         (doc, n, skipper.last_id, last_id))
+
+
+# Code to import parsed records into the database.
+
+# The columns of each entity table, other than its 'id' column. The
+# importers look up existing entities by matching all of these
+# columns, and insert new entities with the same values in the same
+# order.
+
+_entity_columns = {'client': ('country',
+                              'name',
+                              'ppb_country',
+                              'state',
+                              'ppb_state',
+                              'state_or_local_gov'),
+                   'registrant': ('country',
+                                  'senate_id',
+                                  'name',
+                                  'ppb_country'),
+                   'lobbyist': ('name',
+                                'indicator',
+                                'official_position'),
+                   'affiliated_org': ('name',
+                                      'country',
+                                      'ppb_country'),
+                   'foreign_entity': ('name',
+                                      'country',
+                                      'ppb_country')}
+
+_where_stmt = dict((table, '%s WHERE %s' %
+                    (table, ' AND '.join('%s=?' % col for col in columns)))
+                   for table, columns in _entity_columns.iteritems())
+
+
+def _entity_key(table, entity):
+    """The values of a parsed entity's columns in its database table.
+
+    table - The name of the entity's table (a string).
+
+    entity - The parsed entity, either a dictionary or a record.
+
+    Returns a tuple of values, in the order given by _entity_columns.
+
+    """
+    return tuple([entity[col] for col in _entity_columns[table]])
+
+
+def _filing_db_key(filing):
+    """Return a filing's database key."""
+    return filing['id']
+
+
+def _filing_id(record):
+    """Return the ID of a parsed filing dictionary or Filing record."""
+    if isinstance(record, Filing):
+        return record.id
+    else:
+        return record['filing']['id']
+
+
+# Entity rowid caching.
+#
+# The same clients, registrants and lobbyists recur in thousands of
+# filings, and looking each of them up in its table is the most
+# expensive part of importing a filing. An EntityCache remembers the
+# rowids of the entities which the importers have looked up or
+# inserted, keyed by table and _entity_key, so that most lookups
+# don't execute any SQL. The cache holds at most _entity_cache_size
+# entities; when it's full, the least recently used quarter of them
+# are evicted at once, which is much cheaper than maintaining an
+# exact LRU order on every hit.
+#
+# The cache also remembers which values it has inserted into the
+# lookup tables (country, state, org, person, url, issue_code and
+# govt_entity). Nearly every such INSERT is thrown away by the
+# table's ON CONFLICT IGNORE clause, so once a value is known to be
+# in its table, _insert_value doesn't execute the statement again.
+# Each table remembers at most _entity_cache_size values; once it's
+# full, new values are always inserted, as the intern pools do.
+#
+# A cached rowid or value is only valid as long as its row exists, so
+# rolling back must be reflected in the cache. import_filings
+# takes care of the per-filing savepoints; a caller which rolls back
+# its own transaction must clear the cache.
+
+_entity_cache_size = 100000
+
+_value_stmt = dict((table, 'INSERT INTO %s VALUES(?)' % table)
+                   for table in ['country', 'state', 'org', 'person', 'url',
+                                 'issue_code', 'govt_entity'])
+
+
+class EntityCache(object):
+    """A bounded cache of entity rowids, used by import_filings.
+
+    size - The maximum number of entities cached. If None (the
+    default), at most 100,000 are cached.
+
+    The 'hits' and 'misses' attributes count the lookups which were
+    and weren't answered by the cache, and 'evictions' counts the
+    entities evicted to make room for others. Likewise, 'value_hits'
+    and 'value_misses' count the lookup table values which were and
+    weren't known to be in their tables already.
+
+    The cache belongs to a single database connection. If that
+    connection's transaction is rolled back, call clear.
+
+    """
+    def __init__(self, size=None):
+        if size is None:
+            size = _entity_cache_size
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.value_hits = 0
+        self.value_misses = 0
+        self._entries = dict()
+        self._clock = 0
+        self._new = list()
+        self._values = dict((table, set()) for table in _value_stmt)
+        self._new_values = list()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, table, key):
+        """Return an entity's cached rowid, or None if it isn't cached.
+
+        table - The name of the entity's table (a string).
+
+        key - The entity's _entity_key.
+
+        """
+        entry = self._entries.get((table, key))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._clock += 1
+        entry[1] = self._clock
+        return entry[0]
+
+    def add(self, table, key, rowid, new=False):
+        """Cache an entity's rowid.
+
+        new - True if the entity was inserted since the last
+        savepoint, so that rollback_to_savepoint forgets it.
+
+        Entities with a None (NULL) column aren't cached, because
+        _rowid never finds them in the database, either.
+
+        """
+        if None in key:
+            return
+        if len(self._entries) >= self.size:
+            self._evict()
+        self._clock += 1
+        self._entries[(table, key)] = [rowid, self._clock]
+        if new:
+            self._new.append((table, key))
+
+    def _evict(self):
+        n = max(1, len(self._entries) // 4)
+        entries = self._entries
+        oldest = sorted(entries, key=lambda k: entries[k][1])[:n]
+        for k in oldest:
+            del entries[k]
+        self.evictions += len(oldest)
+
+    def add_value(self, table, value):
+        """Remember that a value has been inserted into a lookup table.
+
+        Returns False if the value was already known, or True if it
+        must be inserted.
+
+        """
+        values = self._values[table]
+        if value in values:
+            self.value_hits += 1
+            return False
+        self.value_misses += 1
+        if len(values) < self.size:
+            values.add(value)
+            self._new_values.append((table, value))
+        return True
+
+    def savepoint(self):
+        """Note that a savepoint is about to be taken."""
+        del self._new[:]
+        del self._new_values[:]
+
+    def rollback_to_savepoint(self):
+        """Forget the entities and values inserted since the last
+        savepoint."""
+        for k in self._new:
+            self._entries.pop(k, None)
+        for table, value in self._new_values:
+            self._values[table].discard(value)
+        del self._new[:]
+        del self._new_values[:]
+
+    def clear(self):
+        """Forget every cached entity and value, but keep the
+        statistics."""
+        self._entries.clear()
+        for values in self._values.itervalues():
+            values.clear()
+        del self._new[:]
+        del self._new_values[:]
+
+    def stats(self):
+        return {'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'values': sum(len(x) for x in self._values.itervalues()),
+                'value_hits': self.value_hits,
+                'value_misses': self.value_misses}
+
+
+def _rowid(table, tomatch, cur, cache=None):
+    """Find a match in a database table and return its rowid.
+
+    This function only works for tables with a primary key
+    auto-increment column named 'id'.
+
+    table - The name of the table to search (a string).
+
+    tomatch - A tuple of the values to match in the table, one for
+    each column in _entity_columns[table] (see _entity_key).
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    cache - If not None, an EntityCache which is consulted before the
+    table, and which remembers the match.
+
+    Returns the rowid of the matching row, or None if no match is
+    found.
+
+    """
+    if cache is not None:
+        db_key = cache.get(table, tomatch)
+        if db_key is not None:
+            return db_key
+    stmt = 'SELECT id FROM %s' % _where_stmt[table]
+    cur.execute(stmt, tomatch)
+    row = cur.fetchone()
+    if row:
+        if cache is not None:
+            cache.add(table, tomatch, row[0])
+        return row[0]
+    else:
+        return None
+
+
+def _insert_value(table, value, cur, cache=None):
+    """Insert a value into a lookup table, unless it's already there.
+
+    table - The name of the lookup table (a string).
+
+    value - The value to insert.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    cache - If not None, an EntityCache which remembers the values
+    already inserted. None (NULL) values are always inserted, since
+    they never conflict with the table's existing values.
+
+    """
+    if cache is None or value is None or cache.add_value(table, value):
+        cur.execute(_value_stmt[table], [value])
+
+
+# Batched writes.
+#
+# Every filing adds rows to the tables which link filings to their
+# sub-elements, one INSERT per row. Nothing reads those tables while
+# filings are being imported, and no other row refers to theirs, so
+# import_filings can defer them: given a batch_size, it imports each
+# filing's sub-elements through a _BatchedCursor, which buffers the
+# link tables' rows per table and writes each table's buffer with a
+# single executemany after every batch_size filings, and when the
+# import is done. The entity, lookup and filing tables are still
+# written immediately, so entity rowids are resolved exactly as
+# before. A failed filing's buffered rows are simply discarded.
+#
+# The buffer is kept as cheap as possible, since it's called for
+# each row: pysqlite's executemany saves only about a microsecond
+# per row over execute, and a Python method call costs nearly as
+# much.
+#
+# A deferred row which can't be written fails the whole flush, not
+# just its filing. Parsed filings can't produce such rows: each
+# filing's ID is new, and its entity rowids exist.
+
+_write_batch_size = 100
+
+_link_stmt = {'filing_registrant':
+                  'INSERT INTO filing_registrant VALUES(?, ?, ?, ?)',
+              'filing_client':
+                  'INSERT INTO filing_client VALUES(?, ?, ?, ?, ?, ?)',
+              'filing_lobbyists':
+                  'INSERT INTO filing_lobbyists VALUES(?, ?, ?)',
+              'filing_govt_entities':
+                  'INSERT INTO filing_govt_entities VALUES(?, ?)',
+              'filing_issues':
+                  'INSERT INTO filing_issues VALUES(?, ?)',
+              'filing_affiliated_orgs':
+                  'INSERT INTO filing_affiliated_orgs VALUES(?, ?, ?)',
+              'filing_foreign_entities':
+                  'INSERT INTO filing_foreign_entities VALUES(?, ?, ?, ?, ?)'}
+
+
+class _BatchedCursor(object):
+    """A cursor which buffers the link tables' INSERTs.
+
+    cur - The DB API 2.0-compliant database cursor which executes
+    every other statement, and writes the buffered rows.
+
+    """
+    def __init__(self, cur):
+        self.cur = cur
+        self._rows = dict((stmt, list()) for stmt in _link_stmt.itervalues())
+
+    @property
+    def lastrowid(self):
+        return self.cur.lastrowid
+
+    def execute(self, stmt, params=()):
+        rows = self._rows.get(stmt)
+        if rows is None:
+            return self.cur.execute(stmt, params)
+        rows.append(params)
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+    def discard(self, id):
+        """Discard the buffered rows of the filing with the given ID.
+
+        They're the last rows in each buffer, since the filing was
+        the last one imported.
+
+        """
+        for rows in self._rows.itervalues():
+            while rows and rows[-1][0] == id:
+                rows.pop()
+
+    def flush(self):
+        """Write the buffered rows."""
+        for stmt, rows in self._rows.iteritems():
+            if rows:
+                self.cur.executemany(stmt, rows)
+                del rows[:]
+
+
+def _import_client(client, filing, cur, cache=None):
+    """Import a client into the database.
+
+    Returns nothing.
+
+    Side-effects: may insert rows into the 'client', 'country',
+    'state', 'org' and 'filing_client' tables.
+
+    client - The parsed client dictionary.
+
+    filing - The parsed filing dictionary with which the client is
+    associated.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    cache - An EntityCache, or None.
+
+    """
+    values = _entity_key('client', client)
+    db_key = _rowid('client', values, cur, cache)
+    if db_key is None:
+        # Note - client status is pre-inserted into client_status table.
+        for key in ['country', 'ppb_country']:
+            _insert_value('country', client[key], cur, cache)
+        for key in ['state', 'ppb_state']:
+            _insert_value('state', client[key], cur, cache)
+        _insert_value('person', client['contact_name'], cur, cache)
+        _insert_value('org', client['name'], cur, cache)
+        cur.execute('INSERT INTO client VALUES(NULL, ?, ?, ?, ?, ?, ?)',
+                    values)
+        db_key = cur.lastrowid
+        if cache is not None:
+            cache.add('client', values, db_key, True)
+    cur.execute(_link_stmt['filing_client'],
+                [_filing_db_key(filing),
+                 db_key,
+                 client['senate_id'],
+                 client['status'],
+                 client['contact_name'],
+                 client['description']])
+
+
+def _import_registrant(reg, filing, cur, cache=None):
+    """Import a registrant into the database.
+
+    Returns nothing.
+
+    Side-effects: may insert rows into the 'registrant', 'country',
+    'org' and 'filing_registrant' tables.
+
+    reg - The parsed registrant dictionary.
+
+    filing - The parsed filing dictionary with which the registrant is
+    associated.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    cache - An EntityCache, or None.
+
+    """
+    values = _entity_key('registrant', reg)
+    db_key = _rowid('registrant', values, cur, cache)
+    if db_key is None:
+        _insert_value('country', reg['country'], cur, cache)
+        _insert_value('country', reg['ppb_country'], cur, cache)
+        _insert_value('org', reg['name'], cur, cache)
+        cur.execute('INSERT INTO registrant VALUES(NULL, ?, ?, ?, ?)', values)
+        db_key = cur.lastrowid
+        if cache is not None:
+            cache.add('registrant', values, db_key, True)
+    cur.execute(_link_stmt['filing_registrant'],
+                [_filing_db_key(filing),
+                 db_key,
+                 reg['address'],
+                 reg['description']])
+
+
+def _import_lobbyist(lobbyist, filing, cur, cache=None):
+    """Import a lobbyist into the database.
+
+    Returns nothing.
+
+    Side-effects: may insert rows into the 'lobbyist', 'person' and
+    'filing_lobbyists' tables.
+
+    lobbyist - The parsed lobbyist dictionary.
+
+    filing - The parsed filing dictionary with which the lobbyist is
+    associated.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    cache - An EntityCache, or None.
+
+    """
+    values = _entity_key('lobbyist', lobbyist)
+    db_key = _rowid('lobbyist', values, cur, cache)
+    if db_key is None:
+        # Note - lobbyist status and indicator are pre-inserted into the
+        # lobbyist_status and lobbyist_indicator tables.
+        _insert_value('person', lobbyist['name'], cur, cache)
+        cur.execute('INSERT INTO lobbyist VALUES(NULL, ?, ?, ?)', values)
+        db_key = cur.lastrowid
+        if cache is not None:
+            cache.add('lobbyist', values, db_key, True)
+    cur.execute(_link_stmt['filing_lobbyists'],
+                [_filing_db_key(filing), db_key, lobbyist['status']])
+
+
+def _import_govt_entity(entity, filing, cur, cache=None):
+    """Import a government entity into the database.
+
+    Returns nothing.
+
+    Side-effects: may insert rows into the 'govt_entity' and
+    'filing_govt_entities' tables.
+
+    entity - The parsed government entity dictionary.
+
+    filing - The parsed filing dictionary with which the government
+    entity is associated.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    cache - An EntityCache, or None.
+
+    """
+    db_key = entity['name']
+    _insert_value('govt_entity', db_key, cur, cache)
+    cur.execute(_link_stmt['filing_govt_entities'],
+                [_filing_db_key(filing), db_key])
+
+
+def _import_issue(issue, filing, cur, cache=None):
+    """Import an issue into the database.
+
+    Returns nothing.
+
+    Side-effects: may insert rows into the 'issue', 'issue_code' and
+    'filing_issues' tables.
+
+    issue - The parsed issue dictionary.
+
+    filing - The parsed filing dictionary with which the issue is
+    associated.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    cache - An EntityCache, or None.
+
+    """
+    _insert_value('issue_code', issue['code'], cur, cache)
+    cur.execute('INSERT INTO issue VALUES(NULL, ?, ?)',
+                [issue['code'], issue['specific_issue']])
+    db_key = cur.lastrowid
+    cur.execute(_link_stmt['filing_issues'],
+                [_filing_db_key(filing), db_key])
+
+
+def _import_affiliated_org(org, filing, cur, cache=None):
+    """Import an affiliated org into the database.
+
+    Returns nothing.
+    
+    Side-effects: may insert rows into the 'affiliated_org',
+    'country', 'org', 'filing_affiliated_orgs', and 'url' tables.
+
+    org - The parsed org dictionary.
+
+    filing - The parsed filing dictionary with which the org is
+    associated.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    cache - An EntityCache, or None.
+
+    """
+    values = _entity_key('affiliated_org', org)
+    db_key = _rowid('affiliated_org', values, cur, cache)
+    if db_key is None:
+        for key in ['country', 'ppb_country']:
+            _insert_value('country', org[key], cur, cache)
+        _insert_value('org', org['name'], cur, cache)
+        cur.execute('INSERT INTO affiliated_org VALUES(NULL, ?, ?, ?)', values)
+        db_key = cur.lastrowid
+        if cache is not None:
+            cache.add('affiliated_org', values, db_key, True)
+    url = filing['affiliated_orgs_url']
+    _insert_value('url', url, cur, cache)
+    cur.execute(_link_stmt['filing_affiliated_orgs'],
+                [_filing_db_key(filing), db_key, url])
+
+
+def _import_foreign_entity(entity, filing, cur, cache=None):
+    """Import a foreign entity into the database.
+
+    Returns nothing.
+
+    Side-effects: may insert rows into the 'foreign_entity',
+    'country', 'org' and 'filing_foreign_entities' tables.
+
+    entity - The parsed foreign entity dictionary.
+
+    filing - The parsed filing dictionary with which the foreign
+    entity is associated.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    cache - An EntityCache, or None.
+
+    """
+    values = _entity_key('foreign_entity', entity)
+    db_key = _rowid('foreign_entity', values, cur, cache)
     if db_key is None:
         for key in ['country', 'ppb_country']:
-            cur.execute('INSERT INTO country VALUES(?)', [entity[key]])
-        cur.execute('INSERT INTO org VALUES(?)', [entity['name']])
-        cur.execute('INSERT INTO foreign_entity VALUES(NULL, '
-                    ':name, :country, :ppb_country)',
-                    entity)
+            _insert_value('country', entity[key], cur, cache)
+        _insert_value('org', entity['name'], cur, cache)
+        cur.execute('INSERT INTO foreign_entity VALUES(NULL, ?, ?, ?)', values)
         db_key = cur.lastrowid
-    cur.execute('INSERT INTO filing_foreign_entities VALUES(?, ?, ?, ?, ?)',
+        if cache is not None:
+            cache.add('foreign_entity', values, db_key, True)
+    cur.execute(_link_stmt['filing_foreign_entities'],
                 [_filing_db_key(filing),
                  db_key,
                  entity['contribution'],
@@ -769,24 +2881,31 @@ def _import_foreign_entity(entity, filing, cur):
                  entity['status']])
                  
 
-def _import_filing(filing, cur):
+def _import_filing(filing, cur, hash=None):
     """Import a filing into the database.
 
     Returns nothing.
 
     Side-effects: inserts a row into the 'filing' table.
     
-    filing - The parsed filing dictionary.
+    filing - The parsed filing dictionary, or Filing record.
 
     cur - The DB API 2.0-compliant database cursor.
 
+    hash - The filing's content hash (see filing_hash).
+
     """
     # The affiliated orgs URL is a special case. It's associated with
     # each affiliated org in the record, so it's handled by the
     # affiliated org importer, and we skip it here.
-    cur.execute('INSERT INTO filing VALUES('
-                ':id, :type, :year, :period, :filing_date, :amount)',
-                filing)
+    cur.execute('INSERT INTO filing VALUES(?, ?, ?, ?, ?, ?, ?)',
+                [filing['id'],
+                 filing['type'],
+                 filing['year'],
+                 filing['period'],
+                 filing['filing_date'],
+                 filing['amount'],
+                 hash])
 
 
 _list_importers = {'lobbyist': _import_lobbyist,
@@ -796,7 +2915,7 @@ _list_importers = {'lobbyist': _import_lobbyist,
                    'foreign_entity': _import_foreign_entity}
 
 
-def _import_list(entities, filing, cur):
+def _import_list(entities, filing, cur, cache=None):
     """Import a list of parsed entities into the database.
 
     Returns nothing.
@@ -810,14 +2929,20 @@ def _import_list(entities, filing, cur):
 
     cur - The DB API 2.0-compliant database cursor.
 
+    cache - An EntityCache, or None.
+
     """
     def entity_id(entities):
         # What kind of list is this? lobbyists? issues? etc.
         return entities[0].keys()[0]
+    # An empty list element, e.g., <Lobbyists></Lobbyists>, has
+    # nothing to import.
+    if not entities:
+        return
     id = entity_id(entities)
     importer = _list_importers[id]
     for entity in entities:
-        importer(entity[id], filing, cur)
+        importer(entity[id], filing, cur, cache)
 
 
 # Doesn't include an importer for 'filing'; that one is special.
@@ -831,7 +2956,413 @@ _entity_importers = [('registrant', _import_registrant),
                      ('foreign_entities', _import_list)]
 
 
-def import_filings(cur, parsed_filings):
+def _import_dict_entities(record, cur, cache=None):
+    """Import a parsed filing dictionary's sub-elements into the database.
+
+    The filing itself must already have been imported by _import_filing.
+
+    """
+    filing = record['filing']
+    for entity_name, entity_importer in _entity_importers:
+        if entity_name in record:
+            entity_importer(record[entity_name], filing, cur, cache)
+
+
+# The equivalent of _entity_importers for Filing records. Singleton
+# sub-elements which are None are skipped.
+
+_record_importers = [('registrant', _import_registrant),
+                     ('client', _import_client)]
+
+_record_list_importers = [('lobbyists', _import_lobbyist),
+                          ('govt_entities', _import_govt_entity),
+                          ('issues', _import_issue),
+                          ('affiliated_orgs', _import_affiliated_org),
+                          ('foreign_entities', _import_foreign_entity)]
+
+
+def _import_record_entities(filing, cur, cache=None):
+    """Import a parsed Filing record's sub-elements into the database.
+
+    The filing itself must already have been imported by _import_filing.
+
+    """
+    for entity_name, entity_importer in _record_importers:
+        entity = getattr(filing, entity_name)
+        if entity is not None:
+            entity_importer(entity, filing, cur, cache)
+    for entity_name, entity_importer in _record_list_importers:
+        for entity in getattr(filing, entity_name):
+            entity_importer(entity, filing, cur, cache)
+
+
+# Duplicate filings.
+#
+# The Senate's documents contain thousands of filings whose IDs
+# duplicate those of earlier filings. Nearly all of them are
+# identical copies, but not all. Each filing's content hash is
+# stored with it in the filing table, so when a filing's ID is
+# already in the database, a single lookup tells whether it's an
+# identical duplicate, which is skipped, or a conflicting one, which
+# is recorded in the filing_conflict table along with the stored
+# version. The hash is computed from a canonical form of the filing
+# which is the same for dictionaries and records, and for every
+# parser backend.
+#
+# The stored version's canonical form is read back from the
+# database. The database doesn't keep everything a parsed filing
+# holds: repeated lobbyists, government entities and affiliated orgs
+# are stored once, and a filing's affiliated orgs URL is only stored
+# with its affiliated orgs. So the stored version's content is as the
+# database has it, and its hash is the one stored with it.
+
+def _getter(make_getter, names):
+    """A function which returns a tuple of the named values of its argument.
+
+    make_getter - operator.attrgetter or operator.itemgetter.
+
+    """
+    if len(names) == 1:
+        getter = make_getter(names[0])
+        return lambda x: (getter(x),)
+    return make_getter(*names)
+
+
+def _content_getters(names):
+    # Returns a pair of getters for the named attribute values, in
+    # order: one for records and one for dictionaries.
+    return (_getter(operator.attrgetter, names),
+            _getter(operator.itemgetter, names))
+
+
+_filing_content_getters = _content_getters(_slots(_filing_attrs))
+
+_content_singleton_classes = [('registrant', Registrant),
+                              ('client', Client)]
+
+_content_list_classes = [('lobbyists', Lobbyist),
+                         ('govt_entities', GovtEntity),
+                         ('issues', Issue),
+                         ('foreign_entities', ForeignEntity),
+                         ('affiliated_orgs', AffiliatedOrg)]
+
+_content_singletons = list((key, _content_getters(cls.__slots__))
+                           for key, cls in _content_singleton_classes)
+
+_content_lists = list((key, _content_getters(cls.__slots__))
+                      for key, cls in _content_list_classes)
+
+# The tables from which each of a stored filing's sub-elements are
+# read back: the link table, the entity table, and the link table's
+# column which refers to the entity. Government entities are read
+# from their link table alone.
+
+_stored_tables = {'registrant': ('filing_registrant', 'registrant',
+                                 'registrant'),
+                  'client': ('filing_client', 'client', 'client'),
+                  'lobbyists': ('filing_lobbyists', 'lobbyist', 'lobbyist'),
+                  'issues': ('filing_issues', 'issue', 'issue'),
+                  'foreign_entities': ('filing_foreign_entities',
+                                       'foreign_entity', 'foreign_entity'),
+                  'affiliated_orgs': ('filing_affiliated_orgs',
+                                      'affiliated_org', 'org')}
+
+_stored_filing_columns = ', '.join(
+    col != 'affiliated_orgs_url' and col or
+    '(SELECT url FROM filing_affiliated_orgs WHERE filing=filing.id '
+    'ORDER BY rowid LIMIT 1)'
+    for col in _slots(_filing_attrs))
+
+_duplicates = {'identical': 0, 'conflicting': 0}
+
+
+def _utf8(values):
+    # The etree backend parses ASCII values as byte strings, and the
+    # others as unicode strings, so encode them all the same way.
+    return tuple([value.encode('utf-8') if value.__class__ is unicode
+                  else value for value in values])
+
+
+def _filing_content(filing):
+    """The canonical form of a parsed filing's contents.
+
+    filing - The parsed filing dictionary, or Filing record.
+
+    Returns nested tuples of the values of the filing's attributes
+    and those of its sub-elements, in a fixed order. Missing
+    singleton sub-elements are None, and missing lists are empty.
+
+    """
+    if isinstance(filing, Filing):
+        content = [_utf8(_filing_content_getters[0](filing))]
+        for key, getters in _content_singletons:
+            entity = filing[key]
+            content.append(_utf8(getters[0](entity))
+                           if entity is not None else None)
+        for key, getters in _content_lists:
+            get = getters[0]
+            content.append(tuple([_utf8(get(entity))
+                                  for entity in filing[key]]))
+    else:
+        content = [_utf8(_filing_content_getters[1](filing['filing']))]
+        for key, getters in _content_singletons:
+            entity = filing.get(key)
+            content.append(_utf8(getters[1](entity))
+                           if entity is not None else None)
+        for key, getters in _content_lists:
+            get = getters[1]
+            content.append(tuple([_utf8(get(item.itervalues().next()))
+                                  for item in filing.get(key, ())]))
+    return tuple(content)
+
+
+def _stored_rows(cur, key, id, columns):
+    # The canonical forms of a stored filing's sub-elements of one
+    # kind, in the order in which they were imported.
+    if key == 'govt_entities':
+        cur.execute('SELECT govt_entity FROM filing_govt_entities '
+                    'WHERE filing=? ORDER BY rowid', [id])
+    else:
+        link, table, ref = _stored_tables[key]
+        cur.execute('SELECT %s FROM %s JOIN %s ON %s.id = %s.%s '
+                    'WHERE filing=? ORDER BY %s.rowid' %
+                    (', '.join(columns), link, table, table, link, ref,
+                     link), [id])
+    return [_utf8(row) for row in cur.fetchall()]
+
+
+def _stored_content(cur, id):
+    """The canonical form of a filing as stored in the database.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    id - The filing's ID.
+
+    Returns nested tuples in the same form as _filing_content, or
+    None if the filing isn't in the database. See the comment on
+    duplicate filings for what can't be read back.
+
+    """
+    cur.execute('SELECT %s FROM filing WHERE id=?' % _stored_filing_columns,
+                [id])
+    row = cur.fetchone()
+    if row is None:
+        return None
+    content = [_utf8(row)]
+    for key, cls in _content_singleton_classes:
+        rows = _stored_rows(cur, key, id, cls.__slots__)
+        content.append(rows and rows[0] or None)
+    for key, cls in _content_list_classes:
+        content.append(tuple(_stored_rows(cur, key, id, cls.__slots__)))
+    return tuple(content)
+
+
+def filing_hash(filing):
+    """Return the content hash of a parsed filing.
+
+    Filings with the same attributes and sub-elements (in the same
+    order) have the same hash, whether they're dictionaries or
+    records, and whichever parser backend parsed them.
+
+    filing - The parsed filing dictionary, or Filing record.
+
+    Returns the SHA-1 hash of the filing's contents, in hex.
+
+    """
+    return hashlib.sha1(repr(_filing_content(filing))).hexdigest()
+
+
+def duplicate_stats():
+    """Return statistics for the duplicate filings seen by import_filings.
+
+    Returns a dictionary with two keys: 'identical', the number of
+    filings which were skipped because a filing with the same ID and
+    contents was already in the database; and 'conflicting', the
+    number whose contents differed, which were recorded in the
+    filing_conflict table, along with the filings already in the
+    database.
+
+    """
+    return dict(_duplicates)
+
+
+def clear_duplicate_stats():
+    """Reset the statistics reported by duplicate_stats.
+
+    Returns nothing.
+
+    """
+    for key in _duplicates:
+        _duplicates[key] = 0
+
+
+def _is_conflict(hash, existing):
+    """Count a duplicate filing; return True if it's a conflicting one.
+
+    existing - The content hash of the filing already imported.
+
+    """
+    if existing == hash:
+        _duplicates['identical'] += 1
+        return False
+    _duplicates['conflicting'] += 1
+    return True
+
+
+def _record_conflict(cur, id, existing, hash, content):
+    """Record both versions of a conflicting filing.
+
+    The stored version, whose content hash is existing, is read back
+    from the database (see _stored_content). The other version's
+    content hash is hash, and its canonical form is content. Versions
+    which are already in the filing_conflict table are ignored.
+
+    """
+    cur.execute('INSERT INTO filing_conflict VALUES(?, ?, ?)',
+                [id, existing, repr(_stored_content(cur, id))])
+    cur.execute('INSERT INTO filing_conflict VALUES(?, ?, ?)',
+                [id, hash, repr(content)])
+
+
+def _duplicate(cur, filing, id, hash, existing):
+    """Classify a filing whose ID is already in the database.
+
+    existing - The content hash of the filing already in the database.
+
+    Conflicting filings are recorded in the filing_conflict table,
+    along with the filing already in the database.
+
+    """
+    if _is_conflict(hash, existing):
+        _record_conflict(cur, id, existing, hash, _filing_content(filing))
+
+
+def _has_hash(cur):
+    """Return True if the database's filing table has a hash column."""
+    cur.execute('PRAGMA table_info(filing)')
+    return 'hash' in [row[1] for row in cur.fetchall()]
+
+
+def _check_hash(cur):
+    """Raise ValueError unless the database has been upgraded."""
+    if not _has_hash(cur):
+        raise ValueError('the filing table has no hash column; the database '
+                         'was created by an earlier version, and must be '
+                         'upgraded with upgrade_db first')
+
+
+def _existing_hash(cur, id):
+    # Returns (True, hash) if the ID is in the filing table.
+    cur.execute('SELECT hash FROM filing WHERE id=?', [id])
+    row = cur.fetchone()
+    if row is None:
+        return False, None
+    return True, row[0]
+
+
+# Per-filing atomicity.
+#
+# import_filings imports each filing inside a SAVEPOINT, which is
+# released once all of the filing's sub-elements have been imported,
+# or rolled back if any of them fails, so that a filing is either
+# imported completely or not at all, however large the enclosing
+# transaction. However, Python's sqlite3 module commits the open
+# transaction before executing any statement other than SELECT,
+# INSERT, UPDATE, DELETE or REPLACE, including SAVEPOINT, unless the
+# connection's isolation_level is None, in which case the caller
+# manages transactions itself (as load_db does). On other
+# connections, a failed filing's rows are deleted from the filing
+# table, the tables which link filings to their sub-elements, and the
+# issue table (whose rows belong to a single filing) instead. The
+# other entities and lookup values it added are left in place;
+# they're shared by all filings, so they don't make the database
+# inconsistent.
+
+_filing_link_tables = ['filing_registrant',
+                       'filing_client',
+                       'filing_lobbyists',
+                       'filing_govt_entities',
+                       'filing_issues',
+                       'filing_affiliated_orgs',
+                       'filing_foreign_entities']
+
+
+def _savepoints(cur):
+    """Return True if savepoints can be used with a cursor's connection."""
+    con = getattr(cur, 'connection', None)
+    return getattr(con, 'isolation_level', '') is None
+
+
+def _delete_filing(cur, id):
+    """Delete a filing, its issues and its links to its sub-elements."""
+    cur.execute('DELETE FROM issue WHERE id IN '
+                '(SELECT issue FROM filing_issues WHERE filing=?)', [id])
+    for table in _filing_link_tables:
+        cur.execute('DELETE FROM %s WHERE filing=?' % table, [id])
+    cur.execute('DELETE FROM filing WHERE id=?', [id])
+
+
+class FilingIDs(object):
+    """A set of filing IDs, used by import_filings to skip known filings.
+
+    Filing IDs are GUIDs, which are kept as 16-byte strings rather
+    than as unicode strings, so a set of all the IDs in a large
+    database fits comfortably in memory. Other IDs are kept as they
+    are. The content hash of each filing is kept with its ID, so that
+    skipped filings can still be classified as identical or
+    conflicting duplicates.
+
+    cur - If given, the set is filled with the IDs of the filings
+    already in the database, using this DB API 2.0-compliant database
+    cursor.
+
+    The 'skipped' attribute counts the filings which import_filings
+    has skipped because their IDs were in the set.
+
+    """
+    # Only GUIDs in canonical form map to the compact key, since the
+    # database distinguishes IDs which differ in case.
+    _guid = re.compile(r'[0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-'
+                       r'[0-9A-F]{12}\Z')
+
+    def __init__(self, cur=None):
+        self._ids = dict()
+        self.skipped = 0
+        if cur is not None:
+            cur.execute('SELECT id, hash FROM filing')
+            for row in cur:
+                self.add(row[0], row[1])
+
+    def _key(self, id):
+        if id is not None and self._guid.match(id):
+            return binascii.unhexlify(id.replace('-', ''))
+        return (id,)
+
+    def add(self, id, hash=None):
+        """Add a filing ID, with the filing's content hash if known."""
+        if hash is not None:
+            hash = binascii.unhexlify(hash)
+        self._ids[self._key(id)] = hash
+
+    def hash_of(self, id):
+        """Return the content hash of the filing with the given ID.
+
+        Returns None if the hash isn't known. Raises KeyError if the
+        ID isn't in the set.
+
+        """
+        hash = self._ids[self._key(id)]
+        return hash and binascii.hexlify(hash)
+
+    def __contains__(self, id):
+        return self._key(id) in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def import_filings(cur, parsed_filings, known=None, cache=None,
+                   batch_size=None, check=True):
     """Import parsed filings into the database.
 
     The database is assumed to have a particular schema; the create_db
@@ -839,10 +3370,54 @@ def import_filings(cur, parsed_filings):
 
     cur - The DB API 2.0-compliant database cursor.
 
-    parsed_filings - A sequence of parsed filings.
+    parsed_filings - A sequence of parsed filings, either
+    dictionaries or Filing records (see parse_filings).
+
+    known - If given, a FilingIDs set. Filings whose IDs are in the
+    set are skipped (and counted in its 'skipped' attribute) before
+    any SQL is executed, and the IDs of imported filings are added to
+    it. Pass FilingIDs(cur) to skip the filings which are already in
+    the database, rather than failing to import each of them.
+
+    cache - If given, an EntityCache in which the rowids of the
+    entities (clients, registrants, lobbyists, affiliated orgs and
+    foreign entities) which are looked up or inserted are cached, so
+    that entities which recur in later filings needn't be looked up
+    in the database again. The cache must only be used with this
+    cursor's connection.
+
+    batch_size - If not None, the rows of the tables which link
+    filings to their sub-elements are buffered, and each table's rows
+    are written with a single executemany call after every
+    batch_size filings, and after the last one. Other rows are
+    written immediately.
+
+    check - If True (the default), make sure that the database has
+    been upgraded (see upgrade_db) before importing anything. Callers
+    which import many batches of filings into a database which
+    they've already checked or upgraded can pass False to skip the
+    check.
+
+    Each filing's content hash (see filing_hash) is stored with it.
+    A filing whose ID is already in the database isn't imported: if
+    its contents are identical to the existing filing's, it's
+    skipped, and otherwise both versions are recorded in the
+    filing_conflict table. See duplicate_stats. Skipped filings are
+    classified the same way, if their hash is in the known set.
+
+    Each filing is imported atomically: if any of its sub-elements
+    can't be imported, none of it is. If the cursor's connection is
+    an sqlite3 connection whose isolation_level is None, this is done
+    with a SAVEPOINT per filing, and the caller is responsible for
+    beginning and committing the enclosing transaction. Otherwise,
+    the failed filing's rows and issues are deleted, and the other
+    entities it added are left in place.
 
     Returns the cursor.
 
+    Raises ValueError if check is True and the database was created
+    by an earlier version and hasn't been upgraded (see upgrade_db).
+
     SG: Added exception to handle failed inserts, typically due to duplicated records.
     There are thousands of duplicate records. I've counted over 4000.
     I called the Senate Office and they explained that they never change their files 
@@ -851,23 +3426,499 @@ def import_filings(cur, parsed_filings):
     Just check.
     A random sampling of these duplicates suggests strongly they are all identical. 
     Therefore, in order to parse the data without checking every one to see if it identical, this quick fix is added.
-    Hopefully, someone will add some more elaborate code to check if the records are perfectly identical instead of 
-    merely throwing a warning.
+    Duplicates are now compared by their content hash instead: identical
+    ones are skipped silently, and both versions of conflicting ones are
+    recorded in the filing_conflict table.
     """
+    if check:
+        _check_hash(cur)
+    savepoints = _savepoints(cur)
+    batched = None
+    if batch_size:
+        batched = _BatchedCursor(cur)
+        buffered = 0
     for record in parsed_filings:
+        id = _filing_id(record)
+        hash = filing_hash(record)
+        if known is not None and id in known:
+            known.skipped += 1
+            existing = known.hash_of(id)
+            if existing is not None:
+                if batched is not None:
+                    # The stored filing's links may still be buffered.
+                    batched.flush()
+                _duplicate(cur, record, id, hash, existing)
+            continue
+        if isinstance(record, Filing):
+            filing, import_entities = record, _import_record_entities
+        else:
+            filing, import_entities = record['filing'], _import_dict_entities
+        if savepoints:
+            cur.execute('SAVEPOINT import_filing')
+        if cache is not None:
+            cache.savepoint()
+        try:
+            _import_filing(filing, cur, hash)
+        except:
+            # Nothing has been imported yet, so there's nothing to
+            # roll back.
+            if savepoints:
+                cur.execute('RELEASE import_filing')
+            exists, existing = _existing_hash(cur, id)
+            if exists and existing is not None:
+                if batched is not None:
+                    batched.flush()
+                _duplicate(cur, record, id, hash, existing)
+            else:
+                print 'WARNING: problem with this filing, typically b/c it is an identical duplicate:'
+                print id
+            continue
         try:
-            filing = record['filing']
-            _import_filing(filing, cur)
-            for entity_name, entity_importer in _entity_importers:
-                if entity_name in record:
-                    entity_importer(record[entity_name], filing, cur)
+            import_entities(record, batched or cur, cache)
         except:
-            print 'WARNING: problem with this filing, typically b/c it is an identical duplicate:'
-            print record['filing']['id']
+            if savepoints:
+                if batched is not None:
+                    batched.discard(id)
+                cur.execute('ROLLBACK TO import_filing')
+                cur.execute('RELEASE import_filing')
+                if cache is not None:
+                    cache.rollback_to_savepoint()
+            else:
+                # Write the filing's buffered links, so that its
+                # issues can be found and deleted with it.
+                if batched is not None:
+                    batched.flush()
+                _delete_filing(cur, id)
+            print 'WARNING: problem with this filing\'s sub-elements, ' \
+                'so it wasn\'t imported:'
+            print id
+            continue
+        if savepoints:
+            cur.execute('RELEASE import_filing')
+        if known is not None:
+            known.add(id, hash)
+        if batched is not None:
+            buffered += 1
+            if buffered == batch_size:
+                batched.flush()
+                buffered = 0
+    if batched is not None:
+        batched.flush()
+    return cur
+
+
+def import_filings_batched(cur, batches, known=None, cache=None,
+                           batch_size=None):
+    """Import batches of parsed filings into the database.
+
+    cur - The DB API 2.0-compliant database cursor.
+
+    batches - A sequence of lists of parsed filings, e.g. from
+    parse_filings_batched. The filings are imported in order, and the
+    database is the same as the one import_filings would build.
+
+    known, cache - See import_filings.
+
+    batch_size - If None (the default), the rows of the tables which
+    link filings to their sub-elements are buffered for each batch,
+    and each table's rows are written with a single executemany call
+    at the end of the batch. Otherwise, see import_filings.
+
+    The database's schema is checked once, rather than for each
+    batch.
+
+    Returns the cursor.
+
+    Raises ValueError, before importing anything, if the database
+    hasn't been upgraded (see upgrade_db).
+
+    """
+    _check_hash(cur)
+    for batch in batches:
+        import_filings(cur, batch, known, cache, batch_size or len(batch),
+                       False)
     return cur
 
 
-def create_db(con):
+# Bulk loading.
+#
+# import_filings resolves each entity as it's imported, by looking it
+# up in its table's unique index, which is too slow for rebuilding a
+# database from the Senate's whole archive. A BulkLoader loads an
+# empty database in two phases instead. First, stage appends the raw
+# rows of each filing and its sub-elements to unindexed temporary
+# staging tables (one per kind of sub-element) with executemany, and
+# looks nothing up. Then finish resolves the entities with set-based
+# SQL: each entity table is filled by a single INSERT ... SELECT over
+# the distinct rows of its staging table, the lookup tables are
+# filled from the same rows, and the tables which link filings to
+# their sub-elements are filled by joining the staging tables with
+# the entity tables.
+#
+# Every staged row has a sequence number, in the order in which
+# import_filings would have imported it, and each table is filled in
+# that order, so the database is identical to the one import_filings
+# would build from the same filings, rowids and all. As in _rowid,
+# NULL columns never match, so an entity with a NULL column is a new
+# entity at each of its occurrences, and only the occurrence which
+# creates an entity adds its values to the lookup tables. Duplicate
+# filings are classified as they're staged, using a FilingIDs set of
+# the staged filings, and conflicting ones are recorded once the
+# stored versions have been imported. A filing which can't be
+# imported fails the whole load, not just the filing.
+
+# The staged columns of each kind of sub-element, after the sequence
+# number and the filing ID. The entity tables' staged columns are
+# their _entity_columns, followed by the columns of their link
+# tables, which are given here. The issue and affiliated org staging
+# tables each have one more column, which isn't read from the parsed
+# entity: the issue's rowid, which is assigned as it's staged, and
+# the filing's affiliated orgs URL.
+
+_bulk_links = {'registrant': ('filing_registrant', ('address',
+                                                    'description')),
+               'client': ('filing_client', ('senate_id',
+                                            'status',
+                                            'contact_name',
+                                            'description')),
+               'lobbyist': ('filing_lobbyists', ('status',)),
+               'affiliated_org': ('filing_affiliated_orgs', ()),
+               'foreign_entity': ('filing_foreign_entities',
+                                  ('contribution',
+                                   'ownership_percentage',
+                                   'status'))}
+
+_bulk_columns = dict((table, _entity_columns[table] + extra)
+                     for table, (link, extra) in _bulk_links.iteritems())
+_bulk_columns.update({'govt_entity': ('name',),
+                      'issue': ('code', 'specific_issue')})
+
+_bulk_extra_columns = {'issue': 'id', 'affiliated_org': 'url'}
+
+_bulk_filing_columns = ('id', 'type', 'year', 'period', 'filing_date',
+                        'amount')
+
+# The staging table of each sub-element, by its key in a parsed
+# filing, in the order in which the importers import them.
+
+_bulk_singletons = [('registrant', 'registrant'),
+                    ('client', 'client')]
+
+_bulk_lists = [('lobbyists', 'lobbyist', 'lobbyist'),
+               ('govt_entities', 'govt_entity', 'govt_entity'),
+               ('issues', 'issue', 'issue'),
+               ('affiliated_orgs', 'org', 'affiliated_org'),
+               ('foreign_entities', 'foreign_entity', 'foreign_entity')]
+
+# The staged columns from which each lookup table is filled, in the
+# order in which the importers insert them. Columns marked True are
+# only inserted by the occurrence which creates their entity.
+
+_bulk_values = [('country', [('client', 'country', True),
+                             ('client', 'ppb_country', True),
+                             ('registrant', 'country', True),
+                             ('registrant', 'ppb_country', True),
+                             ('affiliated_org', 'country', True),
+                             ('affiliated_org', 'ppb_country', True),
+                             ('foreign_entity', 'country', True),
+                             ('foreign_entity', 'ppb_country', True)]),
+                ('state', [('client', 'state', True),
+                           ('client', 'ppb_state', True)]),
+                ('person', [('client', 'contact_name', True),
+                            ('lobbyist', 'name', True)]),
+                ('org', [('client', 'name', True),
+                         ('registrant', 'name', True),
+                         ('affiliated_org', 'name', True),
+                         ('foreign_entity', 'name', True)]),
+                ('url', [('affiliated_org', 'url', False)]),
+                ('govt_entity', [('govt_entity', 'name', False)]),
+                ('issue_code', [('issue', 'code', False)])]
+
+# The number of filings whose staged rows are buffered before they're
+# written.
+
+_bulk_batch_size = 1000
+
+
+def _bulk_stage_columns(table):
+    columns = _bulk_columns[table]
+    if table in _bulk_extra_columns:
+        columns += (_bulk_extra_columns[table],)
+    return columns
+
+
+class BulkLoader(object):
+    """Loads parsed filings into an empty database in two phases.
+
+    Stage the filings with stage, then import them all with
+    finish. The resulting database is identical to the one which
+    import_filings would build, but the entities are resolved with
+    set-based SQL, rather than one lookup at a time.
+
+    cur - The DB API 2.0-compliant database cursor. Raises ValueError
+    if the database already holds filings or entities.
+
+    The database needn't have the entity tables' unique indexes (see
+    create_db); finish creates them once the entity tables are
+    filled, and uses them to match each occurrence of an entity.
+
+    The staging tables are temporary tables. If the cursor's
+    connection is an sqlite3 connection whose isolation_level isn't
+    None, creating and dropping them commits the open transaction.
+
+    """
+    def __init__(self, cur):
+        for table in ['filing', 'issue'] + list(_bulk_links):
+            cur.execute('SELECT 1 FROM %s LIMIT 1' % table)
+            if cur.fetchone() is not None:
+                raise ValueError('bulk loading requires an empty database')
+        _check_hash(cur)
+        self.cur = cur
+        self._staged = FilingIDs()
+        self._conflicts = list()
+        self._seq = 0
+        self._issues = 0
+        self._stmt = dict()
+        self._get = dict()
+        self._rows = dict()
+        for table in ['filing'] + list(_bulk_columns):
+            if table == 'filing':
+                columns = _bulk_filing_columns + ('hash',)
+            else:
+                columns = ('filing',) + _bulk_stage_columns(table)
+                self._get[table] = _getter(operator.itemgetter,
+                                           _bulk_columns[table])
+            cur.execute('CREATE TEMP TABLE bulk_%s(seq INTEGER PRIMARY KEY, '
+                        '%s)' % (table, ', '.join(columns)))
+            self._stmt[table] = 'INSERT INTO bulk_%s VALUES(%s)' % \
+                (table, ', '.join(['?'] * (len(columns) + 1)))
+            self._rows[table] = list()
+        for table in _bulk_links:
+            cur.execute('CREATE TEMP TABLE bulk_%s_key('
+                        'id INTEGER PRIMARY KEY, first INTEGER UNIQUE)' %
+                        table)
+        self._get_filing = _getter(operator.itemgetter, _bulk_filing_columns)
+
+    def _sub_elements(self, record):
+        # Yields the staging table and parsed entity of each of a
+        # filing's sub-elements, in the order in which they'd be
+        # imported.
+        if isinstance(record, Filing):
+            for key, table in _bulk_singletons:
+                entity = record[key]
+                if entity is not None:
+                    yield table, entity
+            for key, item_key, table in _bulk_lists:
+                for entity in record[key]:
+                    yield table, entity
+        else:
+            for key, table in _bulk_singletons:
+                if key in record:
+                    yield table, record[key]
+            for key, item_key, table in _bulk_lists:
+                for item in record.get(key, ()):
+                    yield table, item[item_key]
+
+    def stage(self, parsed_filings):
+        """Stage parsed filings, to be imported by finish.
+
+        parsed_filings - A sequence of parsed filings, either
+        dictionaries or Filing records (see parse_filings).
+
+        A filing whose ID has already been staged is classified as a
+        duplicate (see duplicate_stats), as import_filings would.
+
+        """
+        rows = self._rows
+        get = self._get
+        buffered = 0
+        for record in parsed_filings:
+            id = _filing_id(record)
+            hash = filing_hash(record)
+            if id in self._staged:
+                existing = self._staged.hash_of(id)
+                if _is_conflict(hash, existing):
+                    # The stored version can't be read back until
+                    # it's imported.
+                    self._conflicts.append((id, existing, hash,
+                                            _filing_content(record)))
+                continue
+            self._staged.add(id, hash)
+            if isinstance(record, Filing):
+                filing = record
+            else:
+                filing = record['filing']
+            self._seq += 1
+            rows['filing'].append((self._seq,) + self._get_filing(filing) +
+                                  (hash,))
+            for table, entity in self._sub_elements(record):
+                self._seq += 1
+                row = (self._seq, id) + get[table](entity)
+                if table == 'issue':
+                    self._issues += 1
+                    row += (self._issues,)
+                elif table == 'affiliated_org':
+                    row += (filing['affiliated_orgs_url'],)
+                rows[table].append(row)
+            buffered += 1
+            if buffered == _bulk_batch_size:
+                self._flush()
+                buffered = 0
+        self._flush()
+
+    def _flush(self):
+        for table, rows in self._rows.iteritems():
+            if rows:
+                self.cur.executemany(self._stmt[table], rows)
+                del rows[:]
+
+    def _first_seq(self, table):
+        self.cur.execute('SELECT MIN(seq) FROM bulk_%s' % table)
+        return self.cur.fetchone()[0]
+
+    def _resolve(self, table):
+        # Fills an entity table from its staging table. Its rowids
+        # are numbered in the order in which each entity first
+        # occurs; the bulk_<table>_key table maps them to the
+        # sequence number of the occurrence which created them.
+        columns = _entity_columns[table]
+        cur = self.cur
+        cur.execute('INSERT INTO bulk_%s_key(first) '
+                    'SELECT MIN(seq) FROM bulk_%s '
+                    'GROUP BY %s, CASE WHEN %s THEN seq END '
+                    'ORDER BY 1' %
+                    (table, table, ', '.join(columns),
+                     ' OR '.join('%s IS NULL' % col for col in columns)))
+        cur.execute('INSERT INTO %s(id, %s) '
+                    'SELECT k.id, %s FROM bulk_%s_key k '
+                    'JOIN bulk_%s s ON s.seq = k.first '
+                    'ORDER BY k.id' %
+                    (table, ', '.join(columns),
+                     ', '.join('s.%s' % col for col in columns),
+                     table, table))
+
+    def _link(self, table):
+        # Fills an entity's link table. An occurrence which has no
+        # NULL columns is matched with its entity by the entity
+        # table's unique index; any other occurrence created its own
+        # entity.
+        link, extra = _bulk_links[table]
+        if table in _bulk_extra_columns:
+            extra += (_bulk_extra_columns[table],)
+        match = ' AND '.join('e.%s = s.%s' % (col, col)
+                             for col in _entity_columns[table])
+        self.cur.execute('INSERT INTO %s '
+                         'SELECT s.filing, COALESCE(e.id, k.id)%s '
+                         'FROM bulk_%s s '
+                         'LEFT JOIN %s e ON %s '
+                         'LEFT JOIN bulk_%s_key k ON k.first = s.seq '
+                         'ORDER BY s.seq' %
+                         (link, ''.join(', s.%s' % col for col in extra),
+                          table, table, match, table))
+
+    def _fill_values(self, table, sources):
+        # Fills a lookup table with the values of the staged columns,
+        # in the order in which the importers would insert them.
+        selects = list()
+        for pos, (stage, column, gated) in enumerate(sources):
+            if gated:
+                source = 'bulk_%s_key k JOIN bulk_%s s ON s.seq = k.first' % \
+                    (stage, stage)
+            else:
+                source = 'bulk_%s s' % stage
+            selects.append('SELECT s.seq AS seq, %d AS pos, s.%s AS value '
+                           'FROM %s' % (pos, column, source))
+        self.cur.execute('INSERT INTO %s SELECT value FROM (%s) '
+                         'ORDER BY seq, pos' %
+                         (table, ' UNION ALL '.join(selects)))
+
+    def finish(self):
+        """Import the staged filings, and drop the staging tables."""
+        self._flush()
+        cur = self.cur
+        cur.execute('INSERT INTO filing SELECT %s, hash FROM bulk_filing '
+                    'ORDER BY seq' % ', '.join(_bulk_filing_columns))
+        # Fill the entity tables in the order in which they're first
+        # inserted into, so that sqlite_sequence lists them in the
+        # same order, too. Even an INSERT which inserts nothing adds
+        # its table to sqlite_sequence, so empty tables are skipped.
+        tables = sorted((self._first_seq(table), table)
+                        for table in list(_bulk_links) + ['issue'])
+        for first, table in tables:
+            if first is None:
+                continue
+            elif table == 'issue':
+                cur.execute('INSERT INTO issue '
+                            'SELECT id, code, specific_issue FROM bulk_issue '
+                            'ORDER BY seq')
+            else:
+                self._resolve(table)
+        _create_indexes(cur)
+        for table in _bulk_links:
+            self._link(table)
+        for table, sources in _bulk_values:
+            self._fill_values(table, sources)
+        cur.execute('INSERT INTO filing_govt_entities '
+                    'SELECT filing, name FROM bulk_govt_entity ORDER BY seq')
+        cur.execute('INSERT INTO filing_issues '
+                    'SELECT filing, id FROM bulk_issue ORDER BY seq')
+        for conflict in self._conflicts:
+            _record_conflict(cur, *conflict)
+        for table in _bulk_links:
+            cur.execute('DROP TABLE bulk_%s_key' % table)
+        for table in _bulk_columns:
+            cur.execute('DROP TABLE bulk_%s' % table)
+        cur.execute('DROP TABLE bulk_filing')
+
+
+# Deferred indexes.
+#
+# lobbyists.sql ends by creating the unique indexes on the entity
+# tables, which import_filings relies on to look up entities. When a
+# new database is loaded in bulk, they're not needed until the end,
+# and building each of them in one pass over its filled table is much
+# cheaper than maintaining it as every row is inserted. So create_db
+# can leave them out, and create_indexes builds them later.
+# BulkLoader builds any which are missing itself, once it has filled
+# the entity tables. The link tables' primary keys can't be deferred
+# the same way: their ON CONFLICT IGNORE clauses dedupe the link rows
+# as they're inserted.
+
+_index_stmt = re.compile(r'CREATE UNIQUE INDEX [^;]*;')
+
+
+def _db_script():
+    """Return the SQL script which creates the database."""
+    try:
+        # if packaged as a setuptools egg.
+        from pkg_resources import resource_string
+        return resource_string(__name__, 'lobbyists.sql')
+    except:
+        import os.path
+        f = open(os.path.join(os.path.dirname(__file__), 'lobbyists.sql'))
+        return ''.join(f.readlines())
+
+
+def _create_indexes(cur):
+    # Creates the indexes in lobbyists.sql which don't exist yet.
+    for stmt in _index_stmt.findall(_db_script()):
+        cur.execute(stmt.replace('INDEX', 'INDEX IF NOT EXISTS', 1))
+
+
+def create_indexes(con):
+    """Create the entity tables' unique indexes, if they're missing.
+
+    con - A DB API 2.0-compliant database Connection object, for a
+    database created by create_db with indexes=False.
+
+    Returns the connection object.
+
+    """
+    _create_indexes(con.cursor())
+    return con
+
+
+def create_db(con, indexes=True):
     """Create the lobbying database.
 
     con - A DB API 2.0-compliant database Connection object. The
@@ -876,6 +3927,12 @@ def create_db(con):
     that database will be dropped by this function (i.e., the data
     will be lost).
 
+    indexes - If False, the unique indexes on the entity tables
+    (clients, registrants, lobbyists, affiliated orgs and foreign
+    entities) aren't created, and must be created with create_indexes
+    before filings are imported with import_filings. A BulkLoader
+    creates them itself.
+
     This function is only guaranteed to work with an sqlite3
     Connection object, but it may work with other SQL databases, as
     well.
@@ -886,13 +3943,32 @@ def create_db(con):
     Returns the connection object.
 
     """
-    try:
-        # if packaged as a setuptools egg.
-        from pkg_resources import resource_string
-        script = resource_string(__name__, 'lobbyists.sql')
-    except:
-        import os.path
-        f = open(os.path.join(os.path.dirname(__file__), 'lobbyists.sql'))
-        script = ''.join(f.readlines())
+    script = _db_script()
+    if not indexes:
+        script = _index_stmt.sub('', script)
     con.executescript(script)
     return con
+
+
+def upgrade_db(con):
+    """Upgrade a lobbying database created by an earlier version.
+
+    Adds the filing table's hash column and the filing_conflict table
+    (see import_filings), if they're missing. Filings imported before
+    the upgrade have no hash, so duplicates of them can't be
+    classified.
+
+    con - A DB API 2.0-compliant database Connection object.
+
+    Returns the connection object.
+
+    """
+    cur = con.cursor()
+    if not _has_hash(cur):
+        cur.execute('ALTER TABLE filing ADD COLUMN hash CHAR(40)')
+    # See lobbyists.sql.
+    cur.execute('CREATE TABLE IF NOT EXISTS filing_conflict('
+                'filing REFERENCES filing, hash CHAR(40), content TEXT, '
+                'PRIMARY KEY(filing, hash) ON CONFLICT IGNORE)')
+    con.commit()
+    return con
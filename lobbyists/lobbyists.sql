@@ -25,6 +25,7 @@ DROP TABLE IF EXISTS filing_affiliated_orgs;
 DROP TABLE IF EXISTS foreign_entity;
 DROP TABLE IF EXISTS foreign_entity_status;
 DROP TABLE IF EXISTS filing_foreign_entities;
+DROP TABLE IF EXISTS filing_conflict;
 
 DROP INDEX IF EXISTS lobbyist_index;
 DROP INDEX IF EXISTS client_index;
@@ -38,7 +39,8 @@ CREATE TABLE filing(
   year INTEGER,
   period VARCHAR(64),
   filing_date VARCHAR(20),      -- ISO 8601 extended date+time format
-  amount INTEGER
+  amount INTEGER,
+  hash CHAR(40)                 -- SHA-1 of the filing's contents
 );
 
 CREATE TABLE org(
@@ -199,6 +201,20 @@ CREATE TABLE filing_foreign_entities(
   PRIMARY KEY(filing, foreign_entity) ON CONFLICT IGNORE
 );
 
+-- Filings whose IDs duplicate that of a filing already in the
+-- database, but whose contents differ. The first filing with each ID
+-- is imported as usual, with its content hash; each conflicting
+-- duplicate is recorded here with its own hash and its contents (the
+-- repr of lobbyists._filing_content), but isn't imported. The stored
+-- filing is recorded here too, with its contents as read back from
+-- the database. Identical duplicates aren't recorded.
+CREATE TABLE filing_conflict(
+  filing REFERENCES filing,
+  hash CHAR(40),
+  content TEXT,
+  PRIMARY KEY(filing, hash) ON CONFLICT IGNORE
+);
+
 -- Create indexes for tables that get looked up during import. They
 -- make a HUGE difference in import performance.
 CREATE UNIQUE INDEX lobbyist_index ON lobbyist(
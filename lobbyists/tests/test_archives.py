@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# test_archives.py - Tests for parsing compressed documents.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for parsing compressed documents."""
+
+import unittest
+import lobbyists
+import gzip
+import os
+import shutil
+import tempfile
+import zipfile
+from lobbyists import util as load_util
+import util
+
+
+_members = ['filings.xml', 'lobbyists.xml', 'issues.xml']
+
+
+class TestArchives(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.zip = os.path.join(self.dir, 'filings.zip')
+        archive = zipfile.ZipFile(self.zip, 'w', zipfile.ZIP_DEFLATED)
+        try:
+            archive.writestr('docs/', '')
+            for basename in _members:
+                archive.write(util.testpath(basename), basename)
+        finally:
+            archive.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def gzip(self, basename):
+        path = os.path.join(self.dir, basename + '.gz')
+        f = open(util.testpath(basename), 'rb')
+        out = gzip.GzipFile(path, 'wb')
+        try:
+            out.write(f.read())
+        finally:
+            out.close()
+            f.close()
+        return path
+
+    def test_gzip(self):
+        """Gzipped documents are decompressed as they're parsed"""
+        doc = self.gzip('lobbyists.xml')
+        expected = list(lobbyists.parse_filings(util.testpath('lobbyists.xml')))
+        for backend in ['pulldom', 'expat', 'etree']:
+            self.failUnlessEqual(list(lobbyists.parse_filings(doc, backend)),
+                                 expected, backend)
+
+    def test_split_documents(self):
+        """Each file in a ZIP archive is a separate document"""
+        members = lobbyists.split_documents(self.zip)
+        self.failUnlessEqual(members,
+                             [lobbyists.ZipMember(self.zip, x)
+                              for x in _members])
+        self.failUnlessEqual(str(members[0]), self.zip + ':filings.xml')
+        self.failUnlessEqual(lobbyists.split_documents('filings.xml'),
+                             ['filings.xml'])
+        for member, basename in zip(members, _members):
+            expected = list(lobbyists.parse_filings(util.testpath(basename)))
+            self.failUnlessEqual(list(lobbyists.parse_filings(member)),
+                                 expected)
+
+    def test_zip(self):
+        """ZIP archives are parsed one file after another"""
+        expected = list()
+        for basename in _members:
+            expected.extend(lobbyists.parse_filings(util.testpath(basename)))
+        for backend in ['pulldom', 'expat', 'etree']:
+            actual = list(lobbyists.parse_filings(self.zip, backend))
+            self.failUnlessEqual(actual, expected, backend)
+
+    def test_load_db(self):
+        """load_db loads each file in a ZIP archive as a document"""
+        plain = [util.testpath(x) for x in _members + ['filings.xml']]
+        con = load_util.load_db(plain, os.path.join(self.dir, 'plain.db'))
+        expected = util.dump_db(con)
+        con.close()
+        docs = [self.zip, self.gzip('filings.xml')]
+        for jobs in [None, 2]:
+            con = load_util.load_db(docs,
+                                    os.path.join(self.dir, 'zip%s.db' % jobs),
+                                    commit_per_doc=True, jobs=jobs)
+            self.failUnlessEqual(util.dump_db(con), expected, jobs)
+            con.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
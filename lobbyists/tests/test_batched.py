@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# test_batched.py - Tests for parsing and importing filings in batches.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for parsing and importing filings in batches."""
+
+import unittest
+import lobbyists
+import sqlite3
+import sys
+import cStringIO
+import util
+
+
+class CountingCursor(object):
+    """A cursor which counts its executemany calls."""
+    def __init__(self, cur):
+        self.cur = cur
+        self.executemany_calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.cur, name)
+
+    def executemany(self, stmt, rows):
+        self.executemany_calls += 1
+        return self.cur.executemany(stmt, rows)
+
+
+class TestBatched(unittest.TestCase):
+    def test_parse_batches(self):
+        """Batches contain every filing, in document order"""
+        doc = util.testpath('types.xml')
+        expected = list(lobbyists.parse_filings(doc))
+        for size in [1, 5, 36, 100]:
+            batches = list(lobbyists.parse_filings_batched(doc, size))
+            self.failUnlessEqual(util.flatten(batches), expected, size)
+            for batch in batches[:-1]:
+                self.failUnlessEqual(len(batch), size)
+            self.failUnless(0 < len(batches[-1]) <= size)
+
+    def test_parse_options(self):
+        """Batched parsing takes the same options as parse_filings"""
+        doc = util.testpath('types.xml')
+        where = lobbyists.FilingFilter(year=2008)
+        expected = list(lobbyists.parse_filings(doc, 'expat', True,
+                                                ['client'], where))
+        batches = lobbyists.parse_filings_batched(doc, 4, 'expat', True,
+                                                  ['client'], where)
+        self.failUnlessEqual(util.flatten(list(batches)), expected)
+
+    def test_bad_size(self):
+        """Batch sizes less than 1 raise ValueError"""
+        self.failUnlessRaises(ValueError, lobbyists.parse_filings_batched,
+                              util.testpath('types.xml'), 0)
+
+    def test_import_batches(self):
+        """Importing batches is the same as importing filings"""
+        for doc in util.data_files():
+            con = lobbyists.create_db(sqlite3.connect(':memory:'))
+            lobbyists.import_filings(con.cursor(),
+                                     lobbyists.parse_filings(doc))
+            expected = util.dump_db(con)
+            for batch_size in [None, 2]:
+                con = lobbyists.create_db(sqlite3.connect(':memory:'))
+                lobbyists.import_filings_batched(
+                    con.cursor(), lobbyists.parse_filings_batched(doc, 3),
+                    batch_size=batch_size)
+                self.failUnlessEqual(util.dump_db(con), expected, doc)
+
+    def test_import_batch_writes(self):
+        """Each batch's links are written together"""
+        doc = util.testpath('issues.xml')
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        cur = CountingCursor(con.cursor())
+        batches = list(lobbyists.parse_filings_batched(doc, 2))
+        lobbyists.import_filings_batched(cur, batches)
+        # Every batch has issues, and no other sub-elements.
+        self.failUnlessEqual(cur.executemany_calls, len(batches))
+
+    def test_batched_writes(self):
+        """Batched writes give the same database"""
+        for doc in util.data_files():
+            con = lobbyists.create_db(sqlite3.connect(':memory:'))
+            lobbyists.import_filings(con.cursor(),
+                                     lobbyists.parse_filings(doc))
+            expected = util.dump_db(con)
+            for size in [1, 7, 1000]:
+                for records in [False, True]:
+                    con = lobbyists.create_db(sqlite3.connect(':memory:'))
+                    filings = lobbyists.parse_filings(doc, 'pulldom', records)
+                    lobbyists.import_filings(con.cursor(), filings,
+                                             batch_size=size)
+                    self.failUnlessEqual(util.dump_db(con), expected,
+                                         (doc, size, records))
+
+    def test_batched_rollback(self):
+        """A failed filing's buffered rows are discarded"""
+        filings = list(lobbyists.parse_filings(util.testpath('lobbyists.xml')))
+        broken = filings[1]
+        broken['lobbyists'].append({'lobbyist': dict(
+                    broken['lobbyists'][0]['lobbyist'], name=object())})
+        stdout = sys.stdout
+        for isolation_level in ['', None]:
+            con = lobbyists.create_db(sqlite3.connect(':memory:'))
+            con.isolation_level = isolation_level
+            sys.stdout = cStringIO.StringIO()
+            try:
+                lobbyists.import_filings(con.cursor(), filings,
+                                         batch_size=1000)
+            finally:
+                sys.stdout = stdout
+            db = util.dump_db(con)
+            imported = filings[:1] + filings[2:]
+            self.failUnlessEqual(sorted(x[0] for x in db['filing']),
+                                 sorted(x['filing']['id'] for x in imported))
+            self.failUnlessEqual(len(db['filing_lobbyists']),
+                                 sum(len(x.get('lobbyists', []))
+                                     for x in imported))
+            self.failIf([x for x in db['filing_lobbyists']
+                         if x[0] == broken['filing']['id']])
+
+
+if __name__ == '__main__':
+    unittest.main()
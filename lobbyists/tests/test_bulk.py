@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# test_bulk.py - Tests for bulk loading through staging tables.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for bulk loading through staging tables."""
+
+import unittest
+import copy
+import os
+import shutil
+import sqlite3
+import tempfile
+import lobbyists
+from lobbyists import util as load_util
+import util
+
+
+def parse(name):
+    return list(lobbyists.parse_filings(util.testpath(name)))
+
+
+def parse_all(records=False):
+    filings = list()
+    for doc in util.data_files():
+        filings.extend(lobbyists.parse_filings(doc, 'pulldom', records))
+    return filings
+
+
+def build(filings, bulk, indexes=True):
+    con = lobbyists.create_db(sqlite3.connect(':memory:'), indexes)
+    cur = con.cursor()
+    lobbyists.clear_duplicate_stats()
+    if bulk:
+        loader = lobbyists.BulkLoader(cur)
+        loader.stage(filings)
+        loader.finish()
+    else:
+        lobbyists.import_filings(cur, filings)
+    return util.dump_db(con), lobbyists.duplicate_stats()
+
+
+class TestBulkLoader(unittest.TestCase):
+    def check(self, filings):
+        self.failUnlessEqual(build(filings, True), build(filings, False))
+
+    def test_identical(self):
+        """Bulk loading builds the same database as import_filings"""
+        for records in [False, True]:
+            filings = parse_all(records)
+            self.check(filings + filings[:3])
+
+    def test_deferred_indexes(self):
+        """Bulk loading builds missing indexes once entities are loaded"""
+        filings = parse_all()
+        self.failUnlessEqual(build(filings, True, False),
+                             build(filings, False))
+
+    def test_null_columns(self):
+        """Entities with NULL columns are never matched"""
+        filings = parse_all()
+        for filing in filings:
+            for item in filing.get('lobbyists', ()):
+                item['lobbyist']['official_position'] = None
+            if 'client' in filing:
+                filing['client']['state'] = None
+        self.check(filings + filings[:3])
+
+    def test_conflicting(self):
+        """Conflicting duplicates are recorded, but not imported"""
+        filings = parse('lobbyists.xml')
+        conflicting = copy.deepcopy(filings[1])
+        conflicting['filing']['amount'] = 1
+        db, stats = build(filings + [conflicting, filings[1]], True)
+        self.failUnlessEqual(len(db['filing_conflict']), 2)
+        self.failUnlessEqual(stats, {'identical': 1, 'conflicting': 1})
+        self.check(filings + [conflicting, filings[1]])
+
+    def test_stages(self):
+        """Filings can be staged a batch at a time"""
+        filings = parse_all()
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        loader = lobbyists.BulkLoader(con.cursor())
+        for batch in lobbyists.lobbyists._batches(filings, 4):
+            loader.stage(batch)
+        loader.finish()
+        self.failUnlessEqual(util.dump_db(con),
+                             build(filings, False)[0])
+        cur = con.cursor()
+        cur.execute("SELECT COUNT(*) FROM sqlite_temp_master")
+        self.failUnlessEqual(cur.fetchone()[0], 0)
+
+    def test_not_empty(self):
+        """Databases which already hold filings can't be bulk loaded"""
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        lobbyists.import_filings(con.cursor(), parse('filings.xml'))
+        self.failUnlessRaises(ValueError, lobbyists.BulkLoader, con.cursor())
+
+
+class TestLoadBulk(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def load(self, name, **kwargs):
+        con = load_util.load_db(util.data_files(),
+                                os.path.join(self.dir, name), **kwargs)
+        try:
+            return util.dump_db(con)
+        finally:
+            con.close()
+
+    def test_load_db(self):
+        """load_db's bulk mode builds the same database"""
+        expected = self.load('expected.db')
+        self.failUnlessEqual(self.load('bulk.db', bulk=True), expected)
+        self.failUnlessEqual(self.load('pipeline.db', bulk=True,
+                                       pipeline=True),
+                             expected)
+        con = sqlite3.connect(os.path.join(self.dir, 'bulk.db'))
+        try:
+            cur = con.cursor()
+            cur.execute("SELECT COUNT(*) FROM sqlite_master "
+                        "WHERE type='index' AND name LIKE '%_index'")
+            self.failUnlessEqual(cur.fetchone()[0], 5)
+        finally:
+            con.close()
+
+    def test_incompatible(self):
+        """Bulk loads can't be checkpointed or added to a database"""
+        dbname = os.path.join(self.dir, 'bulk.db')
+        for kwargs in [{'checkpoint': 2}, {'resume': True},
+                       {'skip_known': True}, {'commit_per_doc': True}]:
+            self.failUnlessRaises(ValueError, load_util.load_db,
+                                  util.data_files(), dbname, bulk=True,
+                                  **kwargs)
+        load_util.load_db(util.data_files()[:1], dbname).close()
+        self.failUnlessRaises(ValueError, load_util.load_db,
+                              util.data_files(), dbname, bulk=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# test_checkpoint.py - Tests for load_db's checkpoints.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for load_db's checkpoints."""
+
+import unittest
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+from lobbyists import util as load_util
+import util
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.import_filings = load_util.lobbyists.import_filings
+        self.counter = util.CountingImport(self.import_filings)
+        load_util.lobbyists.import_filings = self.counter
+        self.synthetic = os.path.join(self.dir, 'synthetic.xml')
+        self.write(self.synthetic, util.SyntheticDoc(1200).read())
+        self.docs = [util.testpath('filings.xml'), self.synthetic]
+
+    def tearDown(self):
+        load_util.lobbyists.import_filings = self.import_filings
+        shutil.rmtree(self.dir)
+
+    def write(self, path, contents):
+        f = open(path, 'wb')
+        try:
+            f.write(contents)
+        finally:
+            f.close()
+
+    def dump(self, name):
+        con = sqlite3.connect(os.path.join(self.dir, name))
+        try:
+            db = util.dump_db(con)
+        finally:
+            con.close()
+        # The time at which each checkpoint was recorded varies.
+        checkpoints = [row[:-1] for row in db.pop('load_checkpoint', [])]
+        return db, checkpoints
+
+    def load(self, name, **kwargs):
+        self.counter.imported = 0
+        con = load_util.load_db(self.docs, os.path.join(self.dir, name),
+                                checkpoint=100, **kwargs)
+        con.close()
+        return self.dump(name)
+
+    def crash(self, name, crash_after, **kwargs):
+        self.counter.crash_after = crash_after
+        try:
+            self.failUnlessRaises(util.Crash, self.load, name, **kwargs)
+        finally:
+            self.counter.crash_after = None
+        return self.dump(name)
+
+    def test_checkpoints(self):
+        """Checkpoints record each document's progress"""
+        doc, synthetic = [os.path.abspath(x) for x in self.docs]
+        db, checkpoints = self.crash('crashed.db', 560)
+        self.failUnlessEqual(checkpoints,
+                             [(doc, 5, u'8F21CC08-E136-4A42-A51D-25FE3B6CC303',
+                               1),
+                              (synthetic, 500,
+                               u'00000499-0000-0000-0000-000000000000', 0)])
+        self.failUnlessEqual(len(db['filing']), 505)
+
+    def test_resume(self):
+        """A resumed load matches an uninterrupted one"""
+        expected = self.load('expected.db')
+        for i, kwargs in enumerate([{}, {'jobs': 2}, {'pipeline': True}]):
+            name = 'resumed%d.db' % i
+            self.crash(name, 560, **kwargs)
+            self.failUnlessEqual(self.load(name, resume=True, **kwargs),
+                                 expected, kwargs)
+            # Only the filings after the checkpoint were imported.
+            self.failUnlessEqual(self.counter.imported, 700, kwargs)
+
+    def test_resume_compressed(self):
+        """Loads of compressed documents can be resumed"""
+        f = gzip.open(self.synthetic + '.gz', 'wb')
+        try:
+            f.write(util.SyntheticDoc(1200).read())
+        finally:
+            f.close()
+        self.docs[1] += '.gz'
+        expected = self.load('expected.db')
+        self.crash('resumed.db', 560)
+        self.failUnlessEqual(self.load('resumed.db', resume=True), expected)
+        self.failUnlessEqual(self.counter.imported, 700)
+
+    def test_resume_utf16(self):
+        """Loads of documents in other encodings can be resumed"""
+        data = util.SyntheticDoc(1200).read().decode('utf-8')
+        self.write(self.synthetic, data.encode('utf-16'))
+        expected = self.load('expected.db')
+        self.crash('resumed.db', 560)
+        self.failUnlessEqual(self.load('resumed.db', resume=True), expected)
+        self.failUnlessEqual(self.counter.imported, 700)
+
+    def test_resume_complete(self):
+        """Resuming a complete load imports nothing"""
+        expected = self.load('complete.db')
+        self.failUnlessEqual(self.load('complete.db', resume=True), expected)
+        self.failUnlessEqual(self.counter.imported, 0)
+
+    def test_resume_changed_document(self):
+        """Resuming from a document which has changed fails"""
+        self.crash('changed.db', 560)
+        self.write(self.synthetic, util.SyntheticDoc(400).read())
+        self.failUnlessRaises(ValueError, self.load, 'changed.db',
+                              resume=True)
+        self.write(self.synthetic, open(util.testpath('filings.xml')).read())
+        self.failUnlessRaises(ValueError, self.load, 'changed.db',
+                              resume=True)
+
+    def test_without_checkpoints(self):
+        """Without checkpoints, load_db doesn't record any progress"""
+        con = load_util.load_db(self.docs, os.path.join(self.dir, 'none.db'))
+        try:
+            self.failIf('load_checkpoint' in util.dump_db(con))
+        finally:
+            con.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
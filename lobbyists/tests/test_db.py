@@ -23,6 +23,14 @@ import lobbyists
 import sqlite3
 import util
 
+
+def indexes(con):
+    cur = con.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='index' "
+                "AND sql IS NOT NULL ORDER BY name")
+    return [row[0] for row in cur]
+
+
 class TestDB(unittest.TestCase):
     def test_preloaded_table_state_or_local_gov(self):
         """Is the state_or_local_gov table preloaded by the schema file?"""
@@ -76,6 +84,17 @@ class TestDB(unittest.TestCase):
         self.failUnless('not covered' in rows)
         self.failUnless('undetermined' in rows)
 
+    def test_deferred_indexes(self):
+        """Can the entity tables' indexes be created later?"""
+        expected = indexes(lobbyists.create_db(sqlite3.connect(':memory:')))
+        self.failUnlessEqual(len(expected), 5)
+        con = lobbyists.create_db(sqlite3.connect(':memory:'), False)
+        self.failUnlessEqual(indexes(con), [])
+        lobbyists.create_indexes(con)
+        self.failUnlessEqual(indexes(con), expected)
+        lobbyists.create_indexes(con)
+        self.failUnlessEqual(indexes(con), expected)
+
 
 if __name__ == '__main__':
     unittest.main()
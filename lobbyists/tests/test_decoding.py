@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# test_decoding.py - Tests for the enumerated attribute decoders.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the enumerated attribute decoders."""
+
+import unittest
+import lobbyists
+import cStringIO
+import util
+
+
+_anomalous_doc = """<PublicFilings>
+  <Filing ID="1" Year="2008" Period="Sometime">
+    <Client ClientID="1" ClientStatus="7" IsStateOrLocalGov="x"/>
+    <Lobbyists>
+      <Lobbyist LobbyistStatus=" 1" LobbyisteIndicator="covered"/>
+      <Lobbyist LobbyistStatus="01"/>
+    </Lobbyists>
+  </Filing>
+  <Filing ID="2" Year="2008" Period="Sometime"/>
+</PublicFilings>
+"""
+
+
+class TestDecoding(unittest.TestCase):
+    def setUp(self):
+        lobbyists.clear_decoding()
+
+    def tearDown(self):
+        lobbyists.clear_decoding()
+
+    def test_no_anomalies(self):
+        """Well-formed documents have no decoding anomalies"""
+        for doc in util.data_files():
+            list(lobbyists.parse_filings(doc))
+        for name, stats in lobbyists.decoding_stats().iteritems():
+            self.failUnlessEqual(stats['anomalies'], 0, name)
+            self.failUnlessEqual(stats['values'], {}, name)
+
+    def test_anomalies(self):
+        """Values which can't be decoded are parsed as None and counted"""
+        for backend in ['pulldom', 'expat', 'etree']:
+            lobbyists.clear_decoding()
+            doc = cStringIO.StringIO(_anomalous_doc)
+            filings = list(lobbyists.parse_filings(doc, backend))
+            self.failUnlessEqual(filings[0]['filing']['period'], None)
+            self.failUnlessEqual(filings[0]['client']['status'], None)
+            self.failUnlessEqual(filings[0]['client']['state_or_local_gov'],
+                                 None)
+            lobbyist1, lobbyist2 = filings[0]['lobbyists']
+            self.failUnlessEqual(lobbyist1['lobbyist']['status'],
+                                 'terminated')
+            self.failUnlessEqual(lobbyist1['lobbyist']['indicator'], None)
+            self.failUnlessEqual(lobbyist2['lobbyist']['status'],
+                                 'terminated')
+            self.failUnlessEqual(lobbyist2['lobbyist']['indicator'], None)
+            stats = lobbyists.decoding_stats()
+            self.failUnlessEqual(stats['period']['anomalies'], 2)
+            self.failUnlessEqual(stats['period']['values'], {'Sometime': 2})
+            self.failUnlessEqual(stats['client_status']['values'], {'7': 1})
+            self.failUnlessEqual(
+                stats['client_state_or_local_gov']['values'], {'x': 1})
+            self.failUnlessEqual(stats['lobbyist_indicator']['values'],
+                                 {'covered': 1, None: 1})
+            self.failUnlessEqual(stats['lobbyist_status']['anomalies'], 0)
+            self.failUnlessEqual(stats['foreign_entity_status']['anomalies'],
+                                 0)
+
+    def test_memoized(self):
+        """Unusual spellings of valid values are memoized"""
+        list(lobbyists.parse_filings(cStringIO.StringIO(_anomalous_doc)))
+        stats = lobbyists.decoding_stats()['lobbyist_status']
+        # The four statuses, plus ' 1' and '01'.
+        self.failUnlessEqual(stats['memoized'], 6)
+        lobbyists.clear_decoding()
+        stats = lobbyists.decoding_stats()['lobbyist_status']
+        self.failUnlessEqual(stats['memoized'], 4)
+
+    def test_anomalous_values_bounded(self):
+        """Only a limited number of distinct anomalous values are kept"""
+        filing = '<Filing ID="%d" Year="2008" Period="p%d"/>'
+        doc = '<PublicFilings>%s</PublicFilings>' % \
+            ''.join([filing % (i, i) for i in range(150)])
+        list(lobbyists.parse_filings(cStringIO.StringIO(doc), 'expat'))
+        stats = lobbyists.decoding_stats()['period']
+        self.failUnlessEqual(stats['anomalies'], 150)
+        self.failUnlessEqual(len(stats['values']), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
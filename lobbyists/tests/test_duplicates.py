@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+# test_duplicates.py - Tests for content hashes and duplicate filings.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for content hashes and duplicate filings."""
+
+import unittest
+import copy
+import sqlite3
+import sys
+import cStringIO
+import lobbyists
+import util
+
+
+def parse(name, backend='pulldom', records=False):
+    return list(lobbyists.parse_filings(util.testpath(name), backend,
+                                        records))
+
+
+class TestFilingHash(unittest.TestCase):
+    def test_hash_is_canonical(self):
+        """Content hashes don't depend on backend or representation"""
+        for doc in util.data_files():
+            expected = [lobbyists.filing_hash(x)
+                        for x in lobbyists.parse_filings(doc)]
+            for backend in ['pulldom', 'expat', 'etree']:
+                for records in [False, True]:
+                    actual = [lobbyists.filing_hash(x) for x in
+                              lobbyists.parse_filings(doc, backend, records)]
+                    self.failUnlessEqual(actual, expected,
+                                         (doc, backend, records))
+
+    def test_hash_covers_contents(self):
+        """Filings with different contents have different hashes"""
+        filing = parse('lobbyists.xml')[0]
+        hash = lobbyists.filing_hash(filing)
+        changed = copy.deepcopy(filing)
+        changed['filing']['amount'] = 1
+        self.failIfEqual(lobbyists.filing_hash(changed), hash)
+        changed = copy.deepcopy(filing)
+        changed['lobbyists'][0]['lobbyist']['name'] = u'SOMEONE ELSE'
+        self.failIfEqual(lobbyists.filing_hash(changed), hash)
+        changed = copy.deepcopy(filing)
+        del changed['lobbyists']
+        self.failIfEqual(lobbyists.filing_hash(changed), hash)
+
+    def test_hash_string_types(self):
+        """Byte strings and unicode strings hash the same way"""
+        filing = parse('lobbyists.xml')[0]
+        filing['lobbyists'][0]['lobbyist']['official_position'] = u''
+        hash = lobbyists.filing_hash(filing)
+        filing['lobbyists'][0]['lobbyist']['official_position'] = ''
+        self.failUnlessEqual(lobbyists.filing_hash(filing), hash)
+
+
+class TestDuplicates(unittest.TestCase):
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = cStringIO.StringIO()
+        lobbyists.clear_duplicate_stats()
+        self.con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        self.filings = parse('lobbyists.xml')
+        lobbyists.import_filings(self.con.cursor(), self.filings)
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def conflicting(self):
+        filing = copy.deepcopy(self.filings[0])
+        filing['filing']['amount'] = 1
+        return filing
+
+    def conflicts(self):
+        cur = self.con.cursor()
+        cur.execute('SELECT filing, hash FROM filing_conflict')
+        return cur.fetchall()
+
+    def both_versions(self, filing):
+        # The stored filing and the conflicting one, in that order.
+        id = filing['filing']['id']
+        return [(id, lobbyists.filing_hash(self.filings[0])),
+                (id, lobbyists.filing_hash(filing))]
+
+    def test_hash_stored(self):
+        """Each filing's content hash is stored with it"""
+        cur = self.con.cursor()
+        cur.execute('SELECT id, hash FROM filing')
+        self.failUnlessEqual(sorted(cur.fetchall()),
+                             sorted([(x['filing']['id'],
+                                      lobbyists.filing_hash(x))
+                                     for x in self.filings]))
+
+    def test_identical(self):
+        """Identical duplicates are skipped silently"""
+        expected = util.dump_db(self.con)
+        records = parse('lobbyists.xml', 'etree', True)
+        lobbyists.import_filings(self.con.cursor(), records)
+        self.failUnlessEqual(util.dump_db(self.con), expected)
+        self.failUnlessEqual(lobbyists.duplicate_stats(),
+                             {'identical': len(records), 'conflicting': 0})
+        self.failUnlessEqual(sys.stdout.getvalue(), '')
+
+    def test_conflicting(self):
+        """Conflicting duplicates are recorded, but not imported"""
+        filing = self.conflicting()
+        lobbyists.import_filings(self.con.cursor(), [filing, filing])
+        self.failUnlessEqual(self.conflicts(), self.both_versions(filing))
+        cur = self.con.cursor()
+        cur.execute('SELECT content FROM filing_conflict ORDER BY rowid')
+        stored, content = [row[0] for row in cur.fetchall()]
+        self.failUnlessEqual(content,
+                             repr(lobbyists.lobbyists._filing_content(filing)))
+        # The stored filing has no affiliated orgs, so its URL (the
+        # last filing attribute) wasn't stored.
+        stored = eval(stored)
+        expected = lobbyists.lobbyists._filing_content(self.filings[0])
+        self.failUnlessEqual(stored[0][:-1], expected[0][:-1])
+        self.failUnlessEqual(stored[1:], expected[1:])
+        cur = self.con.cursor()
+        cur.execute('SELECT amount FROM filing WHERE id=?',
+                    [filing['filing']['id']])
+        self.failUnlessEqual(cur.fetchall(),
+                             [(self.filings[0]['filing']['amount'],)])
+        self.failUnlessEqual(lobbyists.duplicate_stats(),
+                             {'identical': 0, 'conflicting': 2})
+        self.failUnlessEqual(sys.stdout.getvalue(), '')
+
+    def test_known(self):
+        """Known filings are classified without being imported"""
+        known = lobbyists.FilingIDs(self.con.cursor())
+        filing = self.conflicting()
+        lobbyists.import_filings(self.con.cursor(),
+                                 [filing] + self.filings, known)
+        self.failUnlessEqual(known.skipped, len(self.filings) + 1)
+        self.failUnlessEqual(self.conflicts(), self.both_versions(filing))
+        self.failUnlessEqual(lobbyists.duplicate_stats(),
+                             {'identical': len(self.filings),
+                              'conflicting': 1})
+
+    def test_upgrade_db(self):
+        """Databases without hashes are upgraded"""
+        con = sqlite3.connect(':memory:')
+        con.execute('CREATE TABLE filing(id VARCHAR(36) PRIMARY KEY, '
+                    'type VARCHAR(64), year INTEGER, period VARCHAR(64), '
+                    'filing_date VARCHAR(20), amount INTEGER)')
+        lobbyists.upgrade_db(con)
+        lobbyists.upgrade_db(con)
+        cur = con.cursor()
+        cur.execute('PRAGMA table_info(filing)')
+        self.failUnlessEqual(cur.fetchall()[-1][1:3], (u'hash', u'CHAR(40)'))
+        cur.execute('SELECT * FROM filing_conflict')
+        self.failUnlessEqual(cur.fetchall(), [])
+
+    def test_import_needs_upgrade(self):
+        """Databases without hashes must be upgraded before importing"""
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        con.executescript('DROP TABLE filing; DROP TABLE filing_conflict; '
+                          'CREATE TABLE filing(id VARCHAR(36) PRIMARY KEY, '
+                          'type VARCHAR(64), year INTEGER, '
+                          'period VARCHAR(64), filing_date VARCHAR(20), '
+                          'amount INTEGER)')
+        self.failUnlessRaises(ValueError, lobbyists.import_filings,
+                              con.cursor(), self.filings)
+        self.failUnlessRaises(ValueError, lobbyists.BulkLoader, con.cursor())
+        self.failUnlessRaises(ValueError, lobbyists.import_filings_batched,
+                              con.cursor(), [self.filings])
+        lobbyists.upgrade_db(con)
+        lobbyists.import_filings(con.cursor(), self.filings)
+        self.failUnlessEqual(util.dump_db(con),
+                             util.dump_db(self.con))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+# test_entity_cache.py - Tests for the entity rowid cache.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the entity rowid cache."""
+
+import unittest
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import cStringIO
+import lobbyists
+from lobbyists import util as load_util
+import util
+
+
+def import_all(cache=None, records=False):
+    con = lobbyists.create_db(sqlite3.connect(':memory:'))
+    cur = con.cursor()
+    for doc in util.data_files():
+        filings = lobbyists.parse_filings(doc, 'pulldom', records)
+        lobbyists.import_filings(cur, filings, None, cache)
+    return util.dump_db(con)
+
+
+class TestEntityCache(unittest.TestCase):
+    def test_lookup(self):
+        """Cached rowids are found by table and key"""
+        cache = lobbyists.EntityCache()
+        cache.add('lobbyist', (u'SMITH', 'Y', u''), 1)
+        self.failUnlessEqual(cache.get('lobbyist', (u'SMITH', 'Y', u'')), 1)
+        self.failUnlessEqual(cache.get('person', (u'SMITH', 'Y', u'')), None)
+        self.failUnlessEqual(cache.get('lobbyist', (u'JONES', 'Y', u'')),
+                             None)
+        self.failUnlessEqual(cache.stats(), {'size': 1,
+                                             'hits': 1,
+                                             'misses': 2,
+                                             'evictions': 0,
+                                             'values': 0,
+                                             'value_hits': 0,
+                                             'value_misses': 0})
+
+    def test_null_keys(self):
+        """Entities with NULL columns aren't cached"""
+        cache = lobbyists.EntityCache()
+        cache.add('lobbyist', (u'SMITH', None, u''), 1)
+        self.failUnlessEqual(len(cache), 0)
+
+    def test_eviction(self):
+        """The least recently used entities are evicted"""
+        cache = lobbyists.EntityCache(8)
+        for i in range(8):
+            cache.add('client', (i,), i + 1)
+        for i in [0, 1, 4]:
+            cache.get('client', (i,))
+        cache.add('client', (8,), 9)
+        self.failUnlessEqual(len(cache), 7)
+        self.failUnlessEqual(cache.evictions, 2)
+        for i in [2, 3]:
+            self.failUnlessEqual(cache.get('client', (i,)), None)
+        for i in [0, 1, 4, 5, 6, 7, 8]:
+            self.failUnlessEqual(cache.get('client', (i,)), i + 1)
+
+    def test_savepoint(self):
+        """Entities inserted since the last savepoint can be forgotten"""
+        cache = lobbyists.EntityCache()
+        cache.add('client', (1,), 1, True)
+        cache.savepoint()
+        cache.add('client', (2,), 2)
+        cache.add('client', (3,), 3, True)
+        cache.rollback_to_savepoint()
+        self.failUnlessEqual(cache.get('client', (1,)), 1)
+        self.failUnlessEqual(cache.get('client', (2,)), 2)
+        self.failUnlessEqual(cache.get('client', (3,)), None)
+        cache.clear()
+        self.failUnlessEqual(len(cache), 0)
+        self.failUnlessEqual(cache.hits, 2)
+
+    def test_values(self):
+        """Lookup table values are remembered once inserted"""
+        cache = lobbyists.EntityCache(2)
+        self.failUnless(cache.add_value('country', u'USA'))
+        self.failIf(cache.add_value('country', u'USA'))
+        self.failUnless(cache.add_value('state', u'USA'))
+        cache.savepoint()
+        self.failUnless(cache.add_value('country', u'CANADA'))
+        cache.rollback_to_savepoint()
+        self.failUnless(cache.add_value('country', u'CANADA'))
+        # The country table is full.
+        self.failUnless(cache.add_value('country', u'MEXICO'))
+        self.failUnless(cache.add_value('country', u'MEXICO'))
+        stats = cache.stats()
+        self.failUnlessEqual((stats['values'], stats['value_hits'],
+                              stats['value_misses']), (3, 1, 6))
+
+    def test_insert_value(self):
+        """Known lookup table values aren't inserted again"""
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        cur = con.cursor()
+        cache = lobbyists.EntityCache()
+        lobbyists.lobbyists._insert_value('org', u'ACME', cur, cache)
+        con.execute('DELETE FROM org')
+        lobbyists.lobbyists._insert_value('org', u'ACME', cur, cache)
+        self.failUnlessEqual(util.dump_db(con)['org'], [])
+        lobbyists.lobbyists._insert_value('org', u'ACME', cur)
+        self.failUnlessEqual(util.dump_db(con)['org'], [(u'ACME',)])
+
+
+class TestImportWithCache(unittest.TestCase):
+    def test_identical(self):
+        """Importing with a cache gives the same database"""
+        expected = import_all()
+        for size in [None, 2]:
+            for records in [False, True]:
+                cache = lobbyists.EntityCache(size)
+                self.failUnlessEqual(import_all(cache, records), expected,
+                                     (size, records))
+                self.failUnless(cache.hits > 0)
+                self.failUnless(cache.value_hits > 0)
+
+    def test_rollback(self):
+        """Entities and values rolled back with a filing are forgotten"""
+        stdout = sys.stdout
+        sys.stdout = cStringIO.StringIO()
+        try:
+            filings = list(lobbyists.parse_filings(
+                    util.testpath('lobbyists.xml')))
+            broken = filings[0]
+            lobbyists_ = broken['lobbyists']
+            broken['lobbyists'] = lobbyists_ + [{'lobbyist': dict(
+                        lobbyists_[0]['lobbyist'], status=object())}]
+            con = lobbyists.create_db(sqlite3.connect(':memory:'))
+            con.isolation_level = None
+            con.execute('BEGIN')
+            cache = lobbyists.EntityCache()
+            lobbyists.import_filings(con.cursor(), [broken], None, cache)
+            self.failUnlessEqual(len(cache), 0)
+            self.failUnlessEqual(cache.stats()['values'], 0)
+            broken['lobbyists'] = lobbyists_
+            lobbyists.import_filings(con.cursor(), filings, None, cache)
+            con.commit()
+        finally:
+            sys.stdout = stdout
+        cur = con.cursor()
+        cur.execute('SELECT COUNT(*) FROM filing_lobbyists WHERE lobbyist '
+                    'NOT IN (SELECT id FROM lobbyist)')
+        self.failUnlessEqual(cur.fetchone()[0], 0)
+        fresh = lobbyists.create_db(sqlite3.connect(':memory:'))
+        lobbyists.import_filings(fresh.cursor(), filings)
+        self.failUnlessEqual(util.dump_db(con),
+                             util.dump_db(fresh))
+
+    def test_load_db(self):
+        """load_db reports its cache's statistics"""
+        dir = tempfile.mkdtemp()
+        try:
+            con = load_util.load_db(util.data_files(),
+                                    os.path.join(dir, 'cache.db'))
+            con.close()
+        finally:
+            shutil.rmtree(dir)
+        stats = load_util.entity_cache_stats()
+        self.failUnless(stats['size'] > 0)
+        self.failUnlessEqual(stats['misses'], stats['size'])
+
+
+if __name__ == '__main__':
+    unittest.main()
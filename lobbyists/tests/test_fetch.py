@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+#
+# test_fetch.py - Tests for loading documents identified by URLs.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for loading documents identified by URLs."""
+
+import unittest
+import BaseHTTPServer
+import SocketServer
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib2
+import zipfile
+import lobbyists
+from lobbyists import util as load_util
+import util
+
+
+_docs = ['filings.xml', 'lobbyists.xml', 'issues.xml', 'clients.xml']
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves files from the server's directory.
+
+    The server's 'failures' dictionary maps a path to a list of
+    responses to send before serving the file: an HTTP status code, or
+    'truncate' to send only part of the file.
+
+    """
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.lock.acquire()
+        try:
+            server.requests.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            failures = server.failures.get(self.path)
+            failure = failures and failures.pop(0)
+        finally:
+            server.lock.release()
+        try:
+            time.sleep(server.delay)
+            path = os.path.join(server.dir, self.path.lstrip('/'))
+            if isinstance(failure, int):
+                self.send_error(failure)
+                return
+            if not os.path.exists(path):
+                self.send_error(404)
+                return
+            f = open(path, 'rb')
+            try:
+                data = f.read()
+            finally:
+                f.close()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            if failure == 'truncate':
+                data = data[:len(data) / 2]
+            self.wfile.write(data)
+        finally:
+            server.lock.acquire()
+            server.active -= 1
+            server.lock.release()
+
+
+class TestFetch(unittest.TestCase):
+    def setUp(self):
+        self.retry_delay = load_util._fetch_retry_delay
+        load_util._fetch_retry_delay = 0
+        self.dir = tempfile.mkdtemp()
+        self.served = os.path.join(self.dir, 'served')
+        os.mkdir(self.served)
+        for basename in _docs:
+            shutil.copy(util.testpath(basename), self.served)
+        archive = zipfile.ZipFile(os.path.join(self.served, 'docs.zip'), 'w',
+                                  zipfile.ZIP_DEFLATED)
+        try:
+            for basename in _docs:
+                archive.write(util.testpath(basename), basename)
+        finally:
+            archive.close()
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        self.server.dir = self.served
+        self.server.lock = threading.Lock()
+        self.server.requests = list()
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.failures = dict()
+        self.server.delay = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self.base = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+        load_util._fetch_retry_delay = self.retry_delay
+
+    def load(self, docs, name, **kwargs):
+        con = load_util.load_db(docs, os.path.join(self.dir, name), **kwargs)
+        try:
+            return util.dump_db(con)
+        finally:
+            con.close()
+
+    def test_load_urls(self):
+        """Documents identified by URLs are downloaded and loaded"""
+        expected = self.load([util.testpath(x) for x in _docs * 2],
+                             'local.db')
+        urls = [self.base + x for x in _docs]
+        # URLs, local files and archives can be mixed.
+        docs = [urls[0], util.testpath(_docs[1])] + urls[2:] + \
+            [self.base + 'docs.zip']
+        self.failUnlessEqual(self.load(docs, 'remote.db'), expected)
+        self.failUnlessEqual(self.load(docs, 'jobs.db', jobs=2,
+                                       pipeline=True),
+                             expected)
+
+    def test_downloads_removed(self):
+        """Downloaded documents are removed once they're loaded"""
+        dirs = list()
+        files = list()
+        mkdtemp = load_util.tempfile.mkdtemp
+        import_filings = load_util.lobbyists.import_filings
+        def recording_mkdtemp(*args, **kwargs):
+            dirs.append(mkdtemp(*args, **kwargs))
+            return dirs[-1]
+        def counting_import(cur, filings, *args):
+            files.append(len(os.listdir(dirs[0])))
+            return import_filings(cur, filings, *args)
+        load_util.tempfile.mkdtemp = recording_mkdtemp
+        load_util.lobbyists.import_filings = counting_import
+        try:
+            urls = [self.base + x for x in _docs * 2 + ['docs.zip']]
+            # With pipeline=True, the parser may run as many documents
+            # ahead as fit in its queue, so the bound below only holds
+            # for sequential loads.
+            for kwargs in [{}, {'manifest': True}]:
+                del dirs[:], files[:]
+                self.load(urls, 'removed.db', clobber=True,
+                          fetch_concurrency=1, **kwargs)
+                self.failUnlessEqual(len(files), 12, kwargs)
+                # The document being loaded, and the next one.
+                self.failUnless(max(files) <= 2, (files, kwargs))
+                self.failIf(os.path.exists(dirs[0]), kwargs)
+        finally:
+            load_util.tempfile.mkdtemp = mkdtemp
+            load_util.lobbyists.import_filings = import_filings
+
+    def test_concurrency(self):
+        """Downloads run concurrently, up to the given limit"""
+        self.server.delay = 0.2
+        urls = [self.base + x for x in _docs]
+        self.load(urls, 'concurrent.db', fetch_concurrency=4)
+        self.failUnless(self.server.max_active > 1, self.server.max_active)
+        self.server.max_active = 0
+        self.load(urls, 'serial.db', fetch_concurrency=1)
+        self.failUnlessEqual(self.server.max_active, 1)
+
+    def test_fetch_documents(self):
+        """fetch_documents yields local filenames in the order given"""
+        docs = [self.base + 'filings.xml', 'local.xml',
+                self.base + 'docs.zip']
+        fetched = list(load_util.fetch_documents(docs, self.dir))
+        self.failUnlessEqual(fetched[1], 'local.xml')
+        self.failUnlessEqual(os.path.dirname(fetched[0]), self.dir)
+        self.failUnless(fetched[0].endswith('filings.xml'))
+        self.failUnless(fetched[2].endswith('docs.zip'))
+        f = open(fetched[0], 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        f = open(util.testpath('filings.xml'), 'rb')
+        try:
+            self.failUnlessEqual(data, f.read())
+        finally:
+            f.close()
+
+    def test_retry(self):
+        """Server errors and incomplete downloads are retried"""
+        self.server.failures['/filings.xml'] = [503, 'truncate']
+        expected = self.load([util.testpath('filings.xml')], 'local.db')
+        actual = self.load([self.base + 'filings.xml'], 'remote.db',
+                           retries=2)
+        self.failUnlessEqual(actual, expected)
+        self.failUnlessEqual(self.server.requests, ['/filings.xml'] * 3)
+
+    def test_retries_exhausted(self):
+        """The last error is raised when every attempt fails"""
+        self.server.failures['/filings.xml'] = [503, 503]
+        self.failUnlessRaises(urllib2.HTTPError, self.load,
+                              [self.base + 'filings.xml'], 'remote.db',
+                              retries=1)
+        self.failUnlessEqual(len(self.server.requests), 2)
+
+    def test_not_found(self):
+        """Client errors aren't retried"""
+        self.failUnlessRaises(urllib2.HTTPError, self.load,
+                              [self.base + 'missing.xml'], 'remote.db',
+                              retries=3)
+        self.failUnlessEqual(self.server.requests, ['/missing.xml'])
+
+    def test_parse_url(self):
+        """parse_filings reads documents, gzipped or archived, by URL"""
+        gz = gzip.GzipFile(os.path.join(self.served, 'filings.xml.gz'), 'wb')
+        try:
+            gz.write(open(util.testpath('filings.xml'), 'rb').read())
+        finally:
+            gz.close()
+        expected = list(lobbyists.parse_filings(util.testpath('filings.xml')))
+        for backend in ['pulldom', 'expat', 'etree']:
+            for name in ['filings.xml', 'filings.xml.gz']:
+                self.failUnlessEqual(
+                    list(lobbyists.parse_filings(self.base + name, backend)),
+                    expected, (backend, name))
+        expected = list()
+        for basename in _docs:
+            expected.extend(lobbyists.parse_filings(util.testpath(basename)))
+        self.failUnlessEqual(
+            list(lobbyists.parse_filings(self.base + 'docs.zip')), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
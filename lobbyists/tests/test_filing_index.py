@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+# test_filing_index.py - Tests for random access to filings by ID.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for random access to filings by ID."""
+
+import unittest
+import lobbyists
+import lobbyists.util
+import os
+import shutil
+import sys
+import tempfile
+import cStringIO
+import util
+
+
+class TestFilingIndex(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def copy(self, basename):
+        """Copy a test document into the temporary directory."""
+        doc = os.path.join(self.dir, basename)
+        shutil.copy(util.testpath(basename), doc)
+        return doc
+
+    def test_index_entries(self):
+        """The index locates each Filing element"""
+        doc = self.copy('types.xml')
+        self.failUnlessEqual(lobbyists.index_filings(doc), 36)
+        self.failUnless(os.path.exists(doc + '.idx'))
+        entries = lobbyists.read_filing_index(doc)
+        self.failUnlessEqual(len(entries), 36)
+        f = open(doc, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        for id, (offset, length, year, type) in entries.iteritems():
+            elt = data[offset:offset + length]
+            self.failUnless(elt.startswith('<Filing ID="%s"' % id))
+            self.failUnless(elt.endswith('</Filing>'))
+        offset, length, year, type = \
+            entries[u'FE2A0EF2-2E78-457B-BD18-046FBDA102C7']
+        self.failUnlessEqual(year, u'2008')
+        self.failUnlessEqual(type, u'FIRST QUARTER REPORT')
+
+    def test_get_filings_matches_parse_filings(self):
+        """Parsing every indexed filing is the same as parsing the document"""
+        for basename in ['filings.xml', 'types.xml', 'lobbyists.xml',
+                         'issues.xml', 'affiliated_orgs.xml']:
+            doc = self.copy(basename)
+            lobbyists.index_filings(doc)
+            ids = lobbyists.read_filing_index(doc).keys()
+            for backend in ['pulldom', 'expat', 'etree']:
+                for records in [False, True]:
+                    expected = list(lobbyists.parse_filings(doc, backend,
+                                                            records))
+                    actual = list(lobbyists.get_filings(doc, ids, backend,
+                                                        records))
+                    self.failUnlessEqual(actual, expected,
+                                         (basename, backend, records))
+
+    def test_get_filing(self):
+        """A single filing is parsed by ID"""
+        doc = self.copy('types.xml')
+        index = os.path.join(self.dir, 'types.index')
+        lobbyists.index_filings(doc, index)
+        id = u'0E781869-DE6E-433A-BE8B-3481E38810B8'
+        filing = lobbyists.get_filing(doc, id, index=index)
+        self.failUnlessEqual(filing['filing']['id'], id)
+        self.failUnlessEqual(filing['filing']['type'],
+                             u'FIRST QUARTER TERMINATION AMENDMENT')
+        record = lobbyists.get_filing(doc, id, records=True, index=index)
+        self.failUnlessEqual(record.id, id)
+
+    def test_get_filings_document_order(self):
+        """Filings are yielded once each, in document order"""
+        doc = self.copy('types.xml')
+        lobbyists.index_filings(doc)
+        expected = [x['filing']['id'] for x in lobbyists.parse_filings(doc)]
+        ids = [expected[20], expected[3], expected[20], expected[10]]
+        actual = [x['filing']['id'] for x in lobbyists.get_filings(doc, ids)]
+        self.failUnlessEqual(actual, [expected[3], expected[10],
+                                      expected[20]])
+
+    def test_unknown_id(self):
+        """IDs missing from the index raise KeyError"""
+        doc = self.copy('types.xml')
+        lobbyists.index_filings(doc)
+        self.failUnlessRaises(KeyError, lobbyists.get_filing, doc, u'bogus')
+
+    def test_stale_index(self):
+        """An index which doesn't match the document raises ValueError"""
+        doc = self.copy('types.xml')
+        lobbyists.index_filings(doc)
+        f = open(doc, 'ab')
+        try:
+            f.write('\n')
+        finally:
+            f.close()
+        self.failUnlessRaises(ValueError, lobbyists.read_filing_index, doc)
+        self.failUnlessRaises(ValueError, lobbyists.read_filing_index, doc,
+                              util.testpath('types.xml'))
+
+    def test_utf16(self):
+        """Filings are extracted from documents in other encodings"""
+        doc = os.path.join(self.dir, 'filings.xml')
+        util.write_utf16('filings.xml', doc)
+        expected = list(lobbyists.parse_filings(doc))
+        self.failUnlessEqual(lobbyists.index_filings(doc), 5)
+        ids = [x['filing']['id'] for x in expected]
+        self.failUnlessEqual(list(lobbyists.get_filings(doc, ids)), expected)
+
+    def test_show_missing(self):
+        """IDs given to --show which aren't in any index are reported"""
+        doc = self.copy('types.xml')
+        id = 'FE2A0EF2-2E78-457B-BD18-046FBDA102C7'
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = cStringIO.StringIO()
+        sys.stderr = cStringIO.StringIO()
+        try:
+            ok = lobbyists.util.index_main(['lobbyists-index', '-s', id, doc])
+            missing = lobbyists.util.index_main(['lobbyists-index',
+                                                 '-s', id, '-s', 'bogus',
+                                                 doc])
+            shown = sys.stdout.getvalue()
+            errors = sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        self.failUnlessEqual(ok, 0)
+        self.failUnlessEqual(missing, 1)
+        self.failUnlessEqual(shown.count(id), 2)
+        self.failUnlessEqual(errors, 'Filing bogus not found\n')
+
+    def test_no_filings(self):
+        """A document without filings has an empty index"""
+        doc = os.path.join(self.dir, 'empty.xml')
+        f = open(doc, 'wb')
+        try:
+            f.write('<?xml version="1.0"?>\n<PublicFilings></PublicFilings>\n')
+        finally:
+            f.close()
+        self.failUnlessEqual(lobbyists.index_filings(doc), 0)
+        self.failUnlessEqual(lobbyists.read_filing_index(doc), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# test_interning.py - Tests for parser value interning.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for parser value interning."""
+
+import unittest
+import lobbyists
+import util
+
+
+class TestInterning(unittest.TestCase):
+    def setUp(self):
+        lobbyists.clear_interning()
+
+    def tearDown(self):
+        lobbyists.lobbyists._intern_pool_size = 10000
+        lobbyists.clear_interning()
+
+    def test_shared_values(self):
+        """Repeated values are shared by all filings"""
+        for backend in ['pulldom', 'expat', 'etree']:
+            filings = list(lobbyists.parse_filings(util.SyntheticDoc(3),
+                                                   backend))
+            first, rest = filings[0], filings[1:]
+            for filing in rest:
+                self.failUnless(filing['client']['country'] is
+                                first['client']['country'])
+                self.failUnless(filing['registrant']['ppb_country'] is
+                                first['client']['country'])
+                self.failUnless(filing['client']['state'] is
+                                first['client']['state'])
+                self.failUnless(filing['issues'][0]['issue']['code'] is
+                                first['issues'][0]['issue']['code'])
+                self.failUnless(filing['filing']['type'] is
+                                first['filing']['type'])
+
+    def test_stats(self):
+        """Interning statistics are counted per field"""
+        list(lobbyists.parse_filings(util.SyntheticDoc(10), 'expat'))
+        stats = lobbyists.interning_stats()
+        # Each filing has 4 country values, all 'USA', in 4 fields
+        # which share the 'country' pool. Whichever field is parsed
+        # first adds it to the pool.
+        fields = ['client.country', 'client.ppb_country',
+                  'registrant.country', 'registrant.ppb_country']
+        for field in fields:
+            self.failUnlessEqual(stats[field]['pool'], 'country')
+            self.failUnlessEqual(stats[field]['size'], 1)
+            self.failUnlessEqual(stats[field]['hits'] +
+                                 stats[field]['misses'], 10)
+            self.failUnlessEqual(stats[field]['overflows'], 0)
+        self.failUnlessEqual(sum([stats[f]['misses'] for f in fields]), 1)
+        # Each filing has 2 issue codes.
+        self.failUnlessEqual(stats['issue.code'], {'pool': 'issue_code',
+                                                   'size': 2,
+                                                   'hits': 18,
+                                                   'misses': 2,
+                                                   'overflows': 0})
+        self.failUnlessEqual(stats['filing.type']['size'], 1)
+        # No GovernmentEntity elements in the synthetic document.
+        self.failUnlessEqual(stats['govt_entity.name']['hits'], 0)
+        lobbyists.clear_interning()
+        stats = lobbyists.interning_stats()
+        self.failUnlessEqual(stats['client.country'], {'pool': 'country',
+                                                       'size': 0,
+                                                       'hits': 0,
+                                                       'misses': 0,
+                                                       'overflows': 0})
+
+    def test_bounded(self):
+        """Full pools don't grow, and values are still parsed correctly"""
+        lobbyists.lobbyists._intern_pool_size = 2
+        doc = util.testpath('government_entity_name.xml')
+        expected = list(lobbyists.parse_filings(doc))
+        lobbyists.clear_interning()
+        actual = list(lobbyists.parse_filings(doc))
+        self.failUnlessEqual(actual, expected)
+        stats = lobbyists.interning_stats()['govt_entity.name']
+        self.failUnlessEqual(stats['size'], 2)
+        self.failUnless(stats['overflows'] > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
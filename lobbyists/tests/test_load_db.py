@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# test_load_db.py - Tests for lobbyists.util.load_db.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for lobbyists.util.load_db."""
+
+import unittest
+import os
+import shutil
+import tempfile
+import xml.parsers.expat
+from lobbyists import util as load_util
+import util
+
+
+class TestLoadDB(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def load(self, docs, name, **kwargs):
+        con = load_util.load_db(docs, os.path.join(self.dir, name), **kwargs)
+        try:
+            return util.dump_db(con)
+        finally:
+            con.close()
+
+    def test_parallel_matches_sequential(self):
+        """Parallel loading produces the same database as sequential"""
+        docs = util.data_files()
+        expected = self.load(docs, 'sequential.db')
+        for jobs in [2, 3]:
+            actual = self.load(docs, 'jobs%d.db' % jobs, jobs=jobs)
+            self.failUnlessEqual(actual, expected, jobs)
+
+    def test_parallel_small_batches(self):
+        """Documents spanning several batches load in order"""
+        doc = os.path.join(self.dir, 'synthetic.xml')
+        f = open(doc, 'wb')
+        try:
+            f.write(util.SyntheticDoc(1200).read())
+        finally:
+            f.close()
+        docs = [doc, util.testpath('filings.xml'), doc]
+        expected = self.load(docs, 'sequential.db')
+        actual = self.load(docs, 'parallel.db', jobs=2)
+        self.failUnlessEqual(actual, expected)
+
+    def test_parallel_parse_error(self):
+        """Parse errors in worker processes are raised by load_db"""
+        bad = os.path.join(self.dir, 'bad.xml')
+        f = open(bad, 'wb')
+        try:
+            f.write('<PublicFilings><Filing ID="1"')
+        finally:
+            f.close()
+        docs = [util.testpath('filings.xml'), bad]
+        self.failUnlessRaises(xml.parsers.expat.ExpatError,
+                              load_util.load_db, docs,
+                              os.path.join(self.dir, 'expat.db'),
+                              backend='expat', jobs=2)
+        # pulldom's SAXParseExceptions can't be sent between processes.
+        self.failUnlessRaises(RuntimeError,
+                              load_util.load_db, docs,
+                              os.path.join(self.dir, 'pulldom.db'), jobs=2)
+
+    def test_pipeline_matches_sequential(self):
+        """Pipelined loading produces the same database as sequential"""
+        docs = util.data_files()
+        expected = self.load(docs, 'sequential.db')
+        for jobs in [None, 2]:
+            actual = self.load(docs, 'pipeline%s.db' % jobs, pipeline=True,
+                               commit_per_doc=True, jobs=jobs)
+            self.failUnlessEqual(actual, expected, jobs)
+
+    def test_write_batch_matches_unbatched(self):
+        """Batched writes produce the same database as unbatched"""
+        docs = util.data_files()
+        expected = self.load(docs, 'unbatched.db', write_batch=0)
+        for write_batch in [1, 3, 100]:
+            for pipeline in [False, True]:
+                actual = self.load(docs, 'batched%d%s.db' % (write_batch,
+                                                             pipeline),
+                                   write_batch=write_batch,
+                                   pipeline=pipeline)
+                self.failUnlessEqual(actual, expected,
+                                     (write_batch, pipeline))
+
+    def test_pipeline_stats(self):
+        """Pipelined loading reports its statistics"""
+        doc = os.path.join(self.dir, 'synthetic.xml')
+        f = open(doc, 'wb')
+        try:
+            f.write(util.SyntheticDoc(1000).read())
+        finally:
+            f.close()
+        self.load([doc], 'pipeline.db', pipeline=True)
+        stats = load_util.pipeline_stats()
+        self.failUnlessEqual(stats['filings'], 1000)
+        self.failUnlessEqual(stats['batches'], 10)
+        self.failUnless(0 <= stats['mean_depth'] <= stats['max_depth'] <= 16)
+        for key in ['elapsed', 'throughput', 'parser_stall',
+                    'importer_stall']:
+            self.failUnless(stats[key] >= 0, key)
+
+    def test_pipeline_parse_error(self):
+        """Parse errors in the parser thread are raised by load_db"""
+        bad = os.path.join(self.dir, 'bad.xml')
+        f = open(bad, 'wb')
+        try:
+            f.write('<PublicFilings><Filing ID="1"')
+        finally:
+            f.close()
+        docs = [util.testpath('filings.xml'), bad]
+        self.failUnlessRaises(xml.parsers.expat.ExpatError,
+                              load_util.load_db, docs,
+                              os.path.join(self.dir, 'bad.db'),
+                              backend='expat', pipeline=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
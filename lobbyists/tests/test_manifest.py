@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+#
+# test_manifest.py - Tests for load_db's document manifest.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for load_db's document manifest."""
+
+import unittest
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+from lobbyists import util as load_util
+import util
+
+
+class TestManifest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'manifest.db')
+        self.import_filings = load_util.lobbyists.import_filings
+        self.counter = util.CountingImport(self.import_filings)
+        load_util.lobbyists.import_filings = self.counter
+        self.doc = os.path.join(self.dir, 'filings.xml')
+        self.copy('filings.xml', self.doc)
+
+    def tearDown(self):
+        load_util.lobbyists.import_filings = self.import_filings
+        shutil.rmtree(self.dir)
+
+    def copy(self, name, path):
+        shutil.copyfile(util.testpath(name), path)
+
+    def load(self, docs, **kwargs):
+        self.counter.imported = 0
+        con = load_util.load_db(docs, self.db, manifest=True, **kwargs)
+        try:
+            db = util.dump_db(con)
+        finally:
+            con.close()
+        # The time at which each document was loaded varies.
+        return dict((row[0], row[1:-1]) for row in db['load_manifest'])
+
+    def sha1(self, path):
+        return hashlib.sha1(open(path, 'rb').read()).hexdigest()
+
+    def test_manifest(self):
+        """Loaded documents are recorded in the manifest"""
+        manifest = self.load([self.doc])
+        self.failUnlessEqual(self.counter.imported, 5)
+        self.failUnlessEqual(manifest,
+                             {self.doc: (os.path.getsize(self.doc),
+                                         os.path.getmtime(self.doc),
+                                         self.sha1(self.doc), 5)})
+
+    def test_skip_unchanged(self):
+        """Unchanged documents aren't loaded again"""
+        for kwargs in [{}, {'jobs': 2}, {'pipeline': True}]:
+            expected = self.load([self.doc], **kwargs)
+            self.failUnlessEqual(self.load([self.doc], **kwargs), expected)
+            self.failUnlessEqual(self.counter.imported, 0, kwargs)
+
+    def test_skip_touched(self):
+        """Documents whose contents are unchanged aren't loaded again"""
+        self.load([self.doc])
+        mtime = os.path.getmtime(self.doc) - 100
+        os.utime(self.doc, (mtime, mtime))
+        self.load([self.doc])
+        self.failUnlessEqual(self.counter.imported, 0)
+
+    def test_reload_changed(self):
+        """Documents which have changed are loaded again"""
+        self.load([self.doc])
+        self.copy('clients.xml', self.doc)
+        manifest = self.load([self.doc])
+        self.failUnlessEqual(self.counter.imported, 26)
+        self.failUnlessEqual(manifest[self.doc][2:],
+                             (self.sha1(self.doc), 26))
+
+    def test_archive(self):
+        """ZIP archives are recorded as a whole"""
+        archive = os.path.join(self.dir, 'filings.zip')
+        z = zipfile.ZipFile(archive, 'w')
+        try:
+            z.write(util.testpath('lobbyists.xml'), 'a.xml')
+            z.write(util.testpath('issues.xml'), 'b.xml')
+        finally:
+            z.close()
+        manifest = self.load([archive, self.doc])
+        self.failUnlessEqual(self.counter.imported, 18)
+        self.failUnlessEqual(manifest[archive][3], 13)
+        self.load([archive, self.doc])
+        self.failUnlessEqual(self.counter.imported, 0)
+
+    def test_without_manifest(self):
+        """Without a manifest, documents are always loaded"""
+        for i in range(2):
+            self.counter.imported = 0
+            con = load_util.load_db([self.doc], self.db)
+            try:
+                self.failIf('load_manifest' in util.dump_db(con))
+            finally:
+                con.close()
+            self.failUnlessEqual(self.counter.imported, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# test_parse_backends.py - Tests for lobbyists.parse_filings backends.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for lobbyists.parse_filings backends."""
+
+import unittest
+import lobbyists
+import os
+import util
+
+
+def current_rss():
+    """The current resident set size of this process (in bytes).
+
+    Returns None if it can't be determined on this platform.
+
+    """
+    try:
+        statm = open('/proc/self/statm')
+    except IOError:
+        return None
+    try:
+        pages = int(statm.read().split()[1])
+    finally:
+        statm.close()
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class TestParseBackends(unittest.TestCase):
+    def test_expat_matches_pulldom(self):
+        """The expat backend's output is identical to pulldom's"""
+        for doc in util.data_files():
+            expected = list(lobbyists.parse_filings(doc, 'pulldom'))
+            actual = list(lobbyists.parse_filings(doc, 'expat'))
+            self.failUnlessEqual(actual, expected, doc)
+
+    def test_expat_file_object(self):
+        """The expat backend accepts file-like objects"""
+        doc = util.testpath('lobbyists.xml')
+        expected = list(lobbyists.parse_filings(doc))
+        f = open(doc, 'rb')
+        try:
+            actual = list(lobbyists.parse_filings(f, 'expat'))
+        finally:
+            f.close()
+        self.failUnlessEqual(actual, expected)
+
+    def test_expat_small_buffer(self):
+        """Filings split across expat input buffers are parsed correctly"""
+        doc = util.testpath('clients.xml')
+        expected = list(lobbyists.parse_filings(doc))
+        bufsize = lobbyists.lobbyists._bufsize
+        lobbyists.lobbyists._bufsize = 7
+        try:
+            actual = list(lobbyists.parse_filings(doc, 'expat'))
+        finally:
+            lobbyists.lobbyists._bufsize = bufsize
+        self.failUnlessEqual(actual, expected)
+
+    def test_etree_matches_pulldom(self):
+        """The etree backend's output is identical to pulldom's"""
+        for doc in util.data_files():
+            expected = list(lobbyists.parse_filings(doc, 'pulldom'))
+            actual = list(lobbyists.parse_filings(doc, 'etree'))
+            self.failUnlessEqual(actual, expected, doc)
+
+    def test_etree_file_object(self):
+        """The etree backend accepts file-like objects"""
+        expected = list(lobbyists.parse_filings(util.SyntheticDoc(10)))
+        actual = list(lobbyists.parse_filings(util.SyntheticDoc(10), 'etree'))
+        self.failUnlessEqual(actual, expected)
+
+    def test_etree_bounded_memory(self):
+        """The etree backend's memory use doesn't grow with document size"""
+        # Warm up with a small document, then parse one 20 times
+        # larger, sampling the current RSS as it goes. If Filing
+        # elements weren't released, the larger document would add on
+        # the order of 100MB to the RSS. The process's peak RSS isn't
+        # used, because earlier tests may have raised it already.
+        if current_rss() is None:
+            self.skipTest('current RSS is unavailable on this platform')
+        for filing in lobbyists.parse_filings(util.SyntheticDoc(1000),
+                                              'etree'):
+            pass
+        baseline = current_rss()
+        peak = baseline
+        count = 0
+        for filing in lobbyists.parse_filings(util.SyntheticDoc(20000),
+                                              'etree'):
+            count += 1
+            if count % 1000 == 0:
+                peak = max(peak, current_rss())
+        self.failUnlessEqual(count, 20000)
+        self.failUnless(peak - baseline < 8 * 1024 * 1024)
+
+    def test_unknown_backend(self):
+        """Asking for an unknown backend raises KeyError"""
+        self.failUnlessRaises(KeyError, lobbyists.parse_filings,
+                              util.testpath('ids.xml'), 'no-such-backend')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+# test_parse_fields.py - Tests for parsing selected filing fields.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for parsing selected filing fields."""
+
+import unittest
+import lobbyists
+import util
+
+
+_all_fields = ['registrant', 'client', 'lobbyists', 'govt_entities',
+               'issues', 'foreign_entities', 'affiliated_orgs']
+
+_backends = ['pulldom', 'expat', 'etree']
+
+
+def project(filing, fields):
+    """Remove the unselected fields from a filing dictionary."""
+    return dict((k, v) for k, v in filing.iteritems()
+                if k == 'filing' or k in fields)
+
+
+class TestParseFields(unittest.TestCase):
+    def test_dicts(self):
+        """Only the selected sub-elements are parsed into dictionaries"""
+        for doc in util.data_files():
+            filings = list(lobbyists.parse_filings(doc))
+            for fields in [[], ['registrant', 'client'],
+                           ['lobbyists', 'issues'], _all_fields]:
+                expected = [project(x, fields) for x in filings]
+                for backend in _backends:
+                    actual = list(lobbyists.parse_filings(doc, backend,
+                                                          fields=fields))
+                    self.failUnlessEqual(actual, expected,
+                                         (doc, backend, fields))
+
+    def test_records(self):
+        """Unselected sub-elements of records are left at their defaults"""
+        doc = util.testpath('filings.xml')
+        expected = list(lobbyists.parse_filings(doc, records=True))
+        fields = ['client', 'issues']
+        for backend in _backends:
+            actual = list(lobbyists.parse_filings(doc, backend, True,
+                                                  fields=fields))
+            self.failUnlessEqual(len(actual), len(expected))
+            for x, y in zip(actual, expected):
+                self.failUnlessEqual(x.id, y.id)
+                self.failUnlessEqual(x.client, y.client)
+                self.failUnlessEqual(x.issues, y.issues)
+                self.failUnlessEqual(x.registrant, None)
+                self.failUnlessEqual(x.lobbyists, [])
+
+    def test_unknown_field(self):
+        """Unknown fields raise ValueError"""
+        self.failUnlessRaises(ValueError, lobbyists.parse_filings,
+                              util.testpath('filings.xml'),
+                              fields=['client', 'bogus'])
+
+
+if __name__ == '__main__':
+    unittest.main()
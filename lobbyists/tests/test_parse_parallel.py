@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# test_parse_parallel.py - Tests for lobbyists.parse_filings_parallel.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for lobbyists.parse_filings_parallel."""
+
+import unittest
+import lobbyists
+import os
+import tempfile
+import util
+
+
+class TestParseParallel(unittest.TestCase):
+    def test_chunks(self):
+        """Documents are split at Filing start tags"""
+        doc = util.testpath('types.xml')
+        prolog, chunks = lobbyists.lobbyists._chunks(doc, 1000)
+        self.failUnless(len(chunks) > 1)
+        self.failUnless(prolog.rstrip().endswith('-->'))
+        f = open(doc, 'rb')
+        try:
+            data = f.read()
+        finally:
+            f.close()
+        for start, end, epilogue in chunks[:-1]:
+            self.failUnless(data[start:].startswith('<Filing '))
+            self.failUnlessEqual(epilogue, '</PublicFilings>')
+        start, end, epilogue = chunks[-1]
+        self.failUnlessEqual(end, len(data))
+        self.failUnlessEqual(epilogue, '')
+
+    def test_no_filings(self):
+        """A document without filings has no chunks"""
+        fd, path = tempfile.mkstemp('.xml')
+        try:
+            os.write(fd, '<PublicFilings>\n</PublicFilings>\n')
+            os.close(fd)
+            self.failUnlessEqual(lobbyists.lobbyists._chunks(path, 10),
+                                 (None, []))
+            self.failUnlessEqual(
+                list(lobbyists.parse_filings_parallel(path, processes=1)), [])
+        finally:
+            os.remove(path)
+
+    def test_not_found(self):
+        """Documents whose Filing elements can't be found are errors"""
+        for data in ['<PublicFilings><Other/></PublicFilings>\n',
+                     '<?xml version="1.0" encoding="x-bogus"?>\n'
+                     '<PublicFilings><Filing ID="1"/></PublicFilings>\n']:
+            fd, path = tempfile.mkstemp('.xml')
+            try:
+                os.write(fd, data)
+                os.close(fd)
+                self.failUnlessRaises(ValueError, lobbyists.lobbyists._chunks,
+                                      path, 10)
+            finally:
+                os.remove(path)
+
+    def test_utf16(self):
+        """Documents are split in their own encoding"""
+        fd, path = tempfile.mkstemp('.xml')
+        os.close(fd)
+        try:
+            util.write_utf16('filings.xml', path)
+            expected = list(lobbyists.parse_filings(path))
+            self.failUnlessEqual(len(expected), 5)
+            prolog, chunks = lobbyists.lobbyists._chunks(path, 500)
+            self.failUnless(len(chunks) > 1)
+            self.failUnlessEqual(chunks[0][2],
+                                 u'</PublicFilings>'.encode('utf-16-le'))
+            actual = list(lobbyists.parse_filings_parallel(path, 'expat',
+                                                           processes=2,
+                                                           chunk_size=500))
+            self.failUnlessEqual(actual, expected)
+        finally:
+            os.remove(path)
+
+    def test_matches_sequential(self):
+        """Parallel parsing yields the same filings, in the same order"""
+        for doc in ['affiliated_orgs.xml', 'clients.xml', 'issues.xml',
+                    'lobbyists.xml', 'types.xml']:
+            path = util.testpath(doc)
+            expected = list(lobbyists.parse_filings(path))
+            actual = list(lobbyists.parse_filings_parallel(path, 'expat',
+                                                           processes=2,
+                                                           chunk_size=500))
+            self.failUnlessEqual(actual, expected, doc)
+
+    def test_records(self):
+        """Parallel parsing works with compact records"""
+        fd, path = tempfile.mkstemp('.xml')
+        try:
+            os.write(fd, util.SyntheticDoc(500).read())
+            os.close(fd)
+            expected = list(lobbyists.parse_filings(path, 'expat', True))
+            actual = list(lobbyists.parse_filings_parallel(path, 'etree', True,
+                                                           processes=2,
+                                                           chunk_size=20000))
+            self.failUnlessEqual(len(actual), 500)
+            self.failUnlessEqual(actual, expected)
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# test_parse_where.py - Tests for parsing selected filings.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for parsing selected filings."""
+
+import unittest
+import lobbyists
+import util
+
+
+_backends = ['pulldom', 'expat', 'etree']
+
+
+class TestParseWhere(unittest.TestCase):
+    def check(self, doc, where):
+        """Compare filtered parsing with filtering the parsed filings."""
+        expected = [x for x in lobbyists.parse_filings(doc)
+                    if where(x['filing'])]
+        expected_records = [x for x in lobbyists.parse_filings(doc,
+                                                               records=True)
+                            if where(x)]
+        for backend in _backends:
+            actual = list(lobbyists.parse_filings(doc, backend, where=where))
+            self.failUnlessEqual(actual, expected, backend)
+            actual = list(lobbyists.parse_filings(doc, backend, True,
+                                                  where=where))
+            self.failUnlessEqual(actual, expected_records, backend)
+        return expected
+
+    def test_year(self):
+        """Filings are selected by year"""
+        doc = util.testpath('years.xml')
+        filings = self.check(doc, lobbyists.FilingFilter(year=2008))
+        self.failUnless(filings)
+        for x in filings:
+            self.failUnlessEqual(x['filing']['year'], 2008)
+        filings = self.check(doc, lobbyists.FilingFilter(year=[1999, 2008]))
+        self.failUnlessEqual(set(x['filing']['year'] for x in filings),
+                             set([1999, 2008]))
+
+    def test_type(self):
+        """Filings are selected by type"""
+        doc = util.testpath('types.xml')
+        filings = self.check(doc, lobbyists.FilingFilter(type=u'REGISTRATION'))
+        self.failUnless(filings)
+        for x in filings:
+            self.failUnlessEqual(x['filing']['type'], u'REGISTRATION')
+
+    def test_period(self):
+        """Filings are selected by period"""
+        filings = self.check(util.testpath('periods.xml'),
+                             lobbyists.FilingFilter(period=['Q1', 'H2']))
+        self.failUnlessEqual(set(x['filing']['period'] for x in filings),
+                             set(['Q1', 'H2']))
+
+    def test_received(self):
+        """Filings are selected by received date range"""
+        where = lobbyists.FilingFilter(received=('2007-02-13',
+                                                 '2007-02-14'))
+        filings = self.check(util.testpath('filing_dates.xml'), where)
+        self.failUnlessEqual([x['filing']['filing_date'] for x in filings],
+                             [u'2007-02-13T16:07:28'])
+        self.check(util.testpath('filings.xml'),
+                   lobbyists.FilingFilter(received=(None, '2008')))
+
+    def test_callable(self):
+        """Any callable can select filings"""
+        for doc in util.data_files():
+            self.check(doc, lambda filing: filing['amount'] is not None)
+
+    def test_fields(self):
+        """where and fields can be combined"""
+        doc = util.testpath('types.xml')
+        where = lobbyists.FilingFilter(year=2008)
+        expected = [dict(filing=x['filing'])
+                    for x in lobbyists.parse_filings(doc, where=where)]
+        for backend in _backends:
+            actual = list(lobbyists.parse_filings(doc, backend, fields=[],
+                                                  where=where))
+            self.failUnlessEqual(actual, expected, backend)
+
+    def test_parallel(self):
+        """FilingFilters can be passed to worker processes"""
+        doc = util.testpath('types.xml')
+        where = lobbyists.FilingFilter(year=2008)
+        expected = list(lobbyists.parse_filings(doc, where=where))
+        actual = list(lobbyists.parse_filings_parallel(doc, where=where,
+                                                       chunk_size=1000))
+        self.failUnlessEqual(actual, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# test_records.py - Tests for compact filing records.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for compact filing records."""
+
+import unittest
+import lobbyists
+import sqlite3
+import cStringIO
+import util
+
+
+_singletons = ['registrant', 'client']
+
+_lists = [('lobbyists', 'lobbyist'),
+          ('govt_entities', 'govt_entity'),
+          ('issues', 'issue'),
+          ('foreign_entities', 'foreign_entity'),
+          ('affiliated_orgs', 'org')]
+
+
+def as_dict(record):
+    """Convert a Filing record to the equivalent filing dictionary.
+
+    Empty lists are omitted, since records can't distinguish them
+    from missing list elements.
+
+    """
+    def attrs(r):
+        return dict((name, r[name]) for name in r.__slots__)
+    subelts = _singletons + [key for key, item_key in _lists]
+    filing = dict((name, record[name]) for name in record.__slots__
+                  if name not in subelts)
+    result = {'filing': filing}
+    for key in _singletons:
+        if record[key] is not None:
+            result[key] = attrs(record[key])
+    for key, item_key in _lists:
+        if record[key]:
+            result[key] = [{item_key: attrs(x)} for x in record[key]]
+    return result
+
+
+def without_empty_lists(filing):
+    return dict((k, v) for k, v in filing.iteritems() if v != [])
+
+
+def import_db(filings):
+    con = sqlite3.connect(':memory:')
+    con = lobbyists.create_db(con)
+    lobbyists.import_filings(con.cursor(), filings)
+    return con
+
+
+class TestRecords(unittest.TestCase):
+    def test_records_match_dicts(self):
+        """Records contain the same values as filing dictionaries"""
+        for doc in util.data_files():
+            expected = [without_empty_lists(x)
+                        for x in lobbyists.parse_filings(doc)]
+            for backend in ['pulldom', 'expat', 'etree']:
+                actual = [as_dict(x) for x in
+                          lobbyists.parse_filings(doc, backend, records=True)]
+                self.failUnlessEqual(actual, expected, (doc, backend))
+
+    def test_record_types(self):
+        """Records are slotted instances of the record classes"""
+        doc = util.testpath('lobbyists.xml')
+        for backend in ['pulldom', 'expat', 'etree']:
+            for filing in lobbyists.parse_filings(doc, backend, True):
+                self.failUnless(isinstance(filing, lobbyists.Filing))
+                self.failIf(hasattr(filing, '__dict__'))
+                for lobbyist in filing.lobbyists:
+                    self.failUnless(isinstance(lobbyist, lobbyists.Lobbyist))
+                    self.failUnlessEqual(lobbyist['name'], lobbyist.name)
+
+    def test_record_mapping(self):
+        """Records behave like dictionaries when subscripted and hashed"""
+        doc = util.testpath('lobbyists.xml')
+        filing = list(lobbyists.parse_filings(doc, 'expat', True))[0]
+        lobbyist = filing.lobbyists[0]
+        self.failUnlessRaises(KeyError, lambda: lobbyist['no_such_field'])
+        self.failUnlessRaises(TypeError, hash, lobbyist)
+        self.failUnlessRaises(TypeError, hash, filing)
+
+    def test_missing_subelements(self):
+        """Missing sub-elements are None or empty lists in records"""
+        doc = util.testpath('filings.xml')
+        for filing in lobbyists.parse_filings(doc, 'expat', True):
+            self.failUnlessEqual(filing.client, None)
+            self.failUnlessEqual(filing.registrant, None)
+            self.failUnlessEqual(filing.lobbyists, [])
+            self.failUnlessEqual(filing.affiliated_orgs, [])
+
+    def test_import_records(self):
+        """Importing records fills the database as dictionaries do"""
+        for doc in ['affiliated_orgs.xml', 'clients.xml',
+                    'foreign_entities.xml', 'govt_entities.xml',
+                    'issues.xml', 'lobbyists.xml', 'registrants.xml']:
+            path = util.testpath(doc)
+            filings = lobbyists.parse_filings(path)
+            expected = util.dump_db(import_db(filings), sort=True)
+            records = lobbyists.parse_filings(path, 'expat', records=True)
+            actual = util.dump_db(import_db(records), sort=True)
+            self.failUnlessEqual(actual, expected, doc)
+
+    def test_import_empty_lists(self):
+        """Empty list elements are imported alike by every import path"""
+        doc = ('<PublicFilings>'
+               '<Filing ID="04926911-8A12-4A0E-9DA4-510869446EAC" '
+               'Year="2000" Received="2000-08-14T00:00:00" Amount="20000" '
+               'Type="MID-YEAR REPORT" Period="Mid-Year (Jan 1 - Jun 30)">'
+               '<Lobbyists></Lobbyists><Issues/>'
+               '</Filing>'
+               '</PublicFilings>')
+        def parse(records):
+            return lobbyists.parse_filings(cStringIO.StringIO(doc),
+                                           'expat', records=records)
+        filings = list(parse(False))
+        self.failUnlessEqual(filings[0]['lobbyists'], [])
+        expected = util.dump_db(import_db(filings), sort=True)
+        self.failUnlessEqual(len(expected['filing']), 1)
+        actual = util.dump_db(import_db(parse(True)), sort=True)
+        self.failUnlessEqual(actual, expected)
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        loader = lobbyists.BulkLoader(con.cursor())
+        loader.stage(parse(False))
+        loader.finish()
+        self.failUnlessEqual(util.dump_db(con, sort=True), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# test_savepoints.py - Tests for importing each filing atomically.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for importing each filing atomically."""
+
+import unittest
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import cStringIO
+import lobbyists
+from lobbyists import util as load_util
+import util
+
+
+class Broken(Exception):
+    pass
+
+
+def parse(name, records=False):
+    return list(lobbyists.parse_filings(util.testpath(name), 'pulldom',
+                                        records))
+
+
+def count(con, table):
+    cur = con.cursor()
+    cur.execute('SELECT COUNT(*) FROM %s' % table)
+    return cur.fetchone()[0]
+
+
+class TestSavepoints(unittest.TestCase):
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = cStringIO.StringIO()
+        self.filings = parse('issues.xml')
+        self.broken = self.filings[0]['filing']['id']
+        # The first filing's last issue can't be imported, but the
+        # rest of its issues can.
+        self.filings[0]['issues'][-1]['issue']['code'] = object()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def check(self, con):
+        cur = con.cursor()
+        cur.execute('SELECT id FROM filing')
+        self.failUnlessEqual(sorted(x[0] for x in cur.fetchall()),
+                             sorted(x['filing']['id']
+                                    for x in self.filings[1:]))
+        cur.execute('SELECT COUNT(*) FROM filing_issues WHERE filing=?',
+                    [self.broken])
+        self.failUnlessEqual(cur.fetchone()[0], 0)
+        self.failUnlessEqual(count(con, 'filing_issues'),
+                             sum(len(x['issues']) for x in self.filings[1:]))
+        self.failUnless(self.broken in sys.stdout.getvalue())
+
+    def test_savepoint(self):
+        """Failed filings are rolled back to their savepoints"""
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        con.isolation_level = None
+        con.execute('BEGIN')
+        lobbyists.import_filings(con.cursor(), self.filings)
+        self.check(con)
+        # Only the failed filing's issues were rolled back.
+        self.failUnlessEqual(count(con, 'issue'),
+                             count(con, 'filing_issues'))
+        # The savepoints didn't commit the enclosing transaction.
+        con.rollback()
+        self.failUnlessEqual(count(con, 'filing'), 0)
+
+    def test_without_savepoints(self):
+        """Without savepoints, failed filings are deleted"""
+        for batch_size in [None, 1000]:
+            con = lobbyists.create_db(sqlite3.connect(':memory:'))
+            lobbyists.import_filings(con.cursor(), self.filings,
+                                     batch_size=batch_size)
+            self.check(con)
+            # The failed filing's issues were deleted with it.
+            self.failUnlessEqual(count(con, 'issue'),
+                                 count(con, 'filing_issues'))
+            con.rollback()
+            self.failUnlessEqual(count(con, 'filing'), 0)
+
+    def test_records(self):
+        """Failed Filing records are rolled back too"""
+        filings = parse('issues.xml', True)
+        filings[0].issues[-1].code = object()
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        con.isolation_level = None
+        con.execute('BEGIN')
+        lobbyists.import_filings(con.cursor(), filings)
+        self.check(con)
+
+    def test_retry(self):
+        """A failed filing can be imported once it's fixed"""
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        lobbyists.import_filings(con.cursor(), self.filings)
+        fixed = parse('issues.xml')
+        lobbyists.import_filings(con.cursor(), fixed[:1])
+        expected = lobbyists.create_db(sqlite3.connect(':memory:'))
+        lobbyists.import_filings(expected.cursor(), fixed[1:] + fixed[:1])
+        for table in ['filing', 'filing_issues', 'issue_code']:
+            self.failUnlessEqual(count(con, table), count(expected, table))
+
+
+class TestLoadSavepoints(unittest.TestCase):
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = cStringIO.StringIO()
+        self.dir = tempfile.mkdtemp()
+        self.importers = lobbyists.lobbyists._entity_importers
+        self.broken = parse('issues.xml')[2]['filing']['id']
+        lobbyists.lobbyists._entity_importers = \
+            self.importers + [('issues', self.broken_importer)]
+
+    def tearDown(self):
+        lobbyists.lobbyists._entity_importers = self.importers
+        shutil.rmtree(self.dir)
+        sys.stdout = self.stdout
+
+    def broken_importer(self, issues, filing, cur, cache=None):
+        if filing['id'] == self.broken:
+            raise Broken()
+
+    def test_load_db(self):
+        """load_db rolls back failed filings, and only them"""
+        dbname = os.path.join(self.dir, 'savepoints.db')
+        for kwargs in [{}, {'commit_per_doc': True}, {'pipeline': True},
+                       {'checkpoint': 2}]:
+            con = load_util.load_db([util.testpath('issues.xml')], dbname,
+                                    clobber=True, **kwargs)
+            try:
+                self.failUnlessEqual(con.isolation_level, '')
+                db = util.dump_db(con)
+            finally:
+                con.close()
+            ids = [x[0] for x in db['filing']]
+            self.failUnlessEqual(len(ids), 4, kwargs)
+            self.failIf(self.broken in ids, kwargs)
+            self.failIf([x for x in db['filing_issues']
+                         if x[0] == self.broken], kwargs)
+
+
+if __name__ == '__main__':
+    unittest.main()
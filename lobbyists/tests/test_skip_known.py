@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+#
+# test_skip_known.py - Tests for skipping filings already in the database.
+# Copyright (C) 2008 by Drew Hess <dhess@bothan.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for skipping filings already in the database."""
+
+import unittest
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import cStringIO
+import lobbyists
+from lobbyists import util as load_util
+import util
+
+
+class TestFilingIDs(unittest.TestCase):
+    def test_membership(self):
+        """FilingIDs holds GUIDs and other IDs exactly"""
+        ids = lobbyists.FilingIDs()
+        guid = u'D48A20C9-211C-43B1-BBD1-001B075854BA'
+        ids.add(guid)
+        ids.add(u'not a GUID')
+        self.failUnless(guid in ids)
+        self.failUnless(u'not a GUID' in ids)
+        self.failIf(guid.lower() in ids)
+        self.failIf(u'5F787E27-BBF1-45A5-8392-FFF93CCA2746' in ids)
+        self.failIf(u'not a GUID either' in ids)
+        self.failUnlessEqual(len(ids), 2)
+
+    def test_from_database(self):
+        """FilingIDs can be filled from the database"""
+        filings = list(lobbyists.parse_filings(util.testpath('filings.xml')))
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        lobbyists.import_filings(con.cursor(), filings)
+        ids = lobbyists.FilingIDs(con.cursor())
+        self.failUnlessEqual(len(ids), 5)
+        for filing in filings:
+            self.failUnless(filing['filing']['id'] in ids)
+
+
+class TestSkipKnown(unittest.TestCase):
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = cStringIO.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def test_import_known(self):
+        """Known filings are skipped silently and counted"""
+        filings = list(lobbyists.parse_filings(util.testpath('filings.xml')))
+        con = lobbyists.create_db(sqlite3.connect(':memory:'))
+        known = lobbyists.FilingIDs()
+        lobbyists.import_filings(con.cursor(), filings, known)
+        self.failUnlessEqual(known.skipped, 0)
+        expected = util.dump_db(con)
+        lobbyists.import_filings(con.cursor(), filings + filings, known)
+        self.failUnlessEqual(known.skipped, 10)
+        self.failUnlessEqual(util.dump_db(con), expected)
+        self.failUnlessEqual(sys.stdout.getvalue(), '')
+
+    def test_load_known(self):
+        """load_db skips filings already in the database"""
+        dir = tempfile.mkdtemp()
+        try:
+            docs = [util.testpath('filings.xml'),
+                    util.testpath('lobbyists.xml')]
+            dbname = os.path.join(dir, 'known.db')
+            load_util.load_db(docs[:1], dbname, skip_known=True).close()
+            self.failUnlessEqual(load_util.skipped_filings(), 0)
+            con = load_util.load_db(docs, dbname, skip_known=True)
+            try:
+                actual = util.dump_db(con)
+            finally:
+                con.close()
+            self.failUnlessEqual(load_util.skipped_filings(), 5)
+            con = load_util.load_db(docs, os.path.join(dir, 'expected.db'))
+            try:
+                self.failUnlessEqual(actual, util.dump_db(con))
+            finally:
+                con.close()
+        finally:
+            shutil.rmtree(dir)
+        self.failUnlessEqual(sys.stdout.getvalue(), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
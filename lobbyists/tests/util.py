@@ -29,6 +29,28 @@ def testpath(basename):
         return os.path.join(os.path.dirname(__file__), 'data', basename)
 
 
+def data_files():
+    """Return the paths of all XML documents in the test data."""
+    datadir = os.path.dirname(testpath('ids.xml'))
+    return [testpath(x) for x in sorted(os.listdir(datadir))
+            if x.endswith('.xml')]
+
+
+def write_utf16(basename, path):
+    """Write a copy of a test document, re-encoded in UTF-16."""
+    f = open(testpath(basename), 'rb')
+    try:
+        data = f.read().decode('utf-8')
+    finally:
+        f.close()
+    f = open(path, 'wb')
+    try:
+        f.write((u'<?xml version="1.0" encoding="UTF-16"?>\n' +
+                 data).encode('utf-16'))
+    finally:
+        f.close()
+
+
 def flatten(lst):
     result = list()
     for x in lst:
@@ -39,6 +61,115 @@ def flatten(lst):
     return result
 
 
+class SyntheticDoc(object):
+    """A large, synthetic lobbyist database.
+
+    A file-like object whose contents are generated on demand, so
+    that arbitrarily large documents can be parsed without being held
+    in memory. Every filing has a unique ID, a registrant, a client and
+    a few lobbyists and issues.
+
+    """
+    _filing = ('<Filing ID="%08d-0000-0000-0000-000000000000" '
+               'Year="2008" Received="2008-03-24T14:29:41" Amount="40000" '
+               'Type="YEAR-END REPORT" Period="Year-End (July 1 - Dec 31)">'
+               '<Registrant Address="1012 14TH STREET NW" '
+               'RegistrantCountry="USA" RegistrantID="%d" '
+               'RegistrantName="Registrant %d" RegistrantPPBCountry="USA"/>'
+               '<Client ClientCountry="USA" ClientID="%d" '
+               'ClientName="Client %d" ClientPPBCountry="USA" '
+               'ClientState="IDAHO" ClientStatus="0" '
+               'ContactFullname="ERIC MASTEN" IsStateOrLocalGov="0"/>'
+               '<Lobbyists>'
+               '<Lobbyist LobbyistName="BOMBERG, NEIL" LobbyistStatus="0" '
+               'LobbyisteIndicator="0" OfficialPosition="N/A"/>'
+               '<Lobbyist LobbyistName="HARDY, J JOSEPH" LobbyistStatus="0" '
+               'LobbyisteIndicator="1" OfficialPosition="SEN. BOXER"/>'
+               '</Lobbyists>'
+               '<Issues>'
+               '<Issue Code="EDUCATION" SpecificIssue="Safe Schools %d"/>'
+               '<Issue Code="BUDGET/APPROPRIATIONS" SpecificIssue="Budget"/>'
+               '</Issues>'
+               '</Filing>\n')
+
+    def __init__(self, nfilings):
+        self._chunks = self._generate(nfilings)
+        self._buf = ''
+
+    def _generate(self, nfilings):
+        yield '<PublicFilings>\n'
+        for i in xrange(nfilings):
+            yield self._filing % ((i,) * 6)
+        yield '</PublicFilings>\n'
+
+    def read(self, size=-1):
+        if size < 0:
+            result = self._buf + ''.join(self._chunks)
+            self._buf = ''
+            return result
+        while len(self._buf) < size:
+            try:
+                self._buf += self._chunks.next()
+            except StopIteration:
+                break
+        result, self._buf = self._buf[:size], self._buf[size:]
+        return result
+
+
+def dump_db(con, sort=False):
+    """Return the contents of every table in the database.
+
+    con - The database connection.
+
+    sort - Optional. If true, each table's rows are sorted, rather
+    than in rowid order, so that databases whose rows were inserted in
+    a different order compare equal.
+
+    Returns a dictionary mapping each table's name to a list of its
+    rows.
+
+    """
+    cur = con.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                "ORDER BY name")
+    tables = [row[0] for row in cur.fetchall()]
+    result = dict()
+    for table in tables:
+        cur.execute('SELECT * FROM %s ORDER BY rowid' % table)
+        result[table] = cur.fetchall()
+        if sort:
+            result[table].sort()
+    return result
+
+
+class Crash(Exception):
+    """Raised by CountingImport to simulate a crash."""
+    pass
+
+
+class CountingImport(object):
+    """A stand-in for import_filings which counts the imported filings.
+
+    import_filings - The import function to wrap.
+
+    The number of filings imported so far is kept in the imported
+    attribute. If the crash_after attribute isn't None, Crash is
+    raised once more than that many filings have been imported.
+
+    """
+    def __init__(self, import_filings):
+        self.import_filings = import_filings
+        self.imported = 0
+        self.crash_after = None
+
+    def __call__(self, cur, filings, *args):
+        filings = list(filings)
+        self.imported += len(filings)
+        if self.crash_after is not None and self.imported > self.crash_after:
+            raise Crash()
+        return self.import_filings(cur, filings, *args)
+
+
 def doc_file_tests():
     """Return a sequence of non-Python files containing doctests."""
     try:
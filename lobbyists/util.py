@@ -21,17 +21,846 @@
 from . import lobbyists
 import sqlite3
 import os.path
+import collections
+import cPickle
+import Queue
+import sys
+import threading
+import time
+import hashlib
+import httplib
+import itertools
+import shutil
+import tempfile
+import urllib2
+import urlparse
+try:
+    import multiprocessing
+except ImportError:
+    # Python 2.5; load_db's jobs option is unavailable.
+    multiprocessing = None
 
 
-def load_db(docs, dbname, clobber=False, commit_per_doc=False):
+# Checkpoints and the manifest.
+#
+# When asked to, load_db records its progress through each document
+# in the load_checkpoint table, in the same transaction as the
+# filings it has imported: the number of filings loaded from the
+# document, the ID of the last one, and whether the document is
+# complete. Each document is identified by the name or URL given to
+# load_db (made absolute, for filenames), followed by ':' and the
+# member's name for files in a ZIP archive. A resumed load skips
+# complete documents, and skips the filings already loaded from a
+# partially loaded one; see lobbyists._parse_after.
+#
+# load_db can also record each document it has loaded in the
+# load_manifest table, identified by the same name or URL (ZIP
+# archives are recorded as a whole), along with its size, mtime,
+# SHA-1 hash, the number of filings it contains and when it was
+# loaded. Documents which are in the manifest and haven't changed
+# since are skipped. A document whose size and mtime match is
+# assumed to be unchanged; if only its size matches, its hash is
+# compared. Downloaded documents have no mtime in the manifest, so
+# they're always hashed.
+
+_checkpoint_table = """CREATE TABLE IF NOT EXISTS load_checkpoint(
+  document TEXT PRIMARY KEY,
+  filings INTEGER NOT NULL,
+  filing TEXT,
+  complete INTEGER NOT NULL,
+  updated TEXT NOT NULL
+)"""
+
+_manifest_table = """CREATE TABLE IF NOT EXISTS load_manifest(
+  document TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  mtime REAL,
+  hash TEXT NOT NULL,
+  filings INTEGER NOT NULL,
+  loaded TEXT NOT NULL
+)"""
+
+
+def _now():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _table_exists(con, name):
+    cur = con.cursor()
+    cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND "
+                "name=?", (name,))
+    return cur.fetchone() is not None
+
+
+class _Source(object):
+    """A document given to load_db, as recorded in the load_manifest table.
+
+    key - The document's name in the table.
+
+    path - The local filename of the document.
+
+    The 'filings' attribute counts the filings loaded from the
+    document.
+
+    """
+    def __init__(self, key, path):
+        self.key = key
+        self.path = path
+        st = os.stat(path)
+        self.size = st.st_size
+        if lobbyists._is_url(key):
+            self.mtime = None
+        else:
+            self.mtime = st.st_mtime
+        self.filings = 0
+        self._hash = None
+
+    def hash(self):
+        """The SHA-1 hash of the document's contents, in hex."""
+        if self._hash is None:
+            h = hashlib.sha1()
+            f = open(self.path, 'rb')
+            try:
+                for block in iter(lambda: f.read(2 ** 16), ''):
+                    h.update(block)
+            finally:
+                f.close()
+            self._hash = h.hexdigest()
+        return self._hash
+
+    def unchanged(self, entry):
+        """Return True if the document matches its manifest entry.
+
+        entry - A (size, mtime, hash) triple, or None if the document
+        isn't in the manifest.
+
+        """
+        if entry is None:
+            return False
+        size, mtime, hash = entry
+        if size != self.size:
+            return False
+        if mtime is not None and mtime == self.mtime:
+            return True
+        return hash == self.hash()
+
+
+class _Document(object):
+    """A document to be loaded by load_db.
+
+    key - The document's name in the load_checkpoint table.
+
+    doc - The local document, as returned by lobbyists.split_documents.
+
+    skip - The number of filings already loaded from the document.
+
+    last_id - The ID of the last filing already loaded, if any.
+
+    source - The _Source to which the document belongs, if load_db is
+    recording a manifest. Its 'last' attribute is True for the last
+    document to be loaded from the source.
+
+    download - The local filename of the downloaded document to which
+    the document belongs, if it was given by URL. It's removed once
+    the last document loaded from it has been imported.
+
+    """
+    def __init__(self, key, doc, skip=0, last_id=None, source=None,
+                 download=None):
+        self.key = key
+        self.doc = doc
+        self.skip = skip
+        self.last_id = last_id
+        self.source = source
+        self.download = download
+        self.last = True
+
+    def __str__(self):
+        return self.key
+
+
+def _document_key(doc):
+    if lobbyists._is_url(doc):
+        return doc
+    return os.path.abspath(doc)
+
+
+def _documents(keyed_docs, checkpoints, manifest):
+    """Split documents into _Documents, skipping loaded filings.
+
+    keyed_docs - A sequence of (key, local document) pairs.
+
+    checkpoints - The checkpoints from which to resume, as returned by
+    _read_checkpoints.
+
+    manifest - The manifest, as returned by _read_manifest, or None if
+    load_db isn't recording one. Documents which haven't changed
+    since they were recorded are skipped.
+
+    """
+    for key, doc in keyed_docs:
+        download = None
+        if lobbyists._is_url(key):
+            download = doc
+        source = None
+        if manifest is not None:
+            source = _Source(key, doc)
+            if source.unchanged(manifest.get(key)):
+                if download is not None:
+                    os.remove(download)
+                continue
+        documents = list()
+        for member in lobbyists.split_documents(doc):
+            if isinstance(member, lobbyists.ZipMember):
+                member_key = '%s:%s' % (key, member.name)
+            else:
+                member_key = key
+            if member_key not in checkpoints:
+                documents.append(_Document(member_key, member,
+                                           source=source))
+                continue
+            filings, last_id, complete = checkpoints[member_key]
+            if not complete:
+                documents.append(_Document(member_key, member, filings,
+                                           last_id, source))
+        if not documents:
+            if download is not None:
+                os.remove(download)
+            continue
+        for document in documents[:-1]:
+            document.last = False
+        documents[-1].download = download
+        for document in documents:
+            yield document
+
+
+def _parse_document(document, backend):
+    """Parse the filings in a _Document which haven't been loaded."""
+    if document.skip:
+        return lobbyists._parse_after(document.doc, document.skip,
+                                      document.last_id, backend)
+    return lobbyists.parse_filings(document.doc, backend)
+
+
+def _read_checkpoints(con):
+    """Read the load_checkpoint table.
+
+    Returns a dictionary mapping each document's key to a (filings,
+    last filing ID, complete) triple. The dictionary is empty if the
+    table doesn't exist.
+
+    """
+    if not _table_exists(con, 'load_checkpoint'):
+        return dict()
+    cur = con.cursor()
+    cur.execute('SELECT document, filings, filing, complete '
+                'FROM load_checkpoint')
+    return dict((row[0], (row[1], row[2], bool(row[3])))
+                for row in cur.fetchall())
+
+
+def _read_manifest(con):
+    """Read the load_manifest table.
+
+    Returns a dictionary mapping each document's key to a (size,
+    mtime, hash) triple. The dictionary is empty if the table doesn't
+    exist.
+
+    """
+    if not _table_exists(con, 'load_manifest'):
+        return dict()
+    cur = con.cursor()
+    cur.execute('SELECT document, size, mtime, hash FROM load_manifest')
+    return dict((row[0], row[1:]) for row in cur.fetchall())
+
+
+def _commit(con):
+    """Commit load_db's transaction and begin the next one.
+
+    load_db sets the connection's isolation_level to None, so that
+    import_filings can import each filing inside a savepoint, and
+    manages its transactions itself.
+
+    """
+    con.commit()
+    con.execute('BEGIN')
+
+
+class _Progress(object):
+    """Records load_db's progress in the load_checkpoint and
+    load_manifest tables.
+
+    con - The database connection.
+
+    every - Commit and record a checkpoint after importing at least
+    this many filings from a document. If None, no checkpoints are
+    recorded.
+
+    manifest - If True, record each document in the manifest once
+    it's loaded.
+
+    The importer calls start before importing each document, imported
+    after each batch of its filings, and end after the last. end also
+    removes the document's download, if it's the last document loaded
+    from it.
+
+    """
+    def __init__(self, con, every, manifest):
+        self.con = con
+        self.every = every
+        self._cur = con.cursor()
+        if every is not None:
+            self._cur.execute(_checkpoint_table)
+        if manifest:
+            self._cur.execute(_manifest_table)
+
+    def start(self, document):
+        self.document = document
+        self.filings = document.skip
+        self.last_id = document.last_id
+        self.pending = 0
+        if document.source is not None:
+            document.source.filings += document.skip
+
+    def imported(self, batch):
+        if not batch:
+            return
+        if self.document.source is not None:
+            self.document.source.filings += len(batch)
+        if self.every is None:
+            return
+        self.filings += len(batch)
+        self.last_id = lobbyists._filing_id(batch[-1])
+        self.pending += len(batch)
+        if self.pending >= self.every:
+            self._checkpoint(False)
+            _commit(self.con)
+            self.pending = 0
+
+    def end(self):
+        if self.every is not None:
+            self._checkpoint(True)
+        source = self.document.source
+        if source is not None and self.document.last:
+            self._cur.execute('INSERT OR REPLACE INTO load_manifest VALUES '
+                              '(?, ?, ?, ?, ?, ?)',
+                              (source.key, source.size, source.mtime,
+                               source.hash(), source.filings, _now()))
+        if self.document.download is not None:
+            os.remove(self.document.download)
+
+    def _checkpoint(self, complete):
+        self._cur.execute('INSERT OR REPLACE INTO load_checkpoint VALUES '
+                          '(?, ?, ?, ?, ?)',
+                          (self.document.key, self.filings, self.last_id,
+                           int(complete), _now()))
+
+
+# Parallel document parsing for load_db.
+#
+# Each document is parsed by a worker process, which sends the parsed
+# filings back to the loading process in batches over a bounded
+# queue. The loading process is the only writer: it imports the
+# documents strictly in the order given, and each document's filings
+# in document order, so the database (including rowids) is identical
+# to the one produced by a sequential load. Workers for the next few
+# documents parse concurrently with the import of the current one,
+# but block once their queues are full, so memory use is bounded.
+
+# The number of filings per batch, and the maximum number of batches
+# waiting in each worker's queue.
+
+_batch_size = 500
+_queue_size = 4
+
+
+def _parse_worker(document, backend, queue):
+    """Parse a _Document and send its filings to queue, in batches.
+
+    Runs in a worker process. Each message is a pair: ('filings', a
+    list of parsed filings); ('done', None) after the last batch; or
+    ('error', exception) if parsing fails. Exceptions which can't be
+    pickled, such as the SAXParseExceptions raised by the pulldom
+    backend, are sent as a RuntimeError with the same message.
+
+    """
+    try:
+        for batch in lobbyists._batches(_parse_document(document, backend),
+                                        _batch_size):
+            queue.put(('filings', batch))
+        queue.put(('done', None))
+    except Exception, e:
+        try:
+            cPickle.loads(cPickle.dumps(e, cPickle.HIGHEST_PROTOCOL))
+        except Exception:
+            e = RuntimeError('%s: %s: %s' % (document.doc,
+                                             e.__class__.__name__, e))
+        queue.put(('error', e))
+
+
+def _queued_filings(queue, worker):
+    """Yield the filings sent by a _parse_worker over queue.
+
+    Raises RuntimeError if the worker process exits without sending
+    all of its filings.
+
+    """
+    while True:
+        try:
+            kind, value = queue.get(True, 1)
+        except Queue.Empty:
+            if worker.is_alive():
+                continue
+            # The worker may have sent its last message just before
+            # exiting.
+            try:
+                kind, value = queue.get(True, 1)
+            except Queue.Empty:
+                raise RuntimeError('worker process exited with code %s' %
+                                   worker.exitcode)
+        if kind == 'filings':
+            for filing in value:
+                yield filing
+        elif kind == 'done':
+            return
+        else:
+            raise value
+
+
+def _parsed_docs(docs, backend, jobs):
+    """Parse a sequence of documents, possibly in parallel.
+
+    docs - A sequence of _Documents.
+
+    backend - The name of the parser backend to use.
+
+    jobs - The number of worker processes which parse documents
+    concurrently. If None or 1, documents are parsed in the calling
+    process, one at a time.
+
+    Yields a (document, filings) pair per document, in the order given,
+    where filings is an iterator over the document's parsed
+    filings. Each document's filings must be consumed before moving
+    on to the next.
+
+    """
+    if not jobs or jobs == 1:
+        for doc in docs:
+            yield (doc, _parse_document(doc, backend))
+        return
+    if multiprocessing is None:
+        raise ImportError('parallel loading requires the '
+                          'multiprocessing module')
+    docs = iter(docs)
+    running = collections.deque()
+
+    def start_next():
+        for doc in docs:
+            queue = multiprocessing.Queue(_queue_size)
+            worker = multiprocessing.Process(target=_parse_worker,
+                                             args=(doc, backend, queue))
+            worker.daemon = True
+            worker.start()
+            running.append((doc, worker, queue))
+            return
+
+    try:
+        for i in xrange(jobs):
+            start_next()
+        while running:
+            doc, worker, queue = running[0]
+            yield (doc, _queued_filings(queue, worker))
+            worker.join()
+            running.popleft()
+            start_next()
+    finally:
+        for doc, worker, queue in running:
+            worker.terminate()
+
+
+# Pipelined loading.
+#
+# In pipelined mode, load_db parses documents in a separate thread,
+# which passes batches of parsed filings to the importing thread over
+# a bounded queue, so that parsing overlaps with importing. sqlite3
+# releases the GIL while it executes each statement, which is where
+# the importer spends most of its time. The pipeline keeps counts of
+# how long each side spends waiting for the other, which show whether
+# parsing or importing is the bottleneck.
+
+# The number of filings per batch, and the maximum number of batches
+# in the queue.
+
+_pipeline_batch_size = 100
+_pipeline_depth = 16
+
+_last_pipeline_stats = None
+_last_skipped = None
+_last_entity_cache_stats = None
+
+
+class _Pipeline(object):
+    """A parser thread which feeds parsed filings into a bounded queue.
+
+    Each item in the queue is a pair: ('start', document) before each
+    document's first filing; ('filings', a list of parsed filings);
+    ('end', document) after each document's last filing; ('done',
+    None) after the last document; or ('error', exc_info) if parsing
+    fails.
+
+    docs, backend, jobs - See load_db.
+
+    """
+    def __init__(self, docs, backend, jobs):
+        self.queue = Queue.Queue(_pipeline_depth)
+        self.parser_stall = 0.0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._parse,
+                                        args=(docs, backend, jobs))
+        self._thread.setDaemon(True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop the parser thread and wait for it to exit."""
+        self._stopped = True
+        # Unblock the parser thread if it's waiting for room in the
+        # queue.
+        while self._thread.isAlive():
+            try:
+                self.queue.get(True, 0.1)
+            except Queue.Empty:
+                pass
+
+    def _put(self, item):
+        start = time.time()
+        self.queue.put(item)
+        self.parser_stall += time.time() - start
+
+    def _parse(self, docs, backend, jobs):
+        try:
+            parsed = _parsed_docs(docs, backend, jobs)
+            try:
+                for doc, filings in parsed:
+                    self._put(('start', doc))
+                    for batch in lobbyists._batches(filings,
+                                                    _pipeline_batch_size):
+                        if self._stopped:
+                            return
+                        self._put(('filings', batch))
+                    self._put(('end', doc))
+            finally:
+                parsed.close()
+            self._put(('done', None))
+        except:
+            self._put(('error', sys.exc_info()))
+
+
+def _pipelined_import(con, docs, backend, jobs, commit_per_doc, progress,
+                      import_batch):
+    """Import documents into the database through a _Pipeline.
+
+    import_batch - Called with a cursor and each batch of filings.
+
+    Returns the pipeline's statistics; see pipeline_stats.
+
+    """
+    start = time.time()
+    pipeline = _Pipeline(docs, backend, jobs)
+    queue = pipeline.queue
+    filings = 0
+    batches = 0
+    depth = 0
+    max_depth = 0
+    importer_stall = 0.0
+    cur = con.cursor()
+    pipeline.start()
+    try:
+        while True:
+            qsize = queue.qsize()
+            wait = time.time()
+            kind, value = queue.get()
+            importer_stall += time.time() - wait
+            if kind == 'filings':
+                batches += 1
+                depth += qsize
+                max_depth = max(max_depth, qsize)
+                filings += len(value)
+                import_batch(cur, value)
+                progress.imported(value)
+            elif kind == 'start':
+                progress.start(value)
+            elif kind == 'end':
+                progress.end()
+                if commit_per_doc:
+                    _commit(con)
+            elif kind == 'done':
+                break
+            else:
+                raise value[0], value[1], value[2]
+    finally:
+        pipeline.stop()
+    elapsed = time.time() - start
+    return {'filings': filings,
+            'batches': batches,
+            'elapsed': elapsed,
+            'throughput': elapsed and filings / elapsed,
+            'max_depth': max_depth,
+            'mean_depth': batches and float(depth) / batches,
+            'parser_stall': pipeline.parser_stall,
+            'importer_stall': importer_stall}
+
+
+def pipeline_stats():
+    """Return statistics for the last pipelined load_db call.
+
+    Returns None if load_db hasn't been called with pipeline=True in
+    this process. Otherwise, returns a dictionary with the following
+    keys: 'filings' and 'batches', the number of filings and batches
+    of filings passed from the parser thread to the importer;
+    'elapsed', the total time taken (in seconds); 'throughput', the
+    number of filings loaded per second; 'max_depth' and
+    'mean_depth', the maximum and mean number of batches waiting in
+    the queue when the importer took a batch; 'parser_stall', the
+    time the parser thread spent waiting for room in the queue; and
+    'importer_stall', the time the importer spent waiting for parsed
+    filings. A large parser stall means importing is the bottleneck,
+    and a large importer stall means parsing is.
+
+    """
+    if _last_pipeline_stats is None:
+        return None
+    return dict(_last_pipeline_stats)
+
+
+def skipped_filings():
+    """Return the number of filings skipped by the last load_db call.
+
+    Returns None if load_db hasn't been called with skip_known=True in
+    this process. Otherwise, returns the number of filings which were
+    skipped because their IDs were already in the database.
+
+    """
+    return _last_skipped
+
+
+def entity_cache_stats():
+    """Return statistics for the last load_db call's entity cache.
+
+    load_db caches the rowids of the clients, registrants, lobbyists,
+    affiliated orgs and foreign entities it imports, and the lookup
+    table values it inserts; see lobbyists.EntityCache. Returns None
+    if load_db hasn't been called in this process. Otherwise, returns
+    a dictionary with the following keys: 'size', the number of
+    entities cached when the load finished; 'hits' and 'misses', the
+    number of entity lookups which were and weren't answered by the
+    cache; 'evictions', the number of entities evicted from the cache
+    when it was full;
+    'values', the number of lookup table values (countries, orgs,
+    etc.) known to be in the database; and 'value_hits' and
+    'value_misses', the number of lookup table insertions which were
+    and weren't skipped because their values were known.
+
+    """
+    if _last_entity_cache_stats is None:
+        return None
+    return dict(_last_entity_cache_stats)
+
+
+# Fetching remote documents.
+#
+# load_db downloads documents identified by URLs into a temporary
+# directory before parsing them, so that ZIP archives (which must be
+# seekable) and gzipped documents can be read. Several documents are
+# downloaded concurrently, each by its own thread, while earlier
+# documents are parsed and imported. Each downloaded document is
+# removed as soon as it has been imported, so the directory only
+# holds the documents being downloaded, parsed and imported (which,
+# with pipeline=True, includes any queued ahead of the importer).
+# Failed downloads are retried, except for HTTP client errors (such
+# as 404 Not Found), which won't succeed on a second attempt.
+
+# The socket timeout for downloads, in seconds, and the delay before
+# the first retry of a failed download, in seconds, which doubles
+# with each subsequent retry.
+
+_fetch_timeout = 60
+_fetch_retry_delay = 1.0
+
+
+def _urlopen(url):
+    """Open a URL, with a timeout if it's supported.
+
+    urllib2.urlopen only takes a timeout in Python 2.6 and later, so
+    Python 2.5 uses the default socket timeout.
+
+    """
+    if sys.version_info < (2, 6):
+        return urllib2.urlopen(url)
+    return urllib2.urlopen(url, timeout=_fetch_timeout)
+
+
+class _Download(threading.Thread):
+    """A thread which downloads a document to a local file.
+
+    url - The document's URL.
+
+    path - The filename to which the document is written.
+
+    retries - The number of times to retry a failed download.
+
+    """
+    def __init__(self, url, path, retries):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.url = url
+        self.path = path
+        self.retries = retries
+        self.exc_info = None
+
+    def _fetch(self):
+        response = _urlopen(self.url)
+        try:
+            out = open(self.path, 'wb')
+            try:
+                shutil.copyfileobj(response, out, 2 ** 16)
+                size = out.tell()
+            finally:
+                out.close()
+            length = response.info().getheader('Content-Length')
+            if length is not None and int(length) != size:
+                raise IOError('incomplete download of %s: got %d of %s '
+                              'bytes' % (self.url, size, length))
+        finally:
+            response.close()
+
+    def run(self):
+        for attempt in xrange(self.retries + 1):
+            if attempt:
+                time.sleep(_fetch_retry_delay * 2 ** (attempt - 1))
+            try:
+                self._fetch()
+                self.exc_info = None
+                return
+            except urllib2.HTTPError, e:
+                self.exc_info = sys.exc_info()
+                if e.code < 500:
+                    return
+            except (IOError, httplib.HTTPException):
+                self.exc_info = sys.exc_info()
+
+    def result(self):
+        """Wait for the download to finish.
+
+        Returns the local filename, or raises the exception which
+        caused the last attempt to fail.
+
+        """
+        self.join()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.path
+
+
+def fetch_documents(docs, dir, concurrency=4, retries=2):
+    """Download remote documents concurrently.
+
+    docs - A sequence of documents. Those which are http, https or ftp
+    URLs are downloaded; the rest are passed through unchanged.
+
+    dir - The directory in which to store downloaded documents. The
+    caller is responsible for removing them.
+
+    concurrency - The maximum number of documents downloaded at once.
+    Downloads run ahead of the document currently being consumed by
+    at most this many documents.
+
+    retries - The number of times a failed download is retried, with
+    an exponentially increasing delay between attempts. HTTP client
+    errors (4xx responses) aren't retried.
+
+    Yields the local filename of each document, in the order given,
+    as soon as it's available. Raises the exception which caused a
+    download to fail when that document is reached.
+
+    """
+    docs = enumerate(docs)
+    pending = collections.deque()
+
+    def fill():
+        # Start downloads until concurrency documents are downloading,
+        # or there are no more documents.
+        downloading = len([x for x in pending if isinstance(x, _Download)])
+        while downloading < concurrency:
+            try:
+                i, doc = docs.next()
+            except StopIteration:
+                return
+            if lobbyists._is_url(doc):
+                # Keep the URL's basename, so that archives are still
+                # recognized by their extensions.
+                name = os.path.basename(urlparse.urlsplit(doc)[2])
+                download = _Download(doc,
+                                     os.path.join(dir, '%05d-%s' % (i, name)),
+                                     retries)
+                download.start()
+                pending.append(download)
+                downloading += 1
+            else:
+                pending.append(doc)
+
+    fill()
+    while pending:
+        item = pending.popleft()
+        if isinstance(item, _Download):
+            item = item.result()
+        fill()
+        yield item
+
+
+def _import_docs(con, docs, backend, jobs, commit_per_doc, progress,
+                 import_batch):
+    """Parse documents and import them into the database in turn.
+
+    import_batch - Called with a cursor and each batch of filings.
+
+    """
+    parsed = _parsed_docs(docs, backend, jobs)
+    try:
+        for doc, filings in parsed:
+            progress.start(doc)
+            for batch in lobbyists._batches(filings,
+                                            progress.every or _batch_size):
+                import_batch(con.cursor(), batch)
+                progress.imported(batch)
+            progress.end()
+            if commit_per_doc:
+                _commit(con)
+    finally:
+        # Stop any workers still parsing if the import fails.
+        parsed.close()
+
+
+def load_db(docs, dbname, clobber=False, commit_per_doc=False,
+            backend='pulldom', jobs=None, pipeline=False,
+            fetch_concurrency=4, retries=2, checkpoint=None, resume=False,
+            manifest=False, skip_known=False,
+            write_batch=lobbyists._write_batch_size, bulk=False):
     """Load filing records from lobbyist documents into an sqlite3 database.
 
     Parses and imports filing records from one or more Senate
     LD-1/LD-2 XML documents into an sqlite3 database. Records are
     parsed and imported one at a time.
 
-    docs - A sequence of URLs or filenames identifying the LD-1/LD-2
-    XML documents load load.
+    docs - A sequence of filenames or URLs identifying the LD-1/LD-2
+    XML documents to load. Documents whose names end in '.gz' are
+    decompressed as they're parsed. ZIP archives (ending in '.zip')
+    are read directly, without extracting them to disk, and each file
+    in the archive is loaded as a separate document. Documents
+    identified by http, https or ftp URLs are downloaded to a
+    temporary directory. Each one is removed as soon as it has been
+    loaded, and the directory is removed when load_db returns.
 
     dbname - The filename of the sqlite3 database to load. If the
     database doesn't exist, load_db creates it.
@@ -45,6 +874,79 @@ def load_db(docs, dbname, clobber=False, commit_per_doc=False):
     loaded. Per-document committing ensures that successfully loaded
     documents are committed to the database in case of parsing or
     importing errors in subsequent documents, but is slower.
+    Either way, each filing is imported inside its own savepoint, so a
+    filing which can't be imported completely leaves nothing behind.
+    The rowids of imported entities are cached as they're loaded; see
+    entity_cache_stats.
+
+    backend - The name of the parser backend to use. See
+    lobbyists.parse_filings.
+
+    jobs - The number of worker processes used to parse documents
+    concurrently. If None (the default) or 1, documents are parsed
+    and imported one after another in this process. Otherwise, up to
+    jobs documents are parsed at once by worker processes, while this
+    process imports them into the database in the order given. The
+    resulting database is identical either way. Parallel loading
+    raises ImportError if the multiprocessing module isn't available
+    (as in Python 2.5).
+
+    pipeline - If True, documents are parsed in a separate thread,
+    which passes the parsed filings to this thread for importing over
+    a bounded queue. Parsing and importing then overlap, rather than
+    alternating. The resulting database is identical, and
+    pipeline_stats reports the time each side spent waiting for the
+    other. This can be combined with jobs.
+
+    fetch_concurrency - The maximum number of documents downloaded
+    concurrently, while earlier documents are parsed and imported.
+
+    retries - The number of times a failed download is retried. See
+    fetch_documents.
+
+    checkpoint - If not None, load_db commits after importing every
+    checkpoint filings from a document, and records its progress
+    through the document in the load_checkpoint table in the same
+    transaction. The completion of each document is recorded too.
+
+    resume - If True, load_db resumes an earlier load which recorded
+    checkpoints but didn't finish. Documents which were completely
+    loaded are skipped (without downloading them), and loading a
+    partially loaded document begins with the first filing after its
+    last checkpoint. For uncompressed files, the skipped filings
+    aren't parsed. Raises ValueError if a partially loaded document
+    has changed since its checkpoint. Pass checkpoint as well to keep
+    recording checkpoints as the load continues.
+
+    manifest - If True, load_db records each document it loads in the
+    load_manifest table, with its size, mtime, SHA-1 hash and number
+    of filings, and skips documents which are already in the manifest
+    and haven't changed since. A document whose size and mtime are
+    unchanged isn't read at all. Documents given by URL are still
+    downloaded, but are skipped if their hash is unchanged. A ZIP
+    archive is recorded once all of its files are loaded.
+
+    skip_known - If True, load_db reads the IDs of the filings already
+    in the database before loading, and skips any filing whose ID it
+    has seen before any SQL is executed for it, rather than failing
+    to import it and printing a warning. skipped_filings reports how
+    many were skipped. See lobbyists.FilingIDs.
+
+    write_batch - The number of filings whose rows in the tables
+    which link filings to their sub-elements are buffered and written
+    together with executemany (the default is 100). If 0 or None,
+    each row is written as soon as it's imported. The resulting
+    database is identical either way. See lobbyists.import_filings.
+
+    bulk - If True, the database must be new (or clobbered), and it's
+    loaded in two phases by a lobbyists.BulkLoader: every filing is
+    staged first, and the entities are resolved with set-based SQL
+    once all of the documents have been staged. The entity tables'
+    unique indexes are only built once those tables are filled (see
+    lobbyists.create_indexes). The resulting database is identical,
+    but a filing which can't be imported fails the whole load, and
+    nothing is committed until it's done. Raises ValueError if
+    combined with commit_per_doc, checkpoint, resume or skip_known.
 
     This function has the side-effect of creating and/or modifying the
     database.
@@ -52,16 +954,79 @@ def load_db(docs, dbname, clobber=False, commit_per_doc=False):
     Returns the database's sqlite3.Connection object.
 
     """
+    global _last_pipeline_stats, _last_skipped, _last_entity_cache_stats
+    if bulk and (commit_per_doc or checkpoint is not None or resume or
+                 skip_known):
+        raise ValueError('bulk loads can\'t be committed per document, '
+                         'checkpointed, resumed or skip known filings')
     create_db = clobber or not os.path.exists(dbname)
+    if bulk and not create_db:
+        raise ValueError('bulk loads require a new database')
     con = sqlite3.connect(dbname)
     if create_db:
-        lobbyists.create_db(con)
+        lobbyists.create_db(con, not bulk)
+    else:
+        lobbyists.upgrade_db(con)
+        # In case an earlier bulk load failed before creating them.
+        lobbyists.create_indexes(con)
+    checkpoints = dict()
+    if resume:
+        checkpoints = _read_checkpoints(con)
+    keys = list()
+    remote_docs = list()
     for doc in docs:
-        lobbyists.import_filings(con.cursor(), lobbyists.parse_filings(doc))
-        if commit_per_doc:
-            con.commit()
-    if not commit_per_doc:
-        con.commit()
+        key = _document_key(doc)
+        if key in checkpoints and checkpoints[key][2]:
+            continue
+        keys.append(key)
+        remote_docs.append(doc)
+    entries = None
+    if manifest:
+        entries = _read_manifest(con)
+    isolation_level = con.isolation_level
+    con.isolation_level = None
+    con.execute('BEGIN')
+    progress = _Progress(con, checkpoint, manifest)
+    known = None
+    if skip_known:
+        known = lobbyists.FilingIDs(con.cursor())
+    cache = lobbyists.EntityCache()
+    if bulk:
+        loader = lobbyists.BulkLoader(con.cursor())
+        def import_batch(cur, batch):
+            loader.stage(batch)
+    else:
+        def import_batch(cur, batch):
+            # The database was upgraded above, if necessary.
+            lobbyists.import_filings(cur, batch, known, cache, write_batch,
+                                     False)
+    fetch_dir = tempfile.mkdtemp(prefix='lobbyists-')
+    try:
+        local_docs = fetch_documents(remote_docs, fetch_dir,
+                                     fetch_concurrency, retries)
+        docs = _documents(itertools.izip(keys, local_docs), checkpoints,
+                          entries)
+        if pipeline:
+            _last_pipeline_stats = _pipelined_import(con, docs, backend,
+                                                     jobs, commit_per_doc,
+                                                     progress, import_batch)
+        else:
+            _import_docs(con, docs, backend, jobs, commit_per_doc,
+                         progress, import_batch)
+        if bulk:
+            loader.finish()
+    except:
+        # Roll back the uncommitted filings now, rather than when the
+        # connection is collected, so that the load can be resumed.
+        con.close()
+        raise
+    finally:
+        shutil.rmtree(fetch_dir, True)
+    con.commit()
+    con.isolation_level = isolation_level
+    if known is not None:
+        _last_skipped = known.skipped
+    _last_entity_cache_stats = cache.stats()
     return con
 
 
@@ -82,7 +1047,11 @@ Parse one or more Senate LD-1/LD-2 XML documents and load them into an
 sqlite3 database.
 
 Each document may be identified either by a URL or a file, so long as
-it's a valid Senate LD-1/LD-2 XML document.
+it's a valid Senate LD-1/LD-2 XML document. Documents may be
+compressed with gzip (doc.xml.gz), or stored in the ZIP archives
+(doc.zip) in which the Senate distributes them; each file in a ZIP
+archive is loaded as a separate document. Documents identified by URLs
+are downloaded concurrently while earlier documents are loaded.
 
 If db doesn't exist, %prog will create it prior to loading the first
 document."""
@@ -97,10 +1066,136 @@ document."""
                       help='commit changes to the database after importing ' \
                           'each document (default is to commit only after ' \
                           'all documents are imported)')
+    parser.add_option('-b', '--backend', action='store',
+                      dest='backend', default='pulldom',
+                      help='parser backend to use, e.g., "etree" ' \
+                          '(default is "pulldom")')
+    parser.add_option('-j', '--jobs', action='store', type='int',
+                      dest='jobs',
+                      help='parse up to JOBS documents concurrently in ' \
+                          'worker processes (default is to parse them one ' \
+                          'at a time)')
+    parser.add_option('-f', '--fetch-concurrency', action='store',
+                      type='int', dest='fetch_concurrency', default=4,
+                      help='download up to N documents given by URL ' \
+                          'concurrently (default is 4)', metavar='N')
+    parser.add_option('-r', '--retries', action='store', type='int',
+                      dest='retries', default=2,
+                      help='retry failed downloads up to N times ' \
+                          '(default is 2)', metavar='N')
+    parser.add_option('-p', '--pipeline', action='store_true',
+                      dest='pipeline',
+                      help='parse in a separate thread, overlapping ' \
+                          'parsing with importing, and print the ' \
+                          'pipeline\'s statistics when done')
+    parser.add_option('-k', '--checkpoint', action='store', type='int',
+                      dest='checkpoint', metavar='N',
+                      help='commit and record a checkpoint after every N ' \
+                          'filings imported from a document')
+    parser.add_option('-R', '--resume', action='store_true',
+                      dest='resume',
+                      help='resume an interrupted load from its last ' \
+                          'checkpoints, skipping the documents and ' \
+                          'filings which it loaded')
+    parser.add_option('-m', '--manifest', action='store_true',
+                      dest='manifest',
+                      help='record each loaded document in the database, ' \
+                          'and skip documents which were loaded before ' \
+                          'and haven\'t changed since')
+    parser.add_option('-s', '--skip-known', action='store_true',
+                      dest='skip_known',
+                      help='skip filings whose IDs are already in the ' \
+                          'database, and print how many were skipped')
+    parser.add_option('-w', '--write-batch', action='store', type='int',
+                      dest='write_batch',
+                      default=lobbyists._write_batch_size,
+                      metavar='N',
+                      help='buffer the link table rows of up to N ' \
+                          'filings and write them together; 0 writes each ' \
+                          'row immediately (default is %default)')
+    parser.add_option('-B', '--bulk', action='store_true',
+                      dest='bulk',
+                      help='stage every filing, then resolve entities ' \
+                          'with set-based SQL; only for new or ' \
+                          'clobbered databases')
     (options, args) = parser.parse_args(argv[1:])
     if len(args) < 2:
         parser.error('specify exactly one sqlite3 database and at least one ' \
                          'XML document')
-    con = load_db(args[1:], args[0], options.clobber, options.commit)
+    con = load_db(args[1:], args[0], options.clobber, options.commit,
+                  options.backend, options.jobs, options.pipeline,
+                  options.fetch_concurrency, options.retries,
+                  options.checkpoint, options.resume, options.manifest,
+                  options.skip_known, options.write_batch, options.bulk)
     con.close()
+    if options.skip_known:
+        print 'Skipped %d filings already in the database' % \
+            skipped_filings()
+    stats = lobbyists.duplicate_stats()
+    if stats['identical'] or stats['conflicting']:
+        print 'Duplicate filings: %(identical)d identical, ' \
+            '%(conflicting)d conflicting' % stats
+    if options.pipeline:
+        stats = pipeline_stats()
+        print 'Pipeline: %(filings)d filings in %(elapsed).2fs ' \
+            '(%(throughput).0f filings/s)' % stats
+        print 'Queue depth: max %(max_depth)d, mean %(mean_depth).1f ' \
+            'batches' % stats
+        print 'Stalls: parser %(parser_stall).2fs, ' \
+            'importer %(importer_stall).2fs' % stats
+    return 0
+
+
+def index_main(argv=None):
+    """Run the lobbyists-index script directly from Python.
+
+    Note that argv[0] is the program name.
+
+    """
+    import optparse
+    import pprint
+    import sys
+
+    if argv is None:
+        argv = sys.argv
+    usage = """%prog [OPTIONS] doc.xml ...
+
+Write a sidecar index for one or more Senate LD-1/LD-2 XML documents,
+mapping each filing's ID to its location in the document. The index
+for doc.xml is written to doc.xml.idx.
+
+With --show, print the given filings instead, using each document's
+existing index (which is written first if it doesn't exist). IDs which
+aren't in any of the documents are reported, and the exit status is
+then 1."""
+    parser = optparse.OptionParser(usage=usage,
+                                   version=lobbyists.VERSION)
+    parser.add_option('-s', '--show', action='append',
+                      dest='ids', metavar='ID',
+                      help='print the filing with this ID; may be given ' \
+                          'more than once')
+    parser.add_option('-b', '--backend', action='store',
+                      dest='backend', default='pulldom',
+                      help='parser backend to use with --show, e.g., ' \
+                          '"etree" (default is "pulldom")')
+    (options, args) = parser.parse_args(argv[1:])
+    if len(args) < 1:
+        parser.error('specify at least one XML document')
+    found = set()
+    for doc in args:
+        if options.ids is None:
+            lobbyists.index_filings(doc)
+            continue
+        if not os.path.exists(doc + '.idx'):
+            lobbyists.index_filings(doc)
+        entries = lobbyists.read_filing_index(doc)
+        ids = [id for id in options.ids if id in entries]
+        found.update(ids)
+        for filing in lobbyists.get_filings(doc, ids, options.backend):
+            pprint.pprint(filing)
+    missing = [id for id in options.ids or [] if id not in found]
+    for id in missing:
+        print >> sys.stderr, 'Filing %s not found' % id
+    if missing:
+        return 1
     return 0
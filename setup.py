@@ -15,6 +15,7 @@ setup(
     package_data = { 'lobbyists' : ['lobbyists.sql'] },
     entry_points = {
         'console_scripts': ['lobbyists-load = lobbyists.util:load_main',
+                            'lobbyists-index = lobbyists.util:index_main',
                             'lobbyists-benchmark = lobbyists.benchmark:main']
         },
     